@@ -33,18 +33,77 @@ is annoying but unavoidable behaviour
  <class 'AtomicInt'>
 
 is the correct form for this.
+
+Each operator above takes the lock once, but the arithmetic ones return a new AtomicInt. Where only the resulting int is
+wanted the fetch and op methods update in place and return a plain int instead
+
+    a = AtomicInt(5)
+    a.fetch_add(2)
+    5
+    a.add_and_get(2)
+    9
+    a.compare_and_set(9, 0)
+    True
+
+AtomicInt(reentrant=False) uses a plain Lock rather than an RLock, which is cheaper to acquire.
+
+For counters that are updated from many threads and read rarely, StripedAdder spreads the updates over several
+independently locked cells so the threads don't all queue on a single lock, at the cost of reads having to sum them
+
+    requests = StripedAdder()
+    requests.increment()
+    requests.add(5)
+    requests.sum()
+    6
+
+For a large number of counters, the buckets of a histogram for example, AtomicCounterArray keeps them in a single
+typed array guarded by a fixed set of striped locks rather than one AtomicInt, and lock, per counter
+
+    latency_buckets = AtomicCounterArray(10000)
+    latency_buckets.add(42)
+    latency_buckets.add_many([1, 2, 2, 3])
+    latency_buckets.snapshot()
+    array('l', [0, 1, 2, 1, ...])
+
+Updates that span several AtomicInts can be made atomic with a transaction, which takes their locks in a consistent
+order so two transactions over the same counters can't deadlock however their arguments are ordered
+
+    with transaction(source, dest) as tx:
+        if tx.get(source) >= amount:
+            tx.add(source, -amount)
+            tx.add(dest, amount)
+
+or optimistically with atomically, which computes the new values without holding any locks and only takes them to
+check nothing changed in the meantime and write the result, retrying if something did
+
+    atomically([source, dest], lambda s, d: (s - amount, d + amount))
 """
 
+import array
+import itertools
 import threading
 
+# Widest signed array type available, 'q' only exists from python 3.3
+try:
+    array.array('q')
+    COUNTER_TYPECODE = 'q'
+except ValueError:
+    COUNTER_TYPECODE = 'l'
+
+# Set by metrics.enable() to wrap the lock of each new AtomicInt, so time spent waiting for it can be measured
+lock_wrapper = None
+
 class AtomicInt(object):
-    def __init__(self, value=0):
+    def __init__(self, value=0, reentrant=True):
         self._value = value
-        self._lock = threading.RLock()
+        self._lock = threading.RLock() if reentrant else threading.Lock()
+        if lock_wrapper is not None:
+            self._lock = lock_wrapper(self._lock)
 
     def _check_and_return_other_value(self, b):
+        # Always called with self._lock held, so read our own value directly in case the lock isn't reentrant
         if isinstance(b, AtomicInt):
-            return self.value if self is b else b.value
+            return self._value if self is b else b.value
         elif isinstance(b, (int, long)):
             return b
         else:
@@ -60,6 +119,46 @@ class AtomicInt(object):
         with self._lock:
             self._value = new_value
 
+    def fetch_add(self, delta):
+        """ Add delta, returning the previous value """
+        with self._lock:
+            previous = self._value
+            self._value += self._check_and_return_other_value(delta)
+            return previous
+
+    def add_and_get(self, delta):
+        """ Add delta, returning the new value """
+        with self._lock:
+            self._value += self._check_and_return_other_value(delta)
+            return self._value
+
+    def get_and_set(self, new_value):
+        """ Replace the value, returning the previous one """
+        with self._lock:
+            previous = self._value
+            self._value = self._check_and_return_other_value(new_value)
+            return previous
+
+    def compare_and_set(self, expected, new_value):
+        """ Set the value to new_value only if it currently equals expected, returning whether it was set """
+        with self._lock:
+            if self._value != self._check_and_return_other_value(expected):
+                return False
+            self._value = self._check_and_return_other_value(new_value)
+            return True
+
+    def update_and_get(self, fn):
+        """ Replace the value with fn(value), returning the new value. fn runs with the lock held so keep it short """
+        with self._lock:
+            self._value = self._check_and_return_other_value(fn(self._value))
+            return self._value
+
+    def accumulate_and_get(self, x, fn):
+        """ Replace the value with fn(value, x), returning the new value. fn runs with the lock held """
+        with self._lock:
+            self._value = self._check_and_return_other_value(fn(self._value, x))
+            return self._value
+
     def __repr__(self):
         return str(self)
 
@@ -284,12 +383,256 @@ class AtomicInt(object):
         with self._lock:
             return hex(self._value)
 
+class StripedAdder(object):
+    def __init__(self, value=0, cells=16):
+        """
+        Counter whose updates are spread over a number of cells, each with its own lock. Every thread is assigned a
+        cell the first time it updates the counter, so threads only contend when they share a cell.
+        :param value: Initial value
+        :param cells: Number of cells, more cells means less contention but slower reads
+        """
+        self._cells = [0] * cells
+        self._cells[0] = value
+        self._locks = [threading.Lock() for _ in range(cells)]
+        self._local = threading.local()
+        self._next_cell = itertools.count()
+
+    def _cell(self):
+        try:
+            return self._local.cell
+        except AttributeError:
+            self._local.cell = next(self._next_cell) % len(self._cells)
+            return self._local.cell
+
+    def add(self, delta):
+        i = self._cell()
+        with self._locks[i]:
+            self._cells[i] += delta
+
+    def increment(self):
+        self.add(1)
+
+    def decrement(self):
+        self.add(-1)
+
+    def increment_and_sum(self):
+        """
+        increment, then return the sum. It may include updates made by other threads since, and takes every cell lock,
+        so avoid it on hot paths
+        """
+        self.add(1)
+        return self.sum()
+
+    def decrement_and_sum(self):
+        """ decrement, then return the sum, as for increment_and_sum """
+        self.add(-1)
+        return self.sum()
+
+    def sum(self):
+        """
+        Current total, updates made while the cells are being summed may or may not be included
+        """
+        total = 0
+        for i, lock in enumerate(self._locks):
+            with lock:
+                total += self._cells[i]
+        return total
+
+    def reset(self):
+        for i, lock in enumerate(self._locks):
+            with lock:
+                self._cells[i] = 0
+
+    def sum_then_reset(self):
+        """ Return the total and zero the counter, no update is lost between the two """
+        total = 0
+        for i, lock in enumerate(self._locks):
+            with lock:
+                total += self._cells[i]
+                self._cells[i] = 0
+        return total
+
+    @property
+    def value(self):
+        return self.sum()
+
+    def __int__(self):
+        return self.sum()
+
+    def __long__(self):
+        return long(self.sum())
+
+    def __repr__(self):
+        return str(self)
+
+    def __str__(self):
+        return "{0}".format(self.sum())
+
+    def __unicode__(self):
+        return self.__str__()
+
+class AtomicCounterArray(object):
+    def __init__(self, size, stripes=16, typecode=COUNTER_TYPECODE):
+        """
+        Fixed size vector of counters held in a single array. Counter i is guarded by lock i % stripes, so updates to
+        neighbouring counters don't contend, and memory use is the array plus the stripe locks regardless of size.
+        :param size: Number of counters
+        :param stripes: Number of locks the counters are spread over
+        :param typecode: array typecode of the counters, defaults to the widest signed integer available
+        """
+        self._counts = array.array(typecode, [0]) * size
+        self._stripes = max(1, min(stripes, size))
+        self._locks = [threading.Lock() for _ in range(self._stripes)]
+
+    def __len__(self):
+        return len(self._counts)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self._counts)
+        with self._locks[index % self._stripes]:
+            return self._counts[index]
+
+    def __repr__(self):
+        return str(self)
+
+    def __str__(self):
+        return "{0}".format(self.snapshot().tolist())
+
+    def add(self, index, delta=1):
+        """ Add delta to counter index, returning its new value """
+        if index < 0:
+            index += len(self._counts)
+        with self._locks[index % self._stripes]:
+            self._counts[index] += delta
+            return self._counts[index]
+
+    def add_many(self, indices, deltas=1):
+        """
+        Add to several counters, taking each stripe lock once rather than once per update
+        :param indices: Counters to update, repeated indices are applied once for each time they appear
+        :param deltas: A single delta applied to every index, or a sequence of deltas matching indices
+        """
+        if isinstance(deltas, (int, long)):
+            deltas = itertools.repeat(deltas)
+        size, stripes = len(self._counts), self._stripes
+        by_stripe = {}
+        for index, delta in itertools.izip(indices, deltas):
+            if index < 0:
+                index += size
+            by_stripe.setdefault(index % stripes, []).append((index, delta))
+        counts = self._counts
+        for stripe, updates in by_stripe.items():
+            with self._locks[stripe]:
+                for index, delta in updates:
+                    counts[index] += delta
+
+    def snapshot(self):
+        """ Copy of every counter taken with all the stripes locked, so no update is partially visible """
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            return array.array(self._counts.typecode, self._counts)
+        finally:
+            for lock in reversed(self._locks):
+                lock.release()
+
+    def reset(self):
+        """ Zero every counter """
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            self._counts[:] = array.array(self._counts.typecode, [0]) * len(self._counts)
+        finally:
+            for lock in reversed(self._locks):
+                lock.release()
+
+class Transaction(object):
+    def __init__(self, *atomics):
+        """
+        Hold the locks of several AtomicInts at once, acquired in order of the lock's id so every transaction takes
+        them in the same order. Values should be read and written through the transaction while it is held, as the
+        AtomicInt methods would try to take the locks again.
+        :param atomics: AtomicInts taking part, duplicates and ints sharing a lock are only locked once
+        """
+        locks = {}
+        for a in atomics:
+            if not isinstance(a, AtomicInt):
+                raise TypeError("{0} is not an AtomicInt".format(type(a)))
+            locks[id(a._lock)] = a._lock
+        self._locks = [locks[k] for k in sorted(locks)]
+        self._members = set(id(a) for a in atomics)
+
+    def __enter__(self):
+        acquired = []
+        try:
+            for lock in self._locks:
+                lock.__enter__()
+                acquired.append(lock)
+        except BaseException:
+            for lock in reversed(acquired):
+                lock.__exit__(None, None, None)
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for lock in reversed(self._locks):
+            lock.__exit__(None, None, None)
+
+    def _check_member(self, a):
+        if id(a) not in self._members:
+            raise ValueError("AtomicInt is not part of this transaction")
+
+    def get(self, a):
+        self._check_member(a)
+        return a._value
+
+    def set(self, a, value):
+        self._check_member(a)
+        a._value = self.get(value) if isinstance(value, AtomicInt) else a._check_and_return_other_value(value)
+
+    def add(self, a, delta):
+        """ Add delta to a, returning its new value """
+        self.set(a, self.get(a) + (self.get(delta) if isinstance(delta, AtomicInt) else delta))
+        return a._value
+
+def transaction(*atomics):
+    """ Transaction over atomics, for use in a with statement """
+    return Transaction(*atomics)
+
+def atomically(atomics, fn, retries=3):
+    """
+    Replace the values of several AtomicInts with fn(*values) as a single atomic update, fn must return one new value
+    for each AtomicInt. fn runs without the locks held, which are then taken to check the values haven't changed before
+    writing the result. If they have it is retried, and after retries attempts run with the locks held instead, so fn
+    may be called more than once. Raising from fn aborts the update.
+    :return: The new values
+    """
+    atomics = list(atomics)
+    tx = Transaction(*atomics)
+    for _ in range(retries):
+        values = [a.value for a in atomics]
+        new_values = fn(*values)
+        with tx:
+            if [a._value for a in atomics] == values:
+                for a, value in zip(atomics, new_values):
+                    tx.set(a, value)
+                return list(new_values)
+    with tx:
+        new_values = fn(*[a._value for a in atomics])
+        for a, value in zip(atomics, new_values):
+            tx.set(a, value)
+        return list(new_values)
+
 def increment(obj):
+    """
+    Add one to an AtomicInt, returning its new value. A StripedAdder has no single new value to return, use its own
+    increment(), or increment_and_sum() where the total is wanted as well
+    """
     assert (isinstance(obj, AtomicInt))
-    obj += 1
-    return obj.value
+    return obj.add_and_get(1)
 
 def decrement(obj):
+    """ Subtract one from an AtomicInt, returning its new value, see increment """
     assert (isinstance(obj, AtomicInt))
-    obj -= 1
-    return obj.value
+    return obj.add_and_get(-1)
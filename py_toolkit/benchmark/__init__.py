@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for py_toolkit, each bench_*.py module is a standalone script run from this directory, e.g.
+
+    python bench_threadpool.py --output threadpool.json
+    python bench_threadpool.py --compare threadpool.json
+
+Results are written as JSON so runs can be compared against each other to spot regressions.
+"""
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+"""
+atomic.py benchmarks, throughput and latency percentiles of AtomicInt operations at increasing thread counts, the cost
+of operators that allocate a new AtomicInt against the in place methods, memory per instance, and contention on a
+single counter against StripedAdder.
+
+    python bench_atomic.py --output before.json
+    python bench_atomic.py --compare before.json
+"""
+
+import sys
+import threading
+
+# Append the current and parent directories to path so we can always find the module we want to benchmark
+map(lambda p: sys.path.append(p), [".", ".."])
+
+# noinspection PyUnresolvedReferences
+import atomic
+from bench_util import main, measure_memory, percentiles, timer
+
+THREAD_COUNTS = (1, 4, 16, 64)
+# Only every LATENCY_SAMPLE_RATE'th operation is timed individually, to keep the timer calls out of the throughput
+LATENCY_SAMPLE_RATE = 16
+
+def op_increment(a):
+    a += 1
+
+def op_increment_helper(a):
+    atomic.increment(a)
+
+def op_add_and_get(a):
+    a.add_and_get(1)
+
+def op_add_operator(a):
+    return a + 1
+
+def op_mul_operator(a):
+    return a * 2
+
+def op_less_than(a):
+    return a < 5
+
+def op_equals(a):
+    return a == 5
+
+def op_value(a):
+    return a.value
+
+OPERATIONS = (("increment", op_increment), ("increment_helper", op_increment_helper), ("add_and_get", op_add_and_get),
+              ("add_operator", op_add_operator), ("mul_operator", op_mul_operator), ("less_than", op_less_than),
+              ("equals", op_equals), ("value", op_value))
+
+def run_threads(num_threads, func):
+    """ Run func on num_threads threads released together, returning the elapsed time until they all finish """
+    start_gate = threading.Event()
+    def work():
+        start_gate.wait()
+        func()
+    threads = [threading.Thread(target=work) for _ in range(num_threads)]
+    for t in threads:
+        t.start()
+    start = timer()
+    start_gate.set()
+    for t in threads:
+        t.join()
+    return timer() - start
+
+def bench_counter_contention(suite):
+    """
+    Increments spread over a growing number of threads, AtomicInt directly and through the increment helper, against
+    StripedAdder with and without reading the sum
+    """
+    ops = suite.scale(200000)
+    def atomic_int_increments(counter, n):
+        for _ in range(n):
+            counter += 1
+    def adder_increments(counter, n):
+        increment = counter.increment
+        for _ in range(n):
+            increment()
+    def helper_increments(counter, n):
+        increment = atomic.increment
+        for _ in range(n):
+            increment(counter)
+    def adder_sum_increments(counter, n):
+        increment_and_sum = counter.increment_and_sum
+        for _ in range(n):
+            increment_and_sum()
+    counters = (("AtomicInt", atomic.AtomicInt, atomic_int_increments),
+                ("AtomicInt/increment_helper", atomic.AtomicInt, helper_increments),
+                ("StripedAdder", atomic.StripedAdder, adder_increments),
+                ("StripedAdder/increment_and_sum", atomic.StripedAdder, adder_sum_increments))
+    for name, counter_type, work in counters:
+        for num_threads in THREAD_COUNTS:
+            per_thread = ops // num_threads
+            counter = counter_type()
+            elapsed = min(run_threads(num_threads, lambda: work(counter, per_thread)) for _ in range(suite.repeat))
+            suite.record("counter_contention", {"impl": name, "threads": num_threads, "ops": per_thread * num_threads},
+                         ops_per_sec=per_thread * num_threads / elapsed)
+
+def bench_operations(suite):
+    """ Every thread repeatedly applies one operation to a shared AtomicInt, with an RLock and with a plain Lock """
+    ops = suite.scale(100000)
+    for op_name, op in OPERATIONS:
+        for reentrant in (True, False):
+            for num_threads in THREAD_COUNTS:
+                per_thread = max(LATENCY_SAMPLE_RATE, ops // num_threads)
+                def work(a):
+                    for _ in range(per_thread):
+                        op(a)
+                elapsed = min(run_threads(num_threads, lambda: work(atomic.AtomicInt(0, reentrant=reentrant)))
+                              for _ in range(suite.repeat))
+
+                latencies = []
+                latency_lock = threading.Lock()
+                a = atomic.AtomicInt(0, reentrant=reentrant)
+                def sample():
+                    samples = []
+                    for _ in range(per_thread // LATENCY_SAMPLE_RATE):
+                        for _ in range(LATENCY_SAMPLE_RATE - 1):
+                            op(a)
+                        start = timer()
+                        op(a)
+                        samples.append(timer() - start)
+                    with latency_lock:
+                        latencies.extend(samples)
+                run_threads(num_threads, sample)
+
+                metrics = dict(("latency_{0}_usec".format(k), v * 1e6) for k, v in percentiles(latencies).items())
+                metrics["ops_per_sec"] = per_thread * num_threads / elapsed
+                suite.record("operation", {"op": op_name, "lock": "RLock" if reentrant else "Lock",
+                                           "threads": num_threads, "ops": per_thread * num_threads}, **metrics)
+
+def bench_memory_per_instance(suite):
+    """ Memory held by each kind of counter, and per counter for an AtomicCounterArray """
+    count = suite.scale(10000)
+    factories = (("AtomicInt", 1, lambda: atomic.AtomicInt()),
+                 ("AtomicInt_Lock", 1, lambda: atomic.AtomicInt(reentrant=False)),
+                 ("StripedAdder", 1, lambda: atomic.StripedAdder()),
+                 ("AtomicCounterArray_10000", 10000, lambda: atomic.AtomicCounterArray(10000)))
+    for name, counters, factory in factories:
+        instances = max(1, count // counters)
+        size, method = measure_memory(factory, instances)
+        suite.record("memory_per_instance", {"impl": name, "counters": counters, "method": method},
+                     bytes_per_instance=size, bytes_per_counter=size / counters)
+
+def bench_construction(suite):
+    """ Cost of creating AtomicInts, which every arithmetic operator does for its result """
+    count = suite.scale(100000)
+    for reentrant in (True, False):
+        elapsed = suite.best_of(lambda: [atomic.AtomicInt(i, reentrant=reentrant) for i in range(count)])
+        suite.record("construction", {"lock": "RLock" if reentrant else "Lock", "count": count},
+                     constructions_per_sec=count / elapsed)
+
+BENCHMARKS = [bench_operations, bench_construction, bench_memory_per_instance, bench_counter_contention]
+
+if __name__ == "__main__":
+    sys.exit(main("atomic", BENCHMARKS))
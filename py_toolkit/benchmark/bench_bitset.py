@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+"""
+bitset benchmarks, memory per instance and construction rate of the generated BitSet types, slotted, interned and for
+reference a type whose instances carry a __dict__ as they used to.
+
+    python bench_bitset.py --output before.json
+    python bench_bitset.py --compare before.json
+"""
+
+import sys
+
+# Append the current and parent directories to path so we can always find the module we want to benchmark
+map(lambda p: sys.path.append(p), [".", ".."])
+
+# noinspection PyUnresolvedReferences
+import bitset
+from bench_util import main, measure_memory
+
+FIELDS = ["dsps", "sip", "users", "full_manipulation", "vm", "recording", "transcription", "fax"]
+
+def bitset_types():
+    factory = bitset.BitSetTypeFactory()
+    slotted = factory.createType("Features", FIELDS)
+    interned = factory.createType("InternedFeatures", FIELDS, interned=True)
+    # Subclassing without __slots__ gives every instance a __dict__ again
+    with_dict = type("DictFeatures", (slotted,), {})
+    return (("dict", with_dict), ("slots", slotted), ("interned", interned))
+
+def bench_memory_per_instance(suite):
+    """ Memory per BitSet, created with masks cycling through every value of the type """
+    count = suite.scale(100000)
+    for name, bitset_type in bitset_types():
+        masks = iter(range(count))
+        size, method = measure_memory(lambda: bitset_type(next(masks) & bitset_type.max_val), count)
+        suite.record("memory_per_instance", {"impl": name, "fields": len(FIELDS), "method": method},
+                     bytes_per_instance=size)
+
+def bench_construction(suite):
+    """ Construction through the validating constructor and from_mask, and BitSet with its fields as a list """
+    count = suite.scale(100000)
+    masks = [i & 255 for i in range(count)]
+    for name, bitset_type in bitset_types():
+        elapsed = suite.best_of(lambda: [bitset_type(m) for m in masks])
+        suite.record("construction", {"impl": name, "via": "constructor", "count": count},
+                     constructions_per_sec=count / elapsed)
+        from_mask = bitset_type.from_mask
+        elapsed = suite.best_of(lambda: [from_mask(m) for m in masks])
+        suite.record("construction", {"impl": name, "via": "from_mask", "count": count},
+                     constructions_per_sec=count / elapsed)
+    elapsed = suite.best_of(lambda: [bitset.BitSet(FIELDS, m) for m in masks])
+    suite.record("construction", {"impl": "BitSet", "via": "constructor", "count": count},
+                 constructions_per_sec=count / elapsed)
+
+def bench_operators(suite):
+    """ Set operators, which create a new instance for every result """
+    count = suite.scale(100000)
+    for name, bitset_type in bitset_types():
+        values = [bitset_type(i & 255) for i in range(256)]
+        other = bitset_type(0x55)
+        elapsed = suite.best_of(lambda: [values[i & 255] | other for i in range(count)])
+        suite.record("operator", {"impl": name, "op": "or", "count": count}, ops_per_sec=count / elapsed)
+
+BENCHMARKS = [bench_memory_per_instance, bench_construction, bench_operators]
+
+if __name__ == "__main__":
+    sys.exit(main("bitset", BENCHMARKS))
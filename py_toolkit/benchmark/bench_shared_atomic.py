@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+"""
+SharedAtomicInt benchmarks, cross process increment throughput against a multiprocessing.Value guarded by its lock
+
+    python bench_shared_atomic.py --output before.json
+    python bench_shared_atomic.py --compare before.json
+"""
+
+import os
+import ctypes
+import sys
+import multiprocessing
+
+# Append the current and parent directories to path so we can always find the module we want to benchmark
+map(lambda p: sys.path.append(p), [".", ".."])
+
+# noinspection PyUnresolvedReferences
+import shared_atomic
+from bench_util import main, timer
+
+PROCESS_COUNTS = (1, 2, 4, 8)
+
+def shared_atomic_increments(name, n, start_gate):
+    counter = shared_atomic.SharedAtomicInt(name)
+    add_and_get = counter.add_and_get
+    start_gate.wait()
+    for _ in range(n):
+        add_and_get(1)
+    counter.close()
+
+def value_increments(value, n, start_gate):
+    lock = value.get_lock()
+    start_gate.wait()
+    for _ in range(n):
+        with lock:
+            value.value += 1
+
+def run_processes(num_processes, target, args):
+    """ Run target in num_processes processes released together, returning the elapsed time until they all exit """
+    start_gate = multiprocessing.Event()
+    processes = [multiprocessing.Process(target=target, args=args + (start_gate,)) for _ in range(num_processes)]
+    for p in processes:
+        p.start()
+    start = timer()
+    start_gate.set()
+    for p in processes:
+        p.join()
+    return timer() - start
+
+def bench_cross_process_increment(suite):
+    """ Increments spread over a growing number of processes all updating one counter """
+    ops = suite.scale(100000)
+    name = "bench-{0}".format(os.getpid())
+    for num_processes in PROCESS_COUNTS:
+        per_process = ops // num_processes
+        counter = shared_atomic.SharedAtomicInt(name)
+        elapsed = min(run_processes(num_processes, shared_atomic_increments, (name, per_process))
+                      for _ in range(suite.repeat))
+        assert counter.value == per_process * num_processes * suite.repeat
+        counter.unlink()
+        counter.close()
+        suite.record("cross_process_increment", {"impl": "SharedAtomicInt", "processes": num_processes,
+                                                 "ops": per_process * num_processes},
+                     ops_per_sec=per_process * num_processes / elapsed)
+
+        value = multiprocessing.Value(ctypes.c_longlong, 0)
+        elapsed = min(run_processes(num_processes, value_increments, (value, per_process))
+                      for _ in range(suite.repeat))
+        suite.record("cross_process_increment", {"impl": "multiprocessing.Value", "processes": num_processes,
+                                                 "ops": per_process * num_processes},
+                     ops_per_sec=per_process * num_processes / elapsed)
+
+BENCHMARKS = [bench_cross_process_increment]
+
+if __name__ == "__main__":
+    sys.exit(main("shared_atomic", BENCHMARKS))
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+"""
+ThreadPool benchmarks, compared against concurrent.futures.ThreadPoolExecutor where it is available (it needs the
+futures backport on python 2).
+
+    python bench_threadpool.py --output before.json
+    python bench_threadpool.py --compare before.json
+"""
+
+import sys
+import time
+import threading
+
+# Append the current and parent directories to path so we can always find the module we want to benchmark
+map(lambda p: sys.path.append(p), [".", ".."])
+
+# noinspection PyUnresolvedReferences
+import threadpool
+from bench_util import main, percentiles, timer
+
+try:
+    from concurrent.futures import ThreadPoolExecutor, wait
+except ImportError:
+    ThreadPoolExecutor = None
+
+THREAD_COUNTS = (1, 2, 4, 8, 16)
+
+def noop(_=None):
+    pass
+
+def io_task(_=None):
+    time.sleep(0.001)
+
+class PoolRunner(object):
+    """ Run the same workload on a ThreadPool """
+    name = "ThreadPool"
+
+    def __init__(self, num_threads):
+        self.pool = threadpool.ThreadPool(num_threads, label="bench")
+
+    def run_all(self, func, args_list):
+        for args in args_list:
+            self.pool.enqueue(func, args)
+        self.pool.join()
+
+    def map(self, func, args_list):
+        self.pool.map(func, args_list)
+        self.pool.join()
+
+    def close(self):
+        self.pool.shutdown()
+
+class ExecutorRunner(object):
+    """ Run the same workload on a ThreadPoolExecutor """
+    name = "ThreadPoolExecutor"
+
+    def __init__(self, num_threads):
+        self.executor = ThreadPoolExecutor(num_threads)
+
+    def run_all(self, func, args_list):
+        wait([self.executor.submit(func, args) for args in args_list])
+
+    def map(self, func, args_list):
+        list(self.executor.map(func, args_list))
+
+    def close(self):
+        self.executor.shutdown()
+
+def runners():
+    return [PoolRunner] + ([ExecutorRunner] if ThreadPoolExecutor is not None else [])
+
+def bench_per_task_overhead(suite):
+    """ Cost of submitting and running a task that does nothing """
+    tasks = suite.scale(20000)
+    for runner_type in runners():
+        for num_threads in (1, 4):
+            runner = runner_type(num_threads)
+            elapsed = suite.best_of(lambda: runner.run_all(noop, range(tasks)))
+            runner.close()
+            suite.record("per_task_overhead", {"impl": runner.name, "threads": num_threads, "tasks": tasks},
+                         usec_per_task=elapsed / tasks * 1e6, tasks_per_sec=tasks / elapsed)
+
+def bench_map_throughput(suite):
+    """ map with tiny tasks is dominated by scheduling, with larger tasks by how well the pool overlaps them """
+    workloads = (("tiny", noop, suite.scale(20000)), ("large", io_task, suite.scale(2000)))
+    for runner_type in runners():
+        for size, func, tasks in workloads:
+            runner = runner_type(8)
+            elapsed = suite.best_of(lambda: runner.map(func, range(tasks)))
+            runner.close()
+            suite.record("map_throughput", {"impl": runner.name, "threads": 8, "task_size": size, "tasks": tasks},
+                         tasks_per_sec=tasks / elapsed)
+
+def bench_saturated_latency(suite):
+    """ Time from submission to a task starting when the pool is kept saturated """
+    tasks = suite.scale(5000)
+    for runner_type in runners():
+        runner = runner_type(4)
+        latencies = []
+        lock = threading.Lock()
+        def task(submitted):
+            started = timer()
+            with lock:
+                latencies.append(started - submitted)
+            io_task()
+        # Each task measures its own queueing delay, so its argument is the time it was submitted
+        submitted = (timer() for _ in range(tasks))
+        start = timer()
+        runner.run_all(task, submitted)
+        elapsed = timer() - start
+        runner.close()
+        metrics = dict(("latency_{0}_usec".format(k), v * 1e6) for k, v in percentiles(latencies).items())
+        metrics["tasks_per_sec"] = tasks / elapsed
+        suite.record("saturated_latency", {"impl": runner.name, "threads": 4, "tasks": tasks}, **metrics)
+
+def bench_thread_scaling(suite):
+    """ Throughput of blocking tasks as the number of workers grows """
+    tasks = suite.scale(2000)
+    for runner_type in runners():
+        for num_threads in THREAD_COUNTS:
+            runner = runner_type(num_threads)
+            elapsed = suite.best_of(lambda: runner.map(io_task, range(tasks)), repeat=3)
+            runner.close()
+            suite.record("thread_scaling", {"impl": runner.name, "threads": num_threads, "tasks": tasks},
+                         tasks_per_sec=tasks / elapsed)
+
+BENCHMARKS = [bench_per_task_overhead, bench_map_throughput, bench_saturated_latency, bench_thread_scaling]
+
+if __name__ == "__main__":
+    sys.exit(main("threadpool", BENCHMARKS))
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+"""
+Shared harness for the benchmark scripts.
+
+A suite is a list of benchmark functions, each taking a Suite and recording one or more results on it. A result is
+identified by its name and parameters, so the same result from two runs can be matched up and compared:
+
+    def bench_noop(suite):
+        elapsed = suite.best_of(lambda: noop())
+        suite.record("noop", {"threads": 1}, ops_per_sec=1 / elapsed)
+
+    if __name__ == "__main__":
+        main("example", [bench_noop])
+
+Metrics ending in _per_sec are treated as higher is better when comparing runs, everything else as lower is better.
+"""
+
+import gc
+import sys
+import json
+import time
+import timeit
+import argparse
+import platform
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+timer = timeit.default_timer
+
+def percentiles(samples, points=(50, 90, 99, 99.9)):
+    """
+    Nearest rank percentiles of samples, returned as a dict keyed p50, p90...
+    """
+    ordered = sorted(samples)
+    result = {}
+    for point in points:
+        key = "p{0}".format(point).replace(".", "_")
+        if not ordered:
+            result[key] = 0.0
+            continue
+        rank = int(round(point / 100.0 * (len(ordered) - 1)))
+        result[key] = ordered[rank]
+    return result
+
+def measure_memory(factory, count):
+    """ Bytes allocated per object by factory, using tracemalloc where available """
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        objects = [factory() for _ in range(count)]
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return (after - before) / float(count), "tracemalloc"
+    # Without tracemalloc, approximate from the sizes of the objects, their attributes and their values, counting
+    # anything shared between the objects once
+    objects = [factory() for _ in range(count)]
+    seen = set()
+    def size_of(o):
+        if id(o) in seen:
+            return 0
+        seen.add(id(o))
+        size = sys.getsizeof(o)
+        if isinstance(o, (list, tuple)):
+            size += sum(size_of(item) for item in o)
+        elif isinstance(o, dict):
+            size += sum(size_of(k) + size_of(v) for k, v in o.items())
+        if hasattr(o, "__dict__"):
+            size += size_of(o.__dict__)
+        for cls in type(o).__mro__:
+            for slot in cls.__dict__.get("__slots__", ()):
+                if slot not in ("__dict__", "__weakref__") and hasattr(o, slot):
+                    size += size_of(getattr(o, slot))
+        return size
+    return sum(size_of(obj) for obj in objects) / float(count), "getsizeof"
+
+def higher_is_better(metric):
+    return metric.endswith("_per_sec")
+
+def result_key(result):
+    return result["name"], tuple(sorted(result["params"].items()))
+
+class Suite(object):
+    def __init__(self, name, repeat=5, quick=False):
+        """
+        Collects the results of a benchmark run
+        :param name: Name of the suite, recorded in the output
+        :param repeat: Number of times best_of repeats a measurement
+        :param quick: Benchmarks should shrink their workloads, for smoke testing the scripts
+        """
+        self.name = name
+        self.repeat = repeat
+        self.quick = quick
+        self.results = []
+
+    def scale(self, n):
+        """ Workload size to use, reduced when running in quick mode """
+        return max(1, n // 20) if self.quick else n
+
+    def best_of(self, func, repeat=None):
+        """ Run func repeat times, returning the fastest elapsed time, which is the least affected by noise """
+        best = None
+        for _ in range(repeat or self.repeat):
+            start = timer()
+            func()
+            elapsed = timer() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def record(self, name, params, **metrics):
+        result = {"name": name, "params": params, "metrics": metrics}
+        self.results.append(result)
+        sys.stderr.write("{0} {1} {2}\n".format(name, json.dumps(params, sort_keys=True),
+                                                json.dumps(metrics, sort_keys=True)))
+        return result
+
+    def as_dict(self):
+        return {"suite": self.name,
+                "timestamp": time.time(),
+                "python": platform.python_version(),
+                "implementation": platform.python_implementation(),
+                "platform": platform.platform(),
+                "repeat": self.repeat,
+                "quick": self.quick,
+                "results": self.results}
+
+def compare(baseline, current, threshold=0.1):
+    """
+    Compare two suite outputs, returning a list of (name, params, metric, baseline, current, change, regressed) rows
+    for every metric present in both. change is the relative improvement, negative when current is worse.
+    """
+    previous = dict((result_key(r), r) for r in baseline["results"])
+    rows = []
+    for result in current["results"]:
+        match = previous.get(result_key(result))
+        if match is None:
+            continue
+        for metric, value in sorted(result["metrics"].items()):
+            old = match["metrics"].get(metric)
+            if not old or not isinstance(old, (int, float)):
+                continue
+            change = (value - old) / float(old)
+            if not higher_is_better(metric):
+                change = -change
+            rows.append((result["name"], result["params"], metric, old, value, change, change < -threshold))
+    return rows
+
+def main(name, benchmarks, argv=None):
+    parser = argparse.ArgumentParser(description="Run the {0} benchmarks".format(name))
+    parser.add_argument("--output", help="Write the results as JSON to this file, defaults to stdout")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative slowdown reported as a regression when comparing, default 0.1")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions of each measurement, best is kept")
+    parser.add_argument("--quick", action="store_true", help="Run reduced workloads to check the scripts work")
+    parser.add_argument("--filter", help="Only run benchmarks whose function name contains this string")
+    args = parser.parse_args(argv)
+
+    suite = Suite(name, repeat=args.repeat, quick=args.quick)
+    for benchmark in benchmarks:
+        if args.filter and args.filter not in benchmark.__name__:
+            continue
+        benchmark(suite)
+
+    output = json.dumps(suite.as_dict(), indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            rows = compare(json.load(f), suite.as_dict(), args.threshold)
+        regressions = 0
+        for name, params, metric, old, new, change, regressed in rows:
+            regressions += regressed
+            sys.stderr.write("{0:<10} {1} {2} {3}: {4:.6g} -> {5:.6g} ({6:+.1%})\n".format(
+                "REGRESSED" if regressed else "ok", name, json.dumps(params, sort_keys=True), metric, old, new, change))
+        return 1 if regressions else 0
+    return 0
@@ -1,6 +1,14 @@
-import bitset 
+import bitset
+from bitset import BitSet, BitSetTypeFactory, EmptyAttributeListError, DuplicateAttributeError, DuplicateTypeError, \
+    TypeNotDeclaredError, InvalidBitMaskValueError, InvalidBitMaskValueTypeError, UnknownFieldError, \
+    ImmutableBitSetError
+from bitset_array import BitSetArray
+from roaring import RoaringBitmap
+from serialization import BitSetCodec, BitSetTable, SchemaMismatchError
+from bloom import BloomFilter, CountingBloomFilter
 
 __all__ = ["BitSet", "BitSetTypeFactory", "EmptyAttributeListError", "DuplicateAttributeError", "DuplicateTypeError", "TypeNotDeclaredError", "InvalidBitMaskValueError", 
-           "InvalidBitMaskValueTypeError"]
+           "InvalidBitMaskValueTypeError", "UnknownFieldError", "ImmutableBitSetError", "BitSetArray", "RoaringBitmap",
+           "BitSetCodec", "BitSetTable", "SchemaMismatchError", "BloomFilter", "CountingBloomFilter"]
 
-BitSets = bitset.BitSetTypeFactory()
\ No newline at end of file
+BitSets = bitset.BitSetTypeFactory()
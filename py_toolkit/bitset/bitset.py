@@ -1,12 +1,11 @@
 #!/usr/bin/env python 
 
-import itertools
 import collections
 import sys
 if sys.version_info.major < 3:
     import StringIO as stringio
 else:
-    import stringio
+    import io as stringio
     
 BIT_CONST_STR = 'BIT_{0}'
 BITMASK_VALUE_TYPE_ERROR = 'Expected int type, found {0} for {1}.'
@@ -14,6 +13,10 @@ BITMASK_VALUE_RANGE_ERROR = '{0} is not in the range 0-{1}.'
 UNKNOWN_TYPE_ERROR = 'Type {0} has not been declared.'
 DUPLICATE_FIELDS_ERROR = 'Fields contains duplicate entries: [{0}]'
 DUPLICATE_BITSET_NAME_ERROR = "BitSet name '{0}' has been declared already"
+INCOMPATIBLE_FIELDS_ERROR = 'BitSet fields {0} do not match {1}.'
+UNKNOWN_FIELD_ERROR = 'Unknown field {0}, expected one of {1}.'
+UNSUPPORTED_OPERAND_ERROR = 'Expected a BitSet, int or field name, found {0}.'
+IMMUTABLE_ERROR = '{0} is interned and cannot be modified.'
 
 class EmptyAttributeListError(Exception):
     def __init__(self):
@@ -39,14 +42,85 @@ class InvalidBitMaskValueTypeError(Exception):
     def __init__(self, val):
         super(InvalidBitMaskValueTypeError, self).__init__(BITMASK_VALUE_TYPE_ERROR.format(type(val), val))
 
+class UnknownFieldError(Exception):
+    def __init__(self, field, fields):
+        super(UnknownFieldError, self).__init__(UNKNOWN_FIELD_ERROR.format(field, ', '.join(fields)))
+
+class ImmutableBitSetError(AttributeError):
+    def __init__(self, obj):
+        super(ImmutableBitSetError, self).__init__(IMMUTABLE_ERROR.format(type(obj).__name__))
+
+def check_fields(fields):
+    if not fields:
+        raise EmptyAttributeListError()
+    if not len(fields) == len(set(fields)):
+        raise DuplicateAttributeError(fields)
+
+class BitField(object):
+    """
+    Descriptor exposing a single bit of a BitSet mask as a boolean attribute
+    """
+    __slots__ = ('name', 'bit')
+
+    def __init__(self, name, bit):
+        self.name = name
+        self.bit = bit
+
+    def __get__(self, obj, owner):
+        if obj is None:
+            return self
+        return bool(obj._mask & self.bit)
+
+    def __set__(self, obj, enabled):
+        if enabled:
+            obj._mask |= self.bit
+        else:
+            obj._mask &= ~self.bit
+
+class FrozenBitField(BitField):
+    """
+    Read only BitField, used by interned types
+    """
+    __slots__ = ()
+
+    def __set__(self, obj, enabled):
+        raise ImmutableBitSetError(obj)
+
+def type_dict(fields, interned = False):
+    """
+    Class attributes for a BitSet type with the given fields, a descriptor and a BIT_ constant per field. Instances only
+    hold their mask, everything else is computed once here and shared through the class.
+    """
+    d = {'__slots__': ()}
+    d['keys'] = list(fields)
+    d['max_val'] = pow(2, len(fields)) - 1
+    d['field_bits'] = [ (k, pow(2, i)) for (i, k) in enumerate(fields) ]
+    d['field_masks'] = dict(d['field_bits'])
+    d['bit_consts'] = dict((BIT_CONST_STR.format(k.upper()), bit) for (k, bit) in d['field_bits'])
+    field_type = FrozenBitField if interned else BitField
+    for (k, bit) in d['field_bits']:
+        d[k] = field_type(k, bit)
+    d.update(d['bit_consts'])
+    if interned:
+        d['_interned'] = {}
+    return d
+
 class BitBase(object):
+    """
+    A set of named flags held as a single integer mask. Supports the set operators &, |, ^ and ~ with other BitSets of
+    the same fields or plain int masks, membership tests of field names, and iterates over the names of the set fields.
+    """
+    __slots__ = ('_mask',)
+
     def __init__(self, val = 0):
-        if not self.keys:
-            raise EmptyAttributeListError()
-        if not len(self.keys) == len(set(self.keys)):
-            raise DuplicateAttributeError(self.keys)
         self.load(val)
-        self.bit_consts = None
+
+    @classmethod
+    def from_mask(cls, mask):
+        """ Create an instance directly from a mask already known to be valid """
+        obj = object.__new__(cls)
+        obj._mask = mask
+        return obj
 
     def __len__(self):
         return len(self.keys)
@@ -60,67 +134,202 @@ class BitBase(object):
 
     __unicode__ = __str__
 
+    def __iter__(self):
+        mask = self._mask
+        return (k for (k, bit) in self.field_bits if mask & bit)
+
+    def __contains__(self, item):
+        if isinstance(item, basestring):
+            bit = self.field_masks.get(item)
+            return bit is not None and bool(self._mask & bit)
+        if isinstance(item, (int, long)) and not 0 <= item <= self.max_val:
+            # A mask this type can't hold can't be part of it
+            return False
+        mask = self._other_mask(item)
+        if mask is NotImplemented:
+            raise TypeError(UNSUPPORTED_OPERAND_ERROR.format(type(item)))
+        return self._mask & mask == mask
+
+    def __eq__(self, other):
+        if isinstance(other, BitBase):
+            return self.keys == other.keys and self._mask == other._mask
+        if isinstance(other, (int, long)):
+            return self._mask == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        # Consistent with equality against plain int masks
+        return hash(self._mask)
+
+    def _other_mask(self, other):
+        if isinstance(other, BitBase):
+            if other.keys != self.keys:
+                raise TypeError(INCOMPATIBLE_FIELDS_ERROR.format(self.keys, other.keys))
+            return other._mask
+        if isinstance(other, (int, long)):
+            if not 0 <= other <= self.max_val:
+                raise InvalidBitMaskValueError(other, self.max_val)
+            return other
+        return NotImplemented
+
+    def __and__(self, other):
+        mask = self._other_mask(other)
+        return mask if mask is NotImplemented else self.from_mask(self._mask & mask)
+
+    def __or__(self, other):
+        mask = self._other_mask(other)
+        return mask if mask is NotImplemented else self.from_mask(self._mask | mask)
+
+    def __xor__(self, other):
+        mask = self._other_mask(other)
+        return mask if mask is NotImplemented else self.from_mask(self._mask ^ mask)
+
+    __rand__ = __and__
+    __ror__ = __or__
+    __rxor__ = __xor__
+
+    def __iand__(self, other):
+        mask = self._other_mask(other)
+        if mask is NotImplemented:
+            return mask
+        self._mask &= mask
+        return self
+
+    def __ior__(self, other):
+        mask = self._other_mask(other)
+        if mask is NotImplemented:
+            return mask
+        self._mask |= mask
+        return self
+
+    def __ixor__(self, other):
+        mask = self._other_mask(other)
+        if mask is NotImplemented:
+            return mask
+        self._mask ^= mask
+        return self
+
+    def __invert__(self):
+        return self.from_mask(self.max_val & ~self._mask)
+
     def fields(self):
         return [ k for k in self.keys ]
 
     def consts(self):
-        if not self.bit_consts:
-            self.bit_consts = {}
-            for (k, v,) in zip([ BIT_CONST_STR.format(k.upper()) for k in self.keys ], map(pow, [2] * len(self.keys), range(len(self.keys)))):
-                self.bit_consts[k] = v
-        return self.bit_consts
+        return dict(self.bit_consts)
 
     def bits(self):
-        return '{{0:0{0}b}}'.format(len(self)).format(self.value())
+        return '{{0:0{0}b}}'.format(len(self)).format(self._mask)
 
     def value(self):
-        bitmask = itertools.imap(pow, [2] * len(self), range(len(self)))
-        return sum(itertools.compress(bitmask, [ getattr(self, k) for k in self.keys ]))
+        return self._mask
 
     def load(self, val):
         if type(val) is not int:
             raise InvalidBitMaskValueTypeError(val)
-        if val > self.max_val:
+        if not 0 <= val <= self.max_val:
             raise InvalidBitMaskValueError(val, self.max_val)
-        active_bits = [ v for v in itertools.compress(self.keys, [ bool(int(x)) for x in reversed(list('{0:0b}'.format(val))) ]) ]
-        for k in active_bits:
-            setattr(self, k, True)
-        for k in set(self.keys) - set(active_bits):
-            setattr(self, k, False)
+        self._mask = val
+
+class InternedBitBase(BitBase):
+    """
+    Immutable BitSet, only one instance is created per mask and shared by everyone asking for that value. The number of
+    instances is bounded by max_val, so this suits types with few fields or only a few masks in use. The operators
+    return the interned instance of their result, the in place ones rebind rather than modify.
+    """
+    __slots__ = ()
+
+    def __new__(cls, val = 0):
+        obj = cls._interned.get(val) if type(val) is int else None
+        if obj is None:
+            obj = object.__new__(cls)
+            BitBase.load(obj, val)
+            obj = cls._interned.setdefault(val, obj)
+        return obj
+
+    def __init__(self, val = 0):
+        pass
+
+    @classmethod
+    def from_mask(cls, mask):
+        obj = cls._interned.get(mask)
+        if obj is None:
+            obj = cls._interned.setdefault(mask, super(InternedBitBase, cls).from_mask(mask))
+        return obj
+
+    def __reduce__(self):
+        return (type(self), (self._mask,))
+
+    def __iand__(self, other):
+        return self & other
+
+    def __ior__(self, other):
+        return self | other
+
+    def __ixor__(self, other):
+        return self ^ other
+
+    def load(self, val):
+        raise ImmutableBitSetError(self)
 
 class BitSet(BitBase):
+    """
+    BitSet with its fields given at construction, a type is generated and cached for each distinct list of fields
+    """
+    __slots__ = ()
+    types = {}
+
+    def __new__(cls, keys, val = 0):
+        key = tuple(keys)
+        subtype = BitSet.types.get(key)
+        if subtype is None:
+            check_fields(keys)
+            subtype = BitSet.types[key] = type('BitSet', (BitSet,), type_dict(keys))
+        return BitBase.__new__(subtype)
+
     def __init__(self, keys, val = 0):
-        self.keys = keys
-        self.max_val = pow(2, len(self.keys)) - 1
-        for (k, i,) in zip(keys, range(len(self.keys))):
-            setattr(BitSet, BIT_CONST_STR.format(k.upper()), pow(2, i))
         super(BitSet, self).__init__(val)
-        self.load(val)
+
+    def __reduce__(self):
+        return (BitSet, (self.fields(), self._mask))
 
 class BitSetTypeFactory(object):
     def __init__(self):
         self.types = {}
 
-    def declareType(self, name, fields):
+    def declareType(self, name, fields, interned = False):
         if not fields: 
             raise EmptyAttributeListError()
         if name in self.types:
             raise DuplicateTypeError(name)
-        self.types[name] = self.createType(name, fields)
+        self.types[name] = self.createType(name, fields, interned)
 
-    def createType(self, name, fields):
-        d = {}
-        d['keys'] = fields
-        d['max_val'] = pow(2, len(fields)) - 1
-        for (k, i,) in zip(fields, map(pow, [2] * len(fields), range(len(fields)))):
-            d['BIT_{0}'.format(k.upper())] = i
-        return type(name, (BitBase,), d)
+    def createType(self, name, fields, interned = False):
+        """
+        Generate a BitSet type with the given fields
+        :param interned: Make instances immutable and share a single instance per mask, see InternedBitBase
+        """
+        check_fields(fields)
+        return type(name, (InternedBitBase if interned else BitBase,), type_dict(fields, interned))
 
     def create(self, name, val = 0):
         if name in self.types:
             return self.types[name](val)
         raise TypeNotDeclaredError(name)
 
+    def createArray(self, name, masks = None, size = 0):
+        """
+        Create a BitSetArray of a declared type, see bitset_array, which requires numpy
+        """
+        if name not in self.types:
+            raise TypeNotDeclaredError(name)
+        from bitset_array import BitSetArray
+        return BitSetArray(self.types[name], masks, size)
+
 BitSets = BitSetTypeFactory()
 if __name__ == '__main__':
     features = BitSet(['dsps', 'sip', 'users', 'full_manipulation',  'vm'], val=2)
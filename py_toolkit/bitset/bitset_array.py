@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+
+"""
+Columnar storage for large numbers of BitSets of one type, the masks are held in a single NumPy array so fields can be
+tested, updated and counted across every record at once rather than looping over BitSet instances.
+
+    Features = BitSets.createType('Features', ['dsps', 'sip', 'users'])
+    customers = BitSetArray(Features, masks)
+    voip_only = customers.where(sip=True, users=False)
+    customers.set('users', True, where=voip_only)
+    customers.counts()
+    {'dsps': 1204, 'sip': 5320, 'users': 9981}
+
+Masks are stored in the smallest unsigned integer dtype that holds the type's max_val, an existing integer ndarray is
+used as is without copying, and to_ints() returns the underlying array. Requires numpy.
+"""
+
+from bitset import BitBase, InvalidBitMaskValueError, InvalidBitMaskValueTypeError, UnknownFieldError, \
+    INCOMPATIBLE_FIELDS_ERROR
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TOO_MANY_FIELDS_ERROR = 'BitSetArray supports up to 64 fields, {0} has {1}.'
+
+def mask_dtype(bitset_type):
+    """ Smallest unsigned integer dtype able to hold every mask of bitset_type """
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if bitset_type.max_val <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    raise ValueError(TOO_MANY_FIELDS_ERROR.format(bitset_type.__name__, len(bitset_type.keys)))
+
+class BitSetArray(object):
+    def __init__(self, bitset_type, masks = None, size = 0, validate = True):
+        """
+        :param bitset_type: BitSet type of the records, from BitSetTypeFactory.createType or a BitSet instance's type
+        :param masks: Initial masks, an integer ndarray is used without copying, anything else is converted
+        :param size: Number of empty records to create when masks is not given
+        :param validate: Check every mask is in range for bitset_type
+        """
+        if np is None:
+            raise ImportError('BitSetArray requires numpy')
+        self.bitset_type = bitset_type
+        if masks is None:
+            masks = np.zeros(size, dtype=mask_dtype(bitset_type))
+        elif not isinstance(masks, np.ndarray):
+            masks = np.asarray(masks, dtype=mask_dtype(bitset_type))
+        elif masks.dtype.kind not in 'ui':
+            raise InvalidBitMaskValueTypeError(masks.dtype)
+        if validate:
+            self._check_range(masks)
+        self.masks = masks
+
+    @classmethod
+    def from_ints(cls, bitset_type, ints, validate = True):
+        """ Wrap an existing integer array of masks, without copying it """
+        return cls(bitset_type, ints, validate=validate)
+
+    def to_ints(self):
+        """ The underlying array of masks, changes to it are reflected in this BitSetArray """
+        return self.masks
+
+    def _check_range(self, masks):
+        if masks.size:
+            lowest, highest = masks.min(), masks.max()
+            if lowest < 0 or highest > self.bitset_type.max_val:
+                raise InvalidBitMaskValueError(lowest if lowest < 0 else highest, self.bitset_type.max_val)
+
+    def _new(self, masks):
+        return BitSetArray(self.bitset_type, masks, validate=False)
+
+    def _scalar(self, value):
+        # Keep python ints from promoting the unsigned masks to a signed or float dtype
+        return self.masks.dtype.type(value)
+
+    def _bit(self, field):
+        bit = self.bitset_type.field_masks.get(field)
+        if bit is None:
+            raise UnknownFieldError(field, self.bitset_type.keys)
+        return bit
+
+    def _fields_mask(self, fields):
+        mask = 0
+        for field in fields:
+            mask |= self._bit(field)
+        return mask
+
+    def __len__(self):
+        return len(self.masks)
+
+    def __iter__(self):
+        from_mask = self.bitset_type.from_mask
+        return (from_mask(int(mask)) for mask in self.masks)
+
+    def __getitem__(self, index):
+        """ A single index returns a BitSet, slices and boolean or index arrays return a BitSetArray """
+        masks = self.masks[index]
+        if isinstance(masks, np.ndarray):
+            return self._new(masks)
+        return self.bitset_type.from_mask(int(masks))
+
+    def __setitem__(self, index, value):
+        """ Accepts BitSets, BitSetArrays and int masks or arrays of them, which must be in range for the type """
+        masks = self._other_masks(value)
+        if masks is NotImplemented:
+            masks = np.asarray(value)
+            if masks.size and masks.dtype.kind not in 'ui':
+                raise InvalidBitMaskValueTypeError(value)
+            self._check_range(masks)
+        self.masks[index] = masks
+
+    def __repr__(self):
+        return 'BitSetArray({0}, {1!r})'.format(self.bitset_type.__name__, self.masks)
+
+    def test(self, field):
+        """ Boolean array, True where field is enabled """
+        return (self.masks & self._scalar(self._bit(field))) != 0
+
+    def test_all(self, *fields):
+        """ Boolean array, True where every one of fields is enabled """
+        mask = self._scalar(self._fields_mask(fields))
+        return (self.masks & mask) == mask
+
+    def test_any(self, *fields):
+        """ Boolean array, True where any of fields is enabled """
+        return (self.masks & self._scalar(self._fields_mask(fields))) != 0
+
+    def where(self, **fields):
+        """ Boolean array, True where each field given as a keyword has the given state, e.g. where(sip=True) """
+        enabled = self._fields_mask(f for (f, state) in fields.items() if state)
+        disabled = self._fields_mask(f for (f, state) in fields.items() if not state)
+        return (self.masks & self._scalar(enabled | disabled)) == self._scalar(enabled)
+
+    def filter(self, **fields):
+        """ The records matching where(**fields) """
+        return self._new(self.masks[self.where(**fields)])
+
+    def set(self, field, enabled = True, where = None):
+        """
+        Enable or disable field in place, for every record or only those where the boolean array where is True
+        """
+        bit = self._bit(field)
+        if enabled:
+            np.bitwise_or(self.masks, self._scalar(bit), out=self.masks, where=True if where is None else where)
+        else:
+            np.bitwise_and(self.masks, self._scalar(self.bitset_type.max_val & ~bit), out=self.masks,
+                           where=True if where is None else where)
+
+    def popcount(self):
+        """ Array holding the number of enabled fields of each record """
+        counts = np.zeros(len(self.masks), dtype=np.uint8)
+        for (_, bit) in self.bitset_type.field_bits:
+            counts += (self.masks & self._scalar(bit)) != 0
+        return counts
+
+    def counts(self, where = None):
+        """ Number of records with each field enabled, optionally only counting records where where is True """
+        masks = self.masks if where is None else self.masks[where]
+        return dict((field, int(np.count_nonzero(masks & self._scalar(bit))))
+                    for (field, bit) in self.bitset_type.field_bits)
+
+    def value_counts(self):
+        """ Number of records holding each distinct mask """
+        values, counts = np.unique(self.masks, return_counts=True)
+        return dict((int(v), int(c)) for (v, c) in zip(values, counts))
+
+    def _other_masks(self, other):
+        if isinstance(other, (BitSetArray, BitBase)):
+            other_type = other.bitset_type if isinstance(other, BitSetArray) else other
+            if other_type.keys != self.bitset_type.keys:
+                raise TypeError(INCOMPATIBLE_FIELDS_ERROR.format(self.bitset_type.keys, other_type.keys))
+            return other.masks if isinstance(other, BitSetArray) else self._scalar(other.value())
+        if isinstance(other, (int, long, np.integer)):
+            if not 0 <= other <= self.bitset_type.max_val:
+                raise InvalidBitMaskValueError(other, self.bitset_type.max_val)
+            return self._scalar(other)
+        return NotImplemented
+
+    def __and__(self, other):
+        masks = self._other_masks(other)
+        return masks if masks is NotImplemented else self._new(self.masks & masks)
+
+    def __or__(self, other):
+        masks = self._other_masks(other)
+        return masks if masks is NotImplemented else self._new(self.masks | masks)
+
+    def __xor__(self, other):
+        masks = self._other_masks(other)
+        return masks if masks is NotImplemented else self._new(self.masks ^ masks)
+
+    __rand__ = __and__
+    __ror__ = __or__
+    __rxor__ = __xor__
+
+    def __iand__(self, other):
+        masks = self._other_masks(other)
+        if masks is NotImplemented:
+            return masks
+        self.masks &= masks
+        return self
+
+    def __ior__(self, other):
+        masks = self._other_masks(other)
+        if masks is NotImplemented:
+            return masks
+        self.masks |= masks
+        return self
+
+    def __ixor__(self, other):
+        masks = self._other_masks(other)
+        if masks is NotImplemented:
+            return masks
+        self.masks ^= masks
+        return self
+
+    def __invert__(self):
+        return self._new(self.masks ^ self._scalar(self.bitset_type.max_val))
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+
+"""
+Bloom filters, compact probabilistic sets that never report a key that was added as missing, but may report a key that
+wasn't added as present with a chosen probability. In front of a Cache they keep lookups of keys that can't exist away
+from on_miss:
+
+    known = BloomFilter(capacity=1000000, error_rate=0.001)
+    known.add_many(load_all_ids())
+
+    def on_miss(self, key):
+        if key not in known:
+            return None
+        return backend.load(key)
+
+The filter is sized from the number of keys it is expected to hold and the false positive rate wanted at that size,
+adding more keys than capacity raises the rate. Keys are hashed as bytes, unicode strings as their utf-8 encoding and
+anything else as str(key), so 1 and '1' are the same key. BloomFilter can't forget keys, CountingBloomFilter keeps a
+small counter per position instead of a bit so keys can be removed, at 8 times the memory.
+
+Both serialize to a header followed by the bit or counter array, and filters of the same size can be combined with |
+"""
+
+import math
+import struct
+import hashlib
+import threading
+
+# Version 2 keeps the second hash off multiples of the size, so filters serialized by version 1 set different positions
+VERSION = 2
+# Magic, version, number of hashes, number of bits and number of keys added, then the bit or counter array
+_HEADER = struct.Struct('<4sBB2xQQ')
+# The number of hashes is stored in a single byte
+MAX_HASHES = 255
+
+CAPACITY_ERROR = 'Capacity must be positive, found {0}.'
+ERROR_RATE_ERROR = 'Error rate must be between 0 and 1, found {0}.'
+SIZE_ERROR = 'Filters need at least 1 bit and between 1 and {0} hashes, found {1} bits and {2} hashes.'
+INCOMPATIBLE_FILTERS_ERROR = 'Filters of {0} bits with {1} hashes and {2} bits with {3} hashes cannot be combined.'
+NOT_SERIALIZED_ERROR = 'Data does not hold a serialized {0}.'
+
+def optimal_size(capacity, error_rate):
+    """ (number of bits, number of hashes) for a filter holding capacity keys at error_rate false positives """
+    if capacity <= 0:
+        raise ValueError(CAPACITY_ERROR.format(capacity))
+    if not 0 < error_rate < 1:
+        raise ValueError(ERROR_RATE_ERROR.format(error_rate))
+    num_bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+    num_hashes = max(1, int(round(num_bits / float(capacity) * math.log(2))))
+    return num_bits, num_hashes
+
+def _key_bytes(key):
+    if isinstance(key, bytes):
+        return key
+    if not isinstance(key, basestring):
+        key = str(key)
+    return key.encode('utf-8')
+
+class BloomFilter(object):
+    _MAGIC = b'PTBF'
+
+    def __init__(self, capacity = 1000, error_rate = 0.01, num_bits = None, num_hashes = None):
+        """
+        :param capacity: Number of keys the filter is expected to hold
+        :param error_rate: False positive rate wanted once it holds capacity keys
+        :param num_bits: Size the filter explicitly instead, with num_hashes, ignoring capacity and error_rate
+        :raises ValueError: If the filter would need more than MAX_HASHES hashes, for error rates below about 2 ** -255
+        """
+        if num_bits is None or num_hashes is None:
+            num_bits, num_hashes = optimal_size(capacity, error_rate)
+        if num_bits < 1 or not 1 <= num_hashes <= MAX_HASHES:
+            raise ValueError(SIZE_ERROR.format(MAX_HASHES, num_bits, num_hashes))
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.count = 0
+        self.lock = threading.Lock()
+        self._init_storage()
+
+    def _init_storage(self):
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key):
+        # Double hashing, the k positions are h1 + i * h2 for two halves of one digest. h2 is reduced to between 1 and
+        # num_bits - 1, a multiple of num_bits would put every position on the same bit
+        h1, h2 = struct.unpack('<QQ', hashlib.md5(_key_bytes(key)).digest())
+        num_bits = self.num_bits
+        h2 = h2 % (num_bits - 1) + 1 if num_bits > 1 else 0
+        return [ (h1 + i * h2) % num_bits for i in range(self.num_hashes) ]
+
+    def _set(self, positions):
+        """ Set positions, returning whether any of them were clear """
+        bits, changed = self.bits, False
+        for p in positions:
+            bit = 1 << (p & 7)
+            if not bits[p >> 3] & bit:
+                bits[p >> 3] |= bit
+                changed = True
+        return changed
+
+    def _test(self, positions):
+        bits = self.bits
+        for p in positions:
+            if not bits[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+    def add(self, key):
+        """ Add key, returning False if it may already have been present """
+        positions = self._positions(key)
+        with self.lock:
+            self.count += 1
+            return self._set(positions)
+
+    def add_many(self, keys):
+        positions = [ self._positions(key) for key in keys ]
+        with self.lock:
+            self.count += len(positions)
+            for p in positions:
+                self._set(p)
+
+    def __contains__(self, key):
+        return self._test(self._positions(key))
+
+    def contains_many(self, keys):
+        """ List of whether each of keys may be present """
+        test, positions = self._test, self._positions
+        return [ test(positions(key)) for key in keys ]
+
+    def __len__(self):
+        """ Number of keys added, including any added more than once """
+        return self.count
+
+    def false_positive_rate(self):
+        """ Expected false positive rate for the number of keys added so far """
+        return (1 - math.exp(-self.num_hashes * self.count / float(self.num_bits))) ** self.num_hashes
+
+    def _check_compatible(self, other):
+        if type(other) is not type(self):
+            return False
+        if (other.num_bits, other.num_hashes) != (self.num_bits, self.num_hashes):
+            raise ValueError(INCOMPATIBLE_FILTERS_ERROR.format(self.num_bits, self.num_hashes, other.num_bits,
+                                                               other.num_hashes))
+        return True
+
+    def _merge(self, other):
+        self.bits = bytearray(a | b for (a, b) in zip(self.bits, other.bits))
+
+    def copy(self):
+        result = type(self)(num_bits=self.num_bits, num_hashes=self.num_hashes)
+        result._load_storage(bytearray(self._storage()))
+        result.count = self.count
+        return result
+
+    def __or__(self, other):
+        if not self._check_compatible(other):
+            return NotImplemented
+        result = self.copy()
+        result |= other
+        return result
+
+    def __ior__(self, other):
+        if not self._check_compatible(other):
+            return NotImplemented
+        with self.lock:
+            self._merge(other)
+            self.count += other.count
+        return self
+
+    def union(self, *others):
+        result = self.copy()
+        for other in others:
+            result |= other
+        return result
+
+    def _storage(self):
+        return self.bits
+
+    def serialize(self):
+        return _HEADER.pack(self._MAGIC, VERSION, self.num_hashes, self.num_bits, self.count) + bytes(self._storage())
+
+    @classmethod
+    def deserialize(cls, data):
+        try:
+            magic, version, num_hashes, num_bits, count = _HEADER.unpack_from(data, 0)
+        except struct.error:
+            raise ValueError(NOT_SERIALIZED_ERROR.format(cls.__name__))
+        if magic != cls._MAGIC or version != VERSION:
+            raise ValueError(NOT_SERIALIZED_ERROR.format(cls.__name__))
+        result = cls(num_bits=num_bits, num_hashes=num_hashes)
+        storage = bytearray(data[_HEADER.size:])
+        if len(storage) != len(result._storage()):
+            raise ValueError(NOT_SERIALIZED_ERROR.format(cls.__name__))
+        result._load_storage(storage)
+        result.count = count
+        return result
+
+    def _load_storage(self, storage):
+        self.bits = storage
+
+class CountingBloomFilter(BloomFilter):
+    """
+    Bloom filter with an 8 bit counter per position rather than a single bit, so keys can be removed. A counter that
+    reaches 255 stays there, as it can no longer tell how many keys share it.
+    """
+    _MAGIC = b'PTCB'
+    MAX_COUNT = 255
+
+    def _init_storage(self):
+        self.counters = bytearray(self.num_bits)
+
+    def _set(self, positions):
+        counters, changed = self.counters, False
+        for p in positions:
+            if not counters[p]:
+                changed = True
+            if counters[p] < self.MAX_COUNT:
+                counters[p] += 1
+        return changed
+
+    def _test(self, positions):
+        counters = self.counters
+        for p in positions:
+            if not counters[p]:
+                return False
+        return True
+
+    def discard(self, key):
+        """
+        Remove key, returning whether it may have been present. Only remove keys that were added, removing a false
+        positive decrements counters that belong to other keys and can make them test as missing
+        """
+        positions = self._positions(key)
+        with self.lock:
+            if not self._test(positions):
+                return False
+            counters = self.counters
+            for p in positions:
+                if counters[p] < self.MAX_COUNT:
+                    counters[p] -= 1
+            self.count = max(0, self.count - 1)
+            return True
+
+    def remove(self, key):
+        if not self.discard(key):
+            raise KeyError(key)
+
+    def _merge(self, other):
+        self.counters = bytearray(min(a + b, self.MAX_COUNT) for (a, b) in zip(self.counters, other.counters))
+
+    def _storage(self):
+        return self.counters
+
+    def _load_storage(self, storage):
+        self.counters = storage
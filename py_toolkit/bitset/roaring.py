@@ -0,0 +1,686 @@
+#!/usr/bin/env python
+
+"""
+Compressed bitmap of unsigned 32 bit integers, for sets of ids far too large to hold as BitSet fields.
+
+Values are split into their high and low 16 bits, the high bits select a container holding the low bits of every value
+that shares them. Each container uses whichever of three representations suits its contents:
+
+    array   a sorted array of the low bits, used for up to 4096 values
+    bitmap  a 65536 bit integer, used for more than 4096 values
+    run     a list of (start, end) ranges, used where it is smaller than either of the above, see run_optimize()
+
+    ids = RoaringBitmap([1, 5, 70000])
+    ids.add_range(1000000, 2000000)
+    len(ids & other_ids)
+    ids.rank(70000)
+    3
+    ids.select(2)
+    70000
+
+serialize() produces the portable Roaring format shared with the other Roaring implementations
+(https://github.com/RoaringBitmap/RoaringFormatSpec). Bitmaps can be loaded from any buffer with deserialize(), or
+memory mapped from a file with open(), in both cases containers are only decoded when they are first used, so a
+membership test against a large file only reads the headers and a single container.
+"""
+
+import re
+import mmap
+import array
+import struct
+import bisect
+import binascii
+import itertools
+
+ARRAY_MAX_SIZE = 4096
+MAX_VALUE = 0xFFFFFFFF
+BITMAP_BYTES = 8192
+
+SERIAL_COOKIE_NO_RUNS = 12346
+SERIAL_COOKIE = 12347
+NO_OFFSET_THRESHOLD = 4
+
+VALUE_TYPE_ERROR = 'Expected int type, found {0} for {1}.'
+VALUE_RANGE_ERROR = '{0} is not in the range 0-{1}.'
+NOT_SERIALIZED_ERROR = 'Buffer does not hold a serialized roaring bitmap.'
+
+# Positions of the set bits of every byte value, for walking the bits of a bitmap container a byte at a time
+_BYTE_BITS = [ tuple(i for i in range(8) if b >> i & 1) for b in range(256) ]
+_NON_ZERO = re.compile(b'[^\x00]')
+
+if hasattr(int, 'from_bytes'):
+    def _bytes_to_int(data):
+        return int.from_bytes(data, 'little')
+
+    def _int_to_bytes(bits, length = BITMAP_BYTES):
+        return bits.to_bytes(length, 'little')
+else:
+    def _bytes_to_int(data):
+        return int(binascii.hexlify(bytes(bytearray(data)[::-1])), 16)
+
+    def _int_to_bytes(bits, length = BITMAP_BYTES):
+        return binascii.unhexlify('{0:x}'.format(bits).zfill(length * 2))[::-1]
+
+def _popcount(bits):
+    return bin(bits).count('1')
+
+def _int_values(bits, length = BITMAP_BYTES):
+    """ Positions of the set bits of bits, in ascending order """
+    data = _int_to_bytes(bits, length)
+    for match in _NON_ZERO.finditer(data):
+        base = match.start() << 3
+        for bit in _BYTE_BITS[ord(match.group())]:
+            yield base + bit
+
+def _values_to_int(values):
+    buf = bytearray(BITMAP_BYTES)
+    for v in values:
+        buf[v >> 3] |= 1 << (v & 7)
+    return _bytes_to_int(buf)
+
+def _runs_from_int(bits):
+    """ (start, end) pairs of every run of set bits, the bits that differ from their neighbour mark the edges """
+    edges = list(_int_values(bits ^ (bits << 1), BITMAP_BYTES + 1))
+    return [ (start, stop - 1) for (start, stop) in zip(edges[0::2], edges[1::2]) ]
+
+def _container_from_int(bits):
+    cardinality = _popcount(bits)
+    if not cardinality:
+        return None
+    if cardinality <= ARRAY_MAX_SIZE:
+        return ArrayContainer(array.array('H', _int_values(bits)))
+    return BitmapContainer(bits, cardinality)
+
+def _container_from_sorted(values):
+    if not values:
+        return None
+    if len(values) <= ARRAY_MAX_SIZE:
+        return ArrayContainer(array.array('H', values))
+    return BitmapContainer(_values_to_int(values), len(values))
+
+class ArrayContainer(object):
+    __slots__ = ('values',)
+
+    def __init__(self, values):
+        self.values = values
+
+    @property
+    def cardinality(self):
+        return len(self.values)
+
+    def copy(self):
+        return ArrayContainer(array.array('H', self.values))
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def contains(self, low):
+        i = bisect.bisect_left(self.values, low)
+        return i < len(self.values) and self.values[i] == low
+
+    def add(self, low):
+        """ Add low, returning the container to use from now on and whether low was added """
+        i = bisect.bisect_left(self.values, low)
+        if i < len(self.values) and self.values[i] == low:
+            return self, False
+        if len(self.values) == ARRAY_MAX_SIZE:
+            return BitmapContainer(self.to_int() | (1 << low), ARRAY_MAX_SIZE + 1), True
+        self.values.insert(i, low)
+        return self, True
+
+    def discard(self, low):
+        i = bisect.bisect_left(self.values, low)
+        if i < len(self.values) and self.values[i] == low:
+            self.values.pop(i)
+            return self, True
+        return self, False
+
+    def rank(self, low):
+        return bisect.bisect_right(self.values, low)
+
+    def select(self, i):
+        return self.values[i]
+
+    def minimum(self):
+        return self.values[0]
+
+    def maximum(self):
+        return self.values[-1]
+
+    def to_int(self):
+        return _values_to_int(self.values)
+
+    def serialize(self):
+        return struct.pack('<{0}H'.format(len(self.values)), *self.values)
+
+class BitmapContainer(object):
+    __slots__ = ('bits', 'cardinality')
+
+    def __init__(self, bits, cardinality):
+        self.bits = bits
+        self.cardinality = cardinality
+
+    def copy(self):
+        return BitmapContainer(self.bits, self.cardinality)
+
+    def __iter__(self):
+        return _int_values(self.bits)
+
+    def contains(self, low):
+        return bool(self.bits >> low & 1)
+
+    def add(self, low):
+        if self.contains(low):
+            return self, False
+        self.bits |= 1 << low
+        self.cardinality += 1
+        return self, True
+
+    def discard(self, low):
+        if not self.contains(low):
+            return self, False
+        self.bits &= ~(1 << low)
+        self.cardinality -= 1
+        if self.cardinality <= ARRAY_MAX_SIZE:
+            return ArrayContainer(array.array('H', self)), True
+        return self, True
+
+    def rank(self, low):
+        return _popcount(self.bits & ((2 << low) - 1))
+
+    def select(self, i):
+        return next(itertools.islice(iter(self), i, None))
+
+    def minimum(self):
+        return (self.bits & -self.bits).bit_length() - 1
+
+    def maximum(self):
+        return self.bits.bit_length() - 1
+
+    def to_int(self):
+        return self.bits
+
+    def serialize(self):
+        return _int_to_bytes(self.bits)
+
+class RunContainer(object):
+    __slots__ = ('runs',)
+
+    def __init__(self, runs):
+        """ :param runs: Sorted, non overlapping and non adjacent (start, end) pairs, end inclusive """
+        self.runs = runs
+
+    @property
+    def cardinality(self):
+        return sum(end - start + 1 for (start, end) in self.runs)
+
+    def copy(self):
+        return RunContainer(list(self.runs))
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(range(start, end + 1) for (start, end) in self.runs)
+
+    def contains(self, low):
+        i = bisect.bisect_right(self.runs, (low, 0x10000)) - 1
+        return i >= 0 and self.runs[i][1] >= low
+
+    def add(self, low):
+        # Runs are only built in bulk, individual updates go through one of the other representations
+        if self.contains(low):
+            return self, False
+        return _container_from_int(self.to_int() | (1 << low)), True
+
+    def discard(self, low):
+        if not self.contains(low):
+            return self, False
+        return _container_from_int(self.to_int() & ~(1 << low)), True
+
+    def rank(self, low):
+        count = 0
+        for (start, end) in self.runs:
+            if start > low:
+                break
+            count += min(end, low) - start + 1
+        return count
+
+    def select(self, i):
+        for (start, end) in self.runs:
+            if i <= end - start:
+                return start + i
+            i -= end - start + 1
+        raise IndexError(i)
+
+    def minimum(self):
+        return self.runs[0][0]
+
+    def maximum(self):
+        return self.runs[-1][1]
+
+    def to_int(self):
+        bits = 0
+        for (start, end) in self.runs:
+            bits |= ((1 << (end - start + 1)) - 1) << start
+        return bits
+
+    def serialize(self):
+        pairs = []
+        for (start, end) in self.runs:
+            pairs.extend((start, end - start))
+        return struct.pack('<H{0}H'.format(len(pairs)), len(self.runs), *pairs)
+
+def _runs_from_sorted(values):
+    runs = []
+    for value in values:
+        if runs and runs[-1][1] == value - 1:
+            runs[-1][1] = value
+        else:
+            runs.append([value, value])
+    return [ tuple(run) for run in runs ]
+
+def _optimized(container):
+    """ The smallest serialized representation of container, run containers included """
+    if isinstance(container, ArrayContainer):
+        runs = _runs_from_sorted(container.values)
+        return RunContainer(runs) if 2 + 4 * len(runs) < 2 * container.cardinality else container
+    bits = container.to_int()
+    runs = _runs_from_int(bits)
+    if 2 + 4 * len(runs) < min(2 * container.cardinality, BITMAP_BYTES):
+        return RunContainer(runs)
+    return _container_from_int(bits)
+
+def _combine(a, b, op):
+    """ Result of op on two containers, None if it is empty """
+    if isinstance(a, ArrayContainer) and isinstance(b, ArrayContainer):
+        if op == 'and':
+            b_values = set(b.values)
+            return _container_from_sorted([ v for v in a.values if v in b_values ])
+        elif op == 'sub':
+            b_values = set(b.values)
+            return _container_from_sorted([ v for v in a.values if v not in b_values ])
+        elif op == 'or':
+            return _container_from_sorted(sorted(set(a.values).union(b.values)))
+        return _container_from_sorted(sorted(set(a.values).symmetric_difference(b.values)))
+    x, y = a.to_int(), b.to_int()
+    if op == 'and':
+        return _container_from_int(x & y)
+    elif op == 'sub':
+        return _container_from_int(x & ~y)
+    elif op == 'or':
+        return _container_from_int(x | y)
+    return _container_from_int(x ^ y)
+
+def _equal(a, b):
+    if type(a) is type(b) and not isinstance(a, BitmapContainer):
+        return a.values == b.values if isinstance(a, ArrayContainer) else a.runs == b.runs
+    return a.to_int() == b.to_int()
+
+class _LazyContainer(object):
+    """ Location of a container in the buffer a bitmap was deserialized from, decoded on first use """
+    __slots__ = ('kind', 'offset', 'cardinality')
+
+    def __init__(self, kind, offset, cardinality):
+        self.kind = kind
+        self.offset = offset
+        self.cardinality = cardinality
+
+    def load(self, buf):
+        if self.kind == 'run':
+            count = struct.unpack_from('<H', buf, self.offset)[0]
+            pairs = struct.unpack_from('<{0}H'.format(2 * count), buf, self.offset + 2)
+            return RunContainer([ (start, start + length) for (start, length) in zip(pairs[0::2], pairs[1::2]) ])
+        if self.kind == 'array':
+            return ArrayContainer(array.array('H', struct.unpack_from('<{0}H'.format(self.cardinality), buf,
+                                                                      self.offset)))
+        return BitmapContainer(_bytes_to_int(buf[self.offset:self.offset + BITMAP_BYTES]), self.cardinality)
+
+def _check_value(value):
+    if not isinstance(value, (int, long)):
+        raise TypeError(VALUE_TYPE_ERROR.format(type(value), value))
+    if not 0 <= value <= MAX_VALUE:
+        raise ValueError(VALUE_RANGE_ERROR.format(value, MAX_VALUE))
+
+class RoaringBitmap(object):
+    def __init__(self, values = None):
+        """
+        :param values: Optional iterable of ints in the range 0 to 2**32 - 1 to add
+        """
+        self._keys = []
+        self._containers = []
+        self._source = None
+        self._mapping = None
+        if values is not None:
+            self.update(values)
+
+    def _get(self, i):
+        container = self._containers[i]
+        if isinstance(container, _LazyContainer):
+            container = self._containers[i] = container.load(self._source)
+        return container
+
+    def _find(self, high):
+        i = bisect.bisect_left(self._keys, high)
+        return i, i < len(self._keys) and self._keys[i] == high
+
+    def add(self, value):
+        _check_value(value)
+        high, low = value >> 16, value & 0xFFFF
+        i, found = self._find(high)
+        if found:
+            self._containers[i] = self._get(i).add(low)[0]
+        else:
+            self._keys.insert(i, high)
+            self._containers.insert(i, ArrayContainer(array.array('H', [low])))
+
+    def discard(self, value):
+        """ Remove value if present, returning whether it was """
+        if not isinstance(value, (int, long)) or not 0 <= value <= MAX_VALUE:
+            return False
+        i, found = self._find(value >> 16)
+        if not found:
+            return False
+        container, removed = self._get(i).discard(value & 0xFFFF)
+        if not container.cardinality:
+            del self._keys[i]
+            del self._containers[i]
+        else:
+            self._containers[i] = container
+        return removed
+
+    def remove(self, value):
+        if not self.discard(value):
+            raise KeyError(value)
+
+    def update(self, values):
+        """ Add every value of an iterable, sorting them first so each container is built in one go """
+        values = sorted(set(values))
+        if values:
+            _check_value(values[0])
+            _check_value(values[-1])
+        for (high, group) in itertools.groupby(values, lambda v: v >> 16):
+            self._merge(high, _container_from_sorted([ v & 0xFFFF for v in group ]))
+
+    def add_range(self, start, stop):
+        """ Add every value from start up to, but not including, stop """
+        if stop <= start:
+            return
+        _check_value(start)
+        _check_value(stop - 1)
+        for high in range(start >> 16, ((stop - 1) >> 16) + 1):
+            low_start = max(start, high << 16) & 0xFFFF
+            low_end = min(stop - 1, (high << 16) | 0xFFFF) & 0xFFFF
+            self._merge(high, RunContainer([ (low_start, low_end) ]))
+
+    def _merge(self, high, container):
+        i, found = self._find(high)
+        if found:
+            self._containers[i] = _combine(self._get(i), container, 'or')
+        else:
+            self._keys.insert(i, high)
+            self._containers.insert(i, container)
+
+    def __contains__(self, value):
+        if not isinstance(value, (int, long)) or not 0 <= value <= MAX_VALUE:
+            return False
+        i, found = self._find(value >> 16)
+        return found and self._get(i).contains(value & 0xFFFF)
+
+    def __len__(self):
+        return sum(c.cardinality for c in self._containers)
+
+    def __nonzero__(self):
+        return bool(self._keys)
+
+    __bool__ = __nonzero__
+
+    def __iter__(self):
+        for i, high in enumerate(self._keys):
+            base = high << 16
+            for low in self._get(i):
+                yield base | low
+
+    def __repr__(self):
+        values = list(itertools.islice(self, 10))
+        return 'RoaringBitmap([{0}{1}])'.format(', '.join(str(v) for v in values), ', ...' if len(self) > 10 else '')
+
+    def copy(self):
+        result = RoaringBitmap()
+        result._keys = list(self._keys)
+        result._containers = [ self._get(i).copy() for i in range(len(self._keys)) ]
+        return result
+
+    def __eq__(self, other):
+        if not isinstance(other, RoaringBitmap):
+            return NotImplemented
+        if self._keys != other._keys:
+            return False
+        return all(a.cardinality == b.cardinality for (a, b) in zip(self._containers, other._containers)) and \
+            all(_equal(self._get(i), other._get(i)) for i in range(len(self._keys)))
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def _binary(self, other, op):
+        if not isinstance(other, RoaringBitmap):
+            return NotImplemented
+        keep_left = op in ('or', 'xor', 'sub')
+        keep_right = op in ('or', 'xor')
+        result = RoaringBitmap()
+        keys, containers = result._keys, result._containers
+        i = j = 0
+        while i < len(self._keys) or j < len(other._keys):
+            left = self._keys[i] if i < len(self._keys) else None
+            right = other._keys[j] if j < len(other._keys) else None
+            if left is not None and left == right:
+                container = _combine(self._get(i), other._get(j), op)
+                if container is not None:
+                    keys.append(left)
+                    containers.append(container)
+                i += 1
+                j += 1
+            elif right is None or (left is not None and left < right):
+                if keep_left:
+                    keys.append(left)
+                    containers.append(self._get(i).copy())
+                i += 1
+            else:
+                if keep_right:
+                    keys.append(right)
+                    containers.append(other._get(j).copy())
+                j += 1
+        return result
+
+    def __or__(self, other):
+        return self._binary(other, 'or')
+
+    def __and__(self, other):
+        return self._binary(other, 'and')
+
+    def __sub__(self, other):
+        return self._binary(other, 'sub')
+
+    def __xor__(self, other):
+        return self._binary(other, 'xor')
+
+    def _replace(self, other):
+        if other is NotImplemented:
+            return other
+        self._keys, self._containers = other._keys, other._containers
+        return self
+
+    def __ior__(self, other):
+        return self._replace(self._binary(other, 'or'))
+
+    def __iand__(self, other):
+        return self._replace(self._binary(other, 'and'))
+
+    def __isub__(self, other):
+        return self._replace(self._binary(other, 'sub'))
+
+    def __ixor__(self, other):
+        return self._replace(self._binary(other, 'xor'))
+
+    def union(self, *others):
+        result = self.copy()
+        for other in others:
+            result |= other
+        return result
+
+    def intersection(self, *others):
+        result = self.copy()
+        for other in others:
+            result &= other
+        return result
+
+    def difference(self, *others):
+        result = self.copy()
+        for other in others:
+            result -= other
+        return result
+
+    def rank(self, value):
+        """ Number of values less than or equal to value """
+        high, low = value >> 16, value & 0xFFFF
+        count = 0
+        for (i, key) in enumerate(self._keys):
+            if key > high:
+                break
+            if key < high:
+                count += self._containers[i].cardinality
+            else:
+                count += self._get(i).rank(low)
+        return count
+
+    def select(self, index):
+        """ The value at position index in ascending order, starting from zero """
+        if index < 0:
+            index += len(self)
+        if index >= 0:
+            for (i, key) in enumerate(self._keys):
+                cardinality = self._containers[i].cardinality
+                if index < cardinality:
+                    return (key << 16) | self._get(i).select(index)
+                index -= cardinality
+        raise IndexError('RoaringBitmap index out of range')
+
+    def min(self):
+        if not self._keys:
+            raise ValueError('min() of an empty RoaringBitmap')
+        return (self._keys[0] << 16) | self._get(0).minimum()
+
+    def max(self):
+        if not self._keys:
+            raise ValueError('max() of an empty RoaringBitmap')
+        return (self._keys[-1] << 16) | self._get(len(self._keys) - 1).maximum()
+
+    def run_optimize(self):
+        """ Convert every container to its smallest representation, which may be a run container """
+        self._containers = [ _optimized(self._get(i)) for i in range(len(self._keys)) ]
+
+    def serialize(self):
+        """ The bitmap in the portable Roaring format """
+        containers = [ self._get(i) for i in range(len(self._keys)) ]
+        count = len(containers)
+        has_runs = any(isinstance(c, RunContainer) for c in containers)
+        parts = []
+        if has_runs:
+            flags = bytearray((count + 7) // 8)
+            for (i, c) in enumerate(containers):
+                if isinstance(c, RunContainer):
+                    flags[i // 8] |= 1 << (i % 8)
+            parts.append(struct.pack('<I', SERIAL_COOKIE | ((count - 1) << 16)))
+            parts.append(bytes(flags))
+        else:
+            parts.append(struct.pack('<II', SERIAL_COOKIE_NO_RUNS, count))
+        header = []
+        for (key, c) in zip(self._keys, containers):
+            header.extend((key, c.cardinality - 1))
+        parts.append(struct.pack('<{0}H'.format(len(header)), *header))
+        bodies = [ c.serialize() for c in containers ]
+        if not has_runs or count >= NO_OFFSET_THRESHOLD:
+            offset = sum(len(p) for p in parts) + 4 * count
+            offsets = []
+            for body in bodies:
+                offsets.append(offset)
+                offset += len(body)
+            parts.append(struct.pack('<{0}I'.format(count), *offsets))
+        parts.extend(bodies)
+        return b''.join(parts)
+
+    @classmethod
+    def deserialize(cls, buf):
+        """
+        Load a bitmap in the portable Roaring format from any buffer, bytes, bytearray or mmap for example. Only the
+        headers are read here, containers are decoded from buf when first used so it must stay valid until then.
+        """
+        try:
+            cookie = struct.unpack_from('<I', buf, 0)[0]
+            if cookie & 0xFFFF == SERIAL_COOKIE:
+                count = (cookie >> 16) + 1
+                flags = bytearray(buf[4:4 + (count + 7) // 8])
+                position = 4 + len(flags)
+            elif cookie == SERIAL_COOKIE_NO_RUNS:
+                count = struct.unpack_from('<I', buf, 4)[0]
+                flags = None
+                position = 8
+            else:
+                raise ValueError(NOT_SERIALIZED_ERROR)
+            header = struct.unpack_from('<{0}H'.format(2 * count), buf, position)
+            position += 4 * count
+            keys = list(header[0::2])
+            cardinalities = [ c + 1 for c in header[1::2] ]
+            kinds = [ 'run' if flags is not None and flags[i // 8] >> (i % 8) & 1 else
+                      'array' if cardinalities[i] <= ARRAY_MAX_SIZE else 'bitmap' for i in range(count) ]
+            if flags is None or count >= NO_OFFSET_THRESHOLD:
+                offsets = list(struct.unpack_from('<{0}I'.format(count), buf, position))
+            else:
+                offsets = []
+                for (kind, cardinality) in zip(kinds, cardinalities):
+                    offsets.append(position)
+                    if kind == 'run':
+                        position += 2 + 4 * struct.unpack_from('<H', buf, position)[0]
+                    elif kind == 'array':
+                        position += 2 * cardinality
+                    else:
+                        position += BITMAP_BYTES
+        except struct.error:
+            raise ValueError(NOT_SERIALIZED_ERROR)
+        result = cls()
+        result._keys = keys
+        result._containers = [ _LazyContainer(kind, offset, cardinality) for (kind, offset, cardinality)
+                               in zip(kinds, offsets, cardinalities) ]
+        result._source = buf
+        return result
+
+    def write(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.serialize())
+
+    @classmethod
+    def open(cls, path):
+        """
+        Memory map a serialized bitmap, containers are read from the file as they are used. Call close(), or use the
+        bitmap as a context manager, to release the mapping.
+        """
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        result = cls.deserialize(mapping)
+        result._mapping = mapping
+        return result
+
+    def close(self):
+        """ Release the mapping of a bitmap from open(), decoding any containers that haven't been used yet """
+        if self._mapping is not None:
+            for i in range(len(self._keys)):
+                self._get(i)
+            self._source = None
+            self._mapping.close()
+            self._mapping = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+
+"""
+Compact binary form for BitSets of any type, and file backed tables of them that are memory mapped rather than loaded.
+
+Every mask is written as a little endian unsigned integer of the smallest width, 1, 2, 4 or 8 bytes, that holds the
+type's max_val, after a header naming the type and its fields so a reader can check it is decoding what was written:
+
+    codec = BitSetCodec(Features)
+    data = codec.pack_many(features)
+    codec.unpack_many(data)
+
+    BitSetTable.create('features.bst', Features, features)
+    with BitSetTable.open('features.bst') as table:
+        table[1000000]
+        table.count(sip=True, users=False)
+
+The output of pack_many and a table file share the same layout:
+
+    magic 'PTBS', version, width in bytes, field count, length of the names, record count   ('<4sBBHIQ')
+    type name and field names, utf-8 and newline separated
+    padding up to a multiple of 8 bytes
+    the masks
+"""
+
+import mmap
+import struct
+
+from bitset import BitBase, BitSetTypeFactory, InvalidBitMaskValueError, InvalidBitMaskValueTypeError, \
+    UnknownFieldError
+
+MAGIC = b'PTBS'
+VERSION = 1
+WIDTH_FORMATS = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+_HEADER = struct.Struct('<4sBBHIQ')
+# Masks are read from tables in chunks of this many records when scanning
+_CHUNK = 4096
+
+TOO_MANY_FIELDS_ERROR = 'BitSets can be serialized with up to 64 fields, {0} has {1}.'
+NOT_SERIALIZED_ERROR = 'Data does not hold serialized BitSets.'
+UNSUPPORTED_VERSION_ERROR = 'Unsupported BitSet serialization version {0}.'
+SCHEMA_MISMATCH_ERROR = 'Serialized BitSets have fields {0}, expected {1}.'
+READ_ONLY_ERROR = 'BitSetTable {0} was opened read only.'
+
+class SchemaMismatchError(Exception):
+    def __init__(self, found, expected):
+        super(SchemaMismatchError, self).__init__(SCHEMA_MISMATCH_ERROR.format(found, expected))
+
+def mask_width(bitset_type):
+    """ Smallest number of bytes, 1, 2, 4 or 8, able to hold every mask of bitset_type """
+    for width in sorted(WIDTH_FORMATS):
+        if bitset_type.max_val < 1 << (8 * width):
+            return width
+    raise ValueError(TOO_MANY_FIELDS_ERROR.format(bitset_type.__name__, len(bitset_type.keys)))
+
+def _padded(length):
+    return (length + 7) & ~7
+
+def _encode_names(names):
+    return '\n'.join(names).encode('utf-8')
+
+def _decode_names(data):
+    names = bytes(data).decode('utf-8')
+    if str is bytes:
+        names = names.encode('utf-8')
+    return names.split('\n')
+
+def read_header(data):
+    """
+    Parse the header of serialized BitSets
+    :return: (type name, fields, width in bytes, record count, offset of the first mask)
+    """
+    try:
+        magic, version, width, field_count, names_length, count = _HEADER.unpack_from(data, 0)
+    except struct.error:
+        raise ValueError(NOT_SERIALIZED_ERROR)
+    if magic != MAGIC or width not in WIDTH_FORMATS:
+        raise ValueError(NOT_SERIALIZED_ERROR)
+    if version != VERSION:
+        raise ValueError(UNSUPPORTED_VERSION_ERROR.format(version))
+    names = _decode_names(data[_HEADER.size:_HEADER.size + names_length])
+    if len(names) != field_count + 1:
+        raise ValueError(NOT_SERIALIZED_ERROR)
+    return names[0], names[1:], width, count, _padded(_HEADER.size + names_length)
+
+class BitSetCodec(object):
+    def __init__(self, bitset_type):
+        """
+        :param bitset_type: BitSet type to serialize, from BitSetTypeFactory.createType or a BitSet instance's type
+        """
+        self.bitset_type = bitset_type
+        self.width = mask_width(bitset_type)
+        self.format = WIDTH_FORMATS[self.width]
+        self.mask_struct = struct.Struct('<' + self.format)
+        self._names = _encode_names([bitset_type.__name__] + list(bitset_type.keys))
+        self.header_size = _padded(_HEADER.size + len(self._names))
+
+    @classmethod
+    def from_header(cls, data, factory = None):
+        """ Codec for the type described by the header of data, the type is created with factory if given """
+        name, fields, _, _, _ = read_header(data)
+        return cls((factory or BitSetTypeFactory()).createType(name, fields))
+
+    def header(self, count):
+        header = _HEADER.pack(MAGIC, VERSION, self.width, len(self.bitset_type.keys), len(self._names), count)
+        return (header + self._names).ljust(self.header_size, b'\x00')
+
+    def _mask(self, value):
+        if isinstance(value, BitBase):
+            if value.keys != self.bitset_type.keys:
+                raise SchemaMismatchError(value.keys, self.bitset_type.keys)
+            return value.value()
+        if not isinstance(value, (int, long)):
+            raise InvalidBitMaskValueTypeError(value)
+        if not 0 <= value <= self.bitset_type.max_val:
+            raise InvalidBitMaskValueError(value, self.bitset_type.max_val)
+        return value
+
+    def pack_masks(self, values):
+        """ The masks of values, BitSets or ints, without a header """
+        masks = [ self._mask(v) for v in values ]
+        return struct.pack('<{0}{1}'.format(len(masks), self.format), *masks)
+
+    def pack(self, value):
+        return self.pack_many([value])
+
+    def pack_many(self, values):
+        """ Serialize an iterable of BitSets or int masks, header included """
+        body = self.pack_masks(values)
+        return self.header(len(body) // self.width) + body
+
+    def check(self, data):
+        """ Verify data holds BitSets of this codec's type, returning the record count and offset of the masks """
+        _, fields, width, count, offset = read_header(data)
+        if fields != self.bitset_type.keys or width != self.width:
+            raise SchemaMismatchError(fields, self.bitset_type.keys)
+        if offset + count * width > len(data):
+            raise ValueError(NOT_SERIALIZED_ERROR)
+        return count, offset
+
+    def unpack_masks(self, data, offset = 0, count = None):
+        """ int masks packed without a header, at offset in data """
+        if count is None:
+            count = (len(data) - offset) // self.width
+        elif offset + count * self.width > len(data):
+            raise ValueError(NOT_SERIALIZED_ERROR)
+        return list(struct.unpack_from('<{0}{1}'.format(count, self.format), data, offset))
+
+    def unpack(self, data):
+        values = self.unpack_many(data)
+        if len(values) != 1:
+            raise ValueError('Expected a single BitSet, found {0}.'.format(len(values)))
+        return values[0]
+
+    def unpack_many(self, data, as_ints = False):
+        """ Deserialize the output of pack_many, as BitSets or with as_ints as their int masks """
+        count, offset = self.check(data)
+        masks = self.unpack_masks(data, offset, count)
+        if as_ints:
+            return masks
+        from_mask = self.bitset_type.from_mask
+        return [ from_mask(m) for m in masks ]
+
+class BitSetTable(object):
+    """
+    Fixed length sequence of BitSets stored in a memory mapped file, only the records that are read are paged in
+    """
+    def __init__(self, path, codec, mapping, count, offset, writable):
+        self.path = path
+        self.codec = codec
+        self.bitset_type = codec.bitset_type
+        self._map = mapping
+        self._count = count
+        self._offset = offset
+        self.writable = writable
+        # Set once to_array has handed out a view of the mapping, which must then outlive the table
+        self._shared = False
+
+    @classmethod
+    def create(cls, path, bitset_type, values = None, size = 0):
+        """
+        Write a new table, holding values or size empty records, and open it for writing
+        """
+        codec = BitSetCodec(bitset_type)
+        body = codec.pack_masks(values) if values is not None else b'\x00' * (size * codec.width)
+        with open(path, 'wb') as f:
+            f.write(codec.header(len(body) // codec.width))
+            f.write(body)
+        return cls.open(path, bitset_type, writable=True)
+
+    @classmethod
+    def open(cls, path, bitset_type = None, writable = False, factory = None):
+        """
+        Map an existing table
+        :param bitset_type: Expected type of the records, by default a type is created from the fields in the file
+        :param writable: Allow records to be updated in place
+        :param factory: BitSetTypeFactory used to create the type when bitset_type isn't given
+        """
+        with open(path, 'r+b' if writable else 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        try:
+            codec = BitSetCodec(bitset_type) if bitset_type is not None else BitSetCodec.from_header(mapping, factory)
+            count, offset = codec.check(mapping)
+        except Exception:
+            mapping.close()
+            raise
+        return cls(path, codec, mapping, count, offset, writable)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Release the mapping. If to_array has been called the arrays it returned keep their own reference to it, so it is
+        only unmapped once the last of them has been garbage collected
+        """
+        if self._map is not None:
+            if self.writable:
+                self._map.flush()
+            if not self._shared:
+                self._map.close()
+            self._map = None
+
+    def flush(self):
+        self._map.flush()
+
+    def __len__(self):
+        return self._count
+
+    def _index(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError('BitSetTable index out of range')
+        return self._offset + index * self.codec.width
+
+    def mask(self, index):
+        return self.codec.mask_struct.unpack_from(self._map, self._index(index))[0]
+
+    def masks(self, start = 0, stop = None):
+        """ int masks of the records from start up to stop """
+        start, stop, _ = slice(start, stop).indices(self._count)
+        return self.codec.unpack_masks(self._map, self._offset + start * self.codec.width, max(stop - start, 0))
+
+    def __getitem__(self, index):
+        """ A single index returns a BitSet, a slice returns a list of them """
+        from_mask = self.bitset_type.from_mask
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._count)
+            if step == 1:
+                return [ from_mask(m) for m in self.masks(start, stop) ]
+            return [ from_mask(self.mask(i)) for i in range(start, stop, step) ]
+        return from_mask(self.mask(index))
+
+    def __setitem__(self, index, value):
+        if not self.writable:
+            raise TypeError(READ_ONLY_ERROR.format(self.path))
+        self.codec.mask_struct.pack_into(self._map, self._index(index), self.codec._mask(value))
+
+    def __iter__(self):
+        from_mask = self.bitset_type.from_mask
+        for start in range(0, self._count, _CHUNK):
+            for mask in self.masks(start, start + _CHUNK):
+                yield from_mask(mask)
+
+    def _condition(self, fields):
+        enabled = disabled = 0
+        for (field, state) in fields.items():
+            bit = self.bitset_type.field_masks.get(field)
+            if bit is None:
+                raise UnknownFieldError(field, self.bitset_type.keys)
+            if state:
+                enabled |= bit
+            else:
+                disabled |= bit
+        return enabled | disabled, enabled
+
+    def where(self, **fields):
+        """ Indices of the records where each field given as a keyword has the given state, e.g. where(sip=True) """
+        mask, expected = self._condition(fields)
+        for start in range(0, self._count, _CHUNK):
+            for (i, m) in enumerate(self.masks(start, start + _CHUNK)):
+                if m & mask == expected:
+                    yield start + i
+
+    def count(self, **fields):
+        """ Number of records matching where(**fields) """
+        return sum(1 for _ in self.where(**fields))
+
+    def to_array(self):
+        """
+        BitSetArray view of the records, sharing the mapping rather than copying it, the view stays valid after the table
+        is closed. Requires numpy
+        """
+        import numpy as np
+        from bitset_array import BitSetArray
+        masks = np.frombuffer(self._map, dtype=np.dtype('<u{0}'.format(self.codec.width)), count=self._count,
+                              offset=self._offset)
+        self._shared = True
+        return BitSetArray(self.bitset_type, masks, validate=False)
@@ -21,8 +21,11 @@ minimise the amount of time it is blocking other threads that have actual work t
 """
 
 import time
+import weakref
 import threading
 
+import metrics
+
 class CacheEntry(object):
     """
     CacheEntry that can track it's own access time
@@ -48,29 +51,35 @@ class CacheMonitor(threading.Thread):
         """
         super(CacheMonitor, self).__init__()
         self.daemon = True
-        self.cache = cache
+        # Only a weak reference, so the cache and its metrics can be collected, the thread exits once it has been
+        self.cache_ref = weakref.ref(cache)
         self.prune_interval = prune_interval
 
     def run(self):
         while True:
             prune_time = time.time()
+            cache = self.cache_ref()
+            if cache is None:
+                return
             # Get a list of items that have potentially expired, without the lock
             expired_items = [k for k,v in filter(lambda (key,value) : value.expired(prune_time,
-                                                                                    self.cache.expiry_time_secs),
-                                                 self.cache.cache_items.viewitems())]
+                                                                                    cache.expiry_time_secs),
+                                                 cache.cache_items.viewitems())]
             for k in expired_items:
                 # For each potential, get the lock, check the key still exists, check it's still expired
                 # if it's still viable for expiration then delete the key
-                with self.cache.lock:
-                    if k in self.cache.cache_items and self.cache.cache_items[k].expired(prune_time, self.cache.expiry_time_secs):
-                        del self.cache.cache_items[k]
+                with cache.lock:
+                    if k in cache.cache_items and cache.cache_items[k].expired(prune_time, cache.expiry_time_secs):
+                        del cache.cache_items[k]
                 # Yield to any actual activity
                 time.sleep(0)
+            # Don't keep the cache alive while sleeping
+            cache = None
             # Sleep until the next interval is due, or continue if we took too long (really unlikely)
             time.sleep(max(0, self.prune_interval - (time.time() - prune_time)))
 
 class Cache(object):
-    def __init__(self, expiry_time_secs=1800, refresh_expiry_on_read=False, prune_interval=600):
+    def __init__(self, expiry_time_secs=1800, refresh_expiry_on_read=False, prune_interval=600, name=None):
         """
         Create a cache instance, with an expiry time, default of 30 minutes, and specify if reading the record extends
         the expiry time or not. Default behaviour is to not extend expiry times on reading. And specify the interval 
@@ -78,14 +87,31 @@ class Cache(object):
         :param expiry_time_secs: 
         :param refresh_expiry_on_read: 
         :param prune_interval: Number of seconds between pruning thread loops
+        :param name: Label for the cache's metrics, defaults to the class name, caches sharing a name share metrics
         """
         self.refresh_expiry_on_read = refresh_expiry_on_read
         self.expiry_time_secs = expiry_time_secs
         self.cache_items = {}
         self.lock = threading.RLock()
+        self.name = name or type(self).__name__
+        self._register_metrics()
         self.prune_thread = CacheMonitor(self, prune_interval)
         self.prune_thread.start()
 
+    def _register_metrics(self):
+        # The series are unregistered once every cache sharing the name has been garbage collected
+        labels = {"cache": self.name}
+        self.hits = metrics.registry.counter("py_toolkit_cache_hits_total", "Lookups served from the cache", labels,
+                                             owner=self)
+        self.misses = metrics.registry.counter("py_toolkit_cache_misses_total", "Lookups that called on_miss, "
+                                               "including reloads of expired entries", labels, owner=self)
+        self.load_time = metrics.registry.histogram("py_toolkit_cache_load_seconds", "Time spent in on_miss", labels,
+                                                    owner=self)
+        hits, misses = self.hits, self.misses
+        metrics.registry.gauge("py_toolkit_cache_hit_ratio", "Share of lookups served from the cache", labels,
+                               owner=self).set_function(lambda: hits.value / float(max(1, hits.value + misses.value)))
+        metrics.registry.gauge("py_toolkit_cache_entries", "Entries held", labels, owner=self).track(self, len)
+
     def __len__(self):
         return len(self.cache_items)
 
@@ -102,10 +128,12 @@ class Cache(object):
         """
         with self.lock:
             now = time.time()
-            if not key in self.cache_items:
-                self.cache_items[key] = CacheEntry(self.on_miss(key))
-            elif self.cache_items[key].expired(now, self.expiry_time_secs):
-                self.cache_items[key] = CacheEntry(self.on_miss(key))
+            if not key in self.cache_items or self.cache_items[key].expired(now, self.expiry_time_secs):
+                self.misses.inc()
+                with self.load_time.time():
+                    self.cache_items[key] = CacheEntry(self.on_miss(key))
+            else:
+                self.hits.inc()
             return self.cache_items[key].get_value(self.refresh_expiry_on_read)
 
     def on_miss(self, key):
@@ -0,0 +1,432 @@
+# -*- coding: utf-8 -*-
+
+"""
+Provide a registry of counters, gauges and histograms, safe to update from hot paths, with export of a snapshot as
+Prometheus text or JSON.
+
+    requests = metrics.registry.counter("myapp_requests_total", "Requests handled", labels={"handler": "search"})
+    latency = metrics.registry.histogram("myapp_request_seconds", "Request latency")
+    with latency.time():
+        requests.inc()
+        handle()
+
+    metrics.enable()
+    metrics.registry.write("/var/lib/node_exporter/myapp.prom")
+    server = metrics.registry.serve(9100)
+
+Cache, ThreadPool and AtomicInt register their own metrics with the default registry:
+
+    py_toolkit_cache_hits_total, py_toolkit_cache_misses_total, py_toolkit_cache_hit_ratio, py_toolkit_cache_entries,
+    py_toolkit_cache_load_seconds, labelled by cache name
+    py_toolkit_threadpool_queue_depth, py_toolkit_threadpool_tasks_total, labelled by pool label
+    py_toolkit_lock_contended_total, py_toolkit_lock_wait_seconds, for the locks of AtomicInts
+
+The cache and pool series are owned by the instances that registered them, and unregistered once no live instance
+shares their labels, as a ThreadPool is shut down or a Cache or ThreadPool is garbage collected, so short lived
+instances with distinct names don't grow the registry. Any metric can be owned the same way by passing owner=, and
+release(owner) gives it up explicitly.
+
+The default registry starts disabled, updates then only check a flag and return. enable() switches it on, it also wraps
+the lock of every AtomicInt created from then on to time how long callers wait for it, an uncontended acquire stays a
+single non-blocking attempt. Counters are StripedAdders and histogram buckets an AtomicCounterArray, so concurrent
+updates rarely contend with each other.
+"""
+
+import os
+import sys
+import json
+import bisect
+import timeit
+import weakref
+import tempfile
+import threading
+
+import atomic
+from atomic import AtomicCounterArray, StripedAdder
+
+if sys.version_info.major < 3:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+else:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+
+timer = timeit.default_timer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOCK_WAIT_BUCKETS = (1e-06, 1e-05, 0.0001, 0.001, 0.01, 0.1, 1.0)
+
+METRIC_TYPE_ERROR = "Metric {0} is already registered as a {1}."
+EXPORT_FORMAT_ERROR = "Export format must be one of {0}, found {1}."
+
+class Metric(object):
+    TYPE = None
+
+    def __init__(self, name, help="", labels=None, enabled=True):
+        self.name = name
+        self.help = help
+        self.labels = dict(labels or {})
+        self.enabled = enabled
+
+class Counter(Metric):
+    """ Monotonically increasing count """
+    TYPE = "counter"
+
+    def __init__(self, name, help="", labels=None, enabled=True):
+        super(Counter, self).__init__(name, help, labels, enabled)
+        self._adder = StripedAdder()
+
+    def inc(self, amount=1):
+        if self.enabled:
+            self._adder.add(amount)
+
+    @property
+    def value(self):
+        return self._adder.sum()
+
+class Gauge(Metric):
+    """
+    Value that goes up and down, either set directly or computed when collected from a function or from tracked
+    objects, which are only held weakly
+    """
+    TYPE = "gauge"
+
+    def __init__(self, name, help="", labels=None, enabled=True):
+        super(Gauge, self).__init__(name, help, labels, enabled)
+        self._value = 0
+        self._lock = threading.Lock()
+        self._function = None
+        self._tracked = weakref.WeakKeyDictionary()
+
+    def set(self, value):
+        if self.enabled:
+            with self._lock:
+                self._value = value
+
+    def inc(self, amount=1):
+        if self.enabled:
+            with self._lock:
+                self._value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set_function(self, function):
+        """ Report function() as the value """
+        self._function = function
+
+    def track(self, obj, function):
+        """ Add function(obj) to the value for as long as obj is alive """
+        with self._lock:
+            self._tracked[obj] = function
+
+    @property
+    def value(self):
+        if self._function is not None:
+            return self._function()
+        with self._lock:
+            tracked = list(self._tracked.items())
+            value = self._value
+        return value + sum(function(obj) for (obj, function) in tracked)
+
+class Histogram(Metric):
+    """ Distribution of observed values over fixed buckets, each bucket counts the values less or equal to its bound """
+    TYPE = "histogram"
+
+    def __init__(self, name, help="", labels=None, enabled=True, buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, help, labels, enabled)
+        self.buckets = tuple(sorted(buckets))
+        # One count per bucket plus a final one for values above the last bound
+        self._counts = AtomicCounterArray(len(self.buckets) + 1)
+        self._sum = StripedAdder(0.0)
+
+    def observe(self, value):
+        if self.enabled:
+            self._counts.add(bisect.bisect_left(self.buckets, value))
+            self._sum.add(value)
+
+    def time(self):
+        """ Context manager observing the time spent in its block, in seconds """
+        return _Timer(self)
+
+    def snapshot(self):
+        """ (cumulative bucket counts keyed by upper bound, sum, count) """
+        counts = self._counts.snapshot()
+        cumulative, total = [], 0
+        for (bound, count) in zip(self.buckets + (float("inf"),), counts):
+            total += count
+            cumulative.append((bound, total))
+        return cumulative, self._sum.sum(), total
+
+    @property
+    def value(self):
+        cumulative, total_sum, count = self.snapshot()
+        return {"buckets": cumulative, "sum": total_sum, "count": count}
+
+class _Timer(object):
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.started = None
+
+    def __enter__(self):
+        if self.histogram.enabled:
+            self.started = timer()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.started is not None:
+            self.histogram.observe(timer() - self.started)
+
+class ContentionTimedLock(object):
+    """
+    Wraps a Lock or RLock, counting the acquires that had to wait and how long they waited. An uncontended acquire is a
+    single non-blocking attempt on the wrapped lock.
+    """
+    __slots__ = ("lock", "contended", "wait_time")
+
+    def __init__(self, lock, contended, wait_time):
+        self.lock = lock
+        self.contended = contended
+        self.wait_time = wait_time
+
+    def acquire(self, blocking=True):
+        if self.lock.acquire(False):
+            return True
+        if not blocking:
+            return False
+        started = timer()
+        self.lock.acquire()
+        self.contended.inc()
+        self.wait_time.observe(timer() - started)
+        return True
+
+    def release(self):
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.lock.release()
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join("{0}=\"{1}\"".format(k, _escape(v)) for (k, v) in sorted(labels.items())) + "}"
+
+class Registry(object):
+    FORMATS = ("prometheus", "json")
+
+    def __init__(self, enabled=True):
+        """
+        Collection of metrics, keyed by name and labels
+        :param enabled: Whether updates to the metrics are recorded, see enable() and disable()
+        """
+        self.enabled = enabled
+        self._metrics = {}
+        # Keys of the metrics held by each owner, by id(owner) along with a weak reference to it, and the number of
+        # owners of each owned metric
+        self._owned = {}
+        self._owner_counts = {}
+        # ids of owners collected without being released, weakref callbacks can run while _lock is held so they only
+        # queue the id here for the next registry call to release
+        self._collected = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, metric_type, name, help, labels, owner=None, **kwargs):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._release_collected()
+            metric = self._metrics.get(key)
+            if metric is None:
+                for (other_name, _), other in self._metrics.items():
+                    if other_name == name and type(other) is not metric_type:
+                        raise ValueError(METRIC_TYPE_ERROR.format(name, other.TYPE))
+                metric = self._metrics[key] = metric_type(name, help, labels, self.enabled, **kwargs)
+            elif type(metric) is not metric_type:
+                raise ValueError(METRIC_TYPE_ERROR.format(name, metric.TYPE))
+            if owner is not None:
+                self._add_owner(key, owner)
+            return metric
+
+    def counter(self, name, help="", labels=None, owner=None):
+        """
+        The counter called name with the given labels, created on first use
+        :param owner: Object the metric belongs to, it is unregistered once every owner has been released or collected
+        """
+        return self._get_or_create(Counter, name, help, labels, owner)
+
+    def gauge(self, name, help="", labels=None, owner=None):
+        return self._get_or_create(Gauge, name, help, labels, owner)
+
+    def histogram(self, name, help="", labels=None, buckets=DEFAULT_BUCKETS, owner=None):
+        return self._get_or_create(Histogram, name, help, labels, owner, buckets=buckets)
+
+    def unregister(self, name, labels=None):
+        with self._lock:
+            key = (name, tuple(sorted((labels or {}).items())))
+            self._metrics.pop(key, None)
+            self._owner_counts.pop(key, None)
+
+    def _add_owner(self, key, owner):
+        owner_id = id(owner)
+        if owner_id not in self._owned:
+            collected = self._collected
+            self._owned[owner_id] = (weakref.ref(owner, lambda _: collected.append(owner_id)), set())
+        keys = self._owned[owner_id][1]
+        if key not in keys:
+            keys.add(key)
+            self._owner_counts[key] = self._owner_counts.get(key, 0) + 1
+
+    def release(self, owner):
+        """ Give up owner's metrics, unregistering those no other live owner holds """
+        with self._lock:
+            self._release_collected()
+            self._release(id(owner))
+
+    def _release(self, owner_id):
+        _, keys = self._owned.pop(owner_id, (None, ()))
+        for key in keys:
+            count = self._owner_counts.get(key, 0) - 1
+            if count > 0:
+                self._owner_counts[key] = count
+            else:
+                self._owner_counts.pop(key, None)
+                self._metrics.pop(key, None)
+
+    def _release_collected(self):
+        while self._collected:
+            self._release(self._collected.pop())
+
+    def enable(self):
+        self._set_enabled(True)
+
+    def disable(self):
+        self._set_enabled(False)
+
+    def _set_enabled(self, enabled):
+        with self._lock:
+            self.enabled = enabled
+            for metric in self._metrics.values():
+                metric.enabled = enabled
+
+    def collect(self):
+        """ Every registered metric, ordered by name then labels """
+        with self._lock:
+            self._release_collected()
+            return [self._metrics[key] for key in sorted(self._metrics)]
+
+    def to_prometheus(self):
+        """ Snapshot in the Prometheus text exposition format """
+        lines, described = [], set()
+        for metric in self.collect():
+            if metric.name not in described:
+                described.add(metric.name)
+                help = metric.help.replace("\\", "\\\\").replace("\n", "\\n")
+                lines.append("# HELP {0} {1}".format(metric.name, help))
+                lines.append("# TYPE {0} {1}".format(metric.name, metric.TYPE))
+            labels = _format_labels(metric.labels)
+            if isinstance(metric, Histogram):
+                cumulative, total_sum, count = metric.snapshot()
+                for (bound, bucket_count) in cumulative:
+                    bucket_labels = _format_labels(dict(metric.labels, le=_format_value(bound)))
+                    lines.append("{0}_bucket{1} {2}".format(metric.name, bucket_labels, bucket_count))
+                lines.append("{0}_sum{1} {2}".format(metric.name, labels, _format_value(total_sum)))
+                lines.append("{0}_count{1} {2}".format(metric.name, labels, count))
+            else:
+                lines.append("{0}{1} {2}".format(metric.name, labels, _format_value(metric.value)))
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self):
+        """ Snapshot as a list of dicts, one per metric, histogram values hold their buckets, sum and count """
+        result = []
+        for metric in self.collect():
+            value = metric.value
+            if isinstance(metric, Histogram):
+                value = dict(value, buckets=[[_format_value(bound), count] for (bound, count) in value["buckets"]])
+            result.append({"name": metric.name, "type": metric.TYPE, "help": metric.help, "labels": metric.labels,
+                           "value": value})
+        return result
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2, sort_keys=True)
+
+    def export(self, format="prometheus"):
+        if format not in self.FORMATS:
+            raise ValueError(EXPORT_FORMAT_ERROR.format(self.FORMATS, format))
+        return self.to_prometheus() if format == "prometheus" else self.to_json()
+
+    def write(self, path, format="prometheus"):
+        """ Write a snapshot to path, replacing it in one step so readers never see a partial file """
+        output = self.export(format)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".metrics.")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(output)
+            os.rename(temp_path, path)
+        except Exception:
+            os.unlink(temp_path)
+            raise
+
+    def serve(self, port=0, host="127.0.0.1"):
+        """
+        Serve snapshots over HTTP from a daemon thread, Prometheus text at /metrics and JSON at /metrics.json
+        :param port: Port to listen on, 0 picks a free one, see server_address of the returned server
+        :return: The HTTPServer, call shutdown() and server_close() on it to stop serving
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path == "/metrics":
+                    body, content_type = registry.to_prometheus(), "text/plain; version=0.0.4"
+                elif path == "/metrics.json":
+                    body, content_type = registry.to_json(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                body = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = HTTPServer((host, port), Handler)
+        thread = threading.Thread(target=server.serve_forever, name="Metrics-Server")
+        thread.daemon = True
+        thread.start()
+        return server
+
+registry = Registry(enabled=False)
+
+def _timed_lock(lock):
+    return ContentionTimedLock(lock, _lock_contended, _lock_wait_time)
+
+_lock_contended = registry.counter("py_toolkit_lock_contended_total", "AtomicInt lock acquires that had to wait",
+                                   labels={"lock": "AtomicInt"})
+_lock_wait_time = registry.histogram("py_toolkit_lock_wait_seconds", "Time spent waiting for contended AtomicInt locks",
+                                     labels={"lock": "AtomicInt"}, buckets=LOCK_WAIT_BUCKETS)
+
+def enable():
+    """ Enable the default registry, and lock wait timing for AtomicInts created from now on """
+    registry.enable()
+    atomic.lock_wrapper = _timed_lock
+
+def disable():
+    """ Disable the default registry, AtomicInts created from now on use their lock directly """
+    registry.disable()
+    atomic.lock_wrapper = None
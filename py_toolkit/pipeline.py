@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+
+"""
+Provide a streaming pipeline made up of ThreadPool stages connected by bounded buffers.
+
+Each stage applies a function to every item passing through it using its own pool of workers, the buffers between the
+stages are bounded so a slow stage blocks the stages in front of it all the way back to the input, rather than letting
+items pile up in memory.
+
+    pipeline = Pipeline(buffer_size=100)
+    pipeline.add_stage(parse, num_threads=2).add_stage(store, num_threads=8)
+    with pipeline.run(read_lines()) as results:
+        for result in results:
+            print(result)
+        print(results.metrics())
+
+The input can be any iterable, including a generator, and is only consumed as fast as the pipeline drains it. Results
+are produced lazily as they leave the last stage, in completion order by default or in input order if the pipeline is
+created with ordered=True.
+
+If a stage raises, the pipeline is cancelled and the exception is re-raised to the consumer. A consumer that stops
+iterating early should close the run, directly or with a with block, so the stage threads are released.
+"""
+
+import sys
+import time
+import heapq
+import threading
+
+from atomic import AtomicInt, increment, decrement
+from suppress import suppress
+from threadpool import ThreadPool
+
+if sys.version_info.major < 3:
+    from Queue import Queue, Empty, Full
+else:
+    from queue import Queue, Empty, Full
+
+# End of stream marker passed down the buffers once the input is exhausted
+_END = object()
+
+class StageMetrics(object):
+    """
+    Throughput and latency figures for a single stage of a pipeline run
+    """
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self.max_latency = 0.0
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def record(self, started, finished, failed=False):
+        latency = finished - started
+        with self._lock:
+            if failed:
+                self.errors += 1
+            else:
+                self.items += 1
+            self.busy_time += latency
+            self.max_latency = max(self.max_latency, latency)
+            self.started = started if self.started is None else min(self.started, started)
+            self.finished = finished if self.finished is None else max(self.finished, finished)
+
+    @property
+    def throughput(self):
+        """ Items processed per second between the stage starting its first item and finishing its last """
+        with self._lock:
+            if not self.items:
+                return 0.0
+            return self.items / max(self.finished - self.started, 1e-9)
+
+    @property
+    def mean_latency(self):
+        with self._lock:
+            return self.busy_time / (self.items + self.errors) if self.items + self.errors else 0.0
+
+    def as_dict(self):
+        throughput, mean_latency = self.throughput, self.mean_latency
+        with self._lock:
+            return {"name": self.name, "items": self.items, "errors": self.errors, "throughput": throughput,
+                    "mean_latency": mean_latency, "max_latency": self.max_latency, "busy_time": self.busy_time}
+
+class Stage(object):
+    def __init__(self, func, num_threads=1, buffer_size=None, name=None):
+        """
+        A single step of a pipeline
+        :param func: Callable applied to every item, its return value is passed on to the next stage
+        :param num_threads: Number of workers running func
+        :param buffer_size: Size of the buffer feeding this stage, defaults to the pipeline buffer size
+        :param name: Label used for the worker threads and the metrics, defaults to the name of func
+        """
+        self.func = func
+        self.num_threads = num_threads
+        self.buffer_size = buffer_size
+        self.name = name or getattr(func, "__name__", "stage")
+
+class Pipeline(object):
+    def __init__(self, buffer_size=64, ordered=False):
+        """
+        Create an empty pipeline, stages are then added in the order items should pass through them
+        :param buffer_size: Default number of items each buffer between stages can hold before blocking the producer
+        :param ordered: Yield results in the same order as the input rather than the order they complete in
+        """
+        self.buffer_size = buffer_size
+        self.ordered = ordered
+        self.stages = []
+
+    def add_stage(self, func, num_threads=1, buffer_size=None, name=None):
+        """ Append a stage to the pipeline, returns the pipeline so calls can be chained """
+        self.stages.append(Stage(func, num_threads, buffer_size, name or "{0}-{1}".format(
+            getattr(func, "__name__", "stage"), len(self.stages))))
+        return self
+
+    def run(self, iterable):
+        """ Stream iterable through the pipeline, returning a lazy iterator over the results """
+        if not self.stages:
+            raise ValueError("Cannot run a pipeline with no stages")
+        return PipelineRun(self, iterable)
+
+class PipelineRun(object):
+    """
+    A single pass of an iterable through a pipeline, threads are only started once the first result is requested
+    """
+    def __init__(self, pipeline, iterable):
+        self.stages = list(pipeline.stages)
+        self.ordered = pipeline.ordered
+        self.stage_metrics = [StageMetrics(stage.name) for stage in self.stages]
+        self.iterable = iterable
+        self.buffers = [Queue(stage.buffer_size or pipeline.buffer_size) for stage in self.stages]
+        self.buffers.append(Queue(pipeline.buffer_size))
+        self.pools = []
+        self.error = None
+        self.error_raised = False
+        self.started = False
+        self.finished = False
+        self.cancelled = threading.Event()
+        self.active = AtomicInt()
+        # Ordered runs hold completed items back until their predecessors arrive, cap the number of items in flight
+        # at what the buffers and workers can hold so the reordering heap can't grow without bound
+        self.in_flight = None
+        if self.ordered:
+            self.in_flight = threading.Semaphore(sum(b.maxsize for b in self.buffers) +
+                                                 sum(s.num_threads for s in self.stages))
+        self.pending = []
+        self.next_seq = 0
+
+    def __iter__(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def metrics(self):
+        """ Per stage metrics for this run, in pipeline order """
+        return [m.as_dict() for m in self.stage_metrics]
+
+    def next(self):
+        if not self.started:
+            self._start()
+        while True:
+            if self.error is not None and not self.error_raised:
+                self.finished = self.error_raised = True
+                raise self.error
+            if self.pending and (self.finished or self.pending[0][0] == self.next_seq):
+                seq, value = heapq.heappop(self.pending)
+                self.next_seq += 1
+                self.in_flight.release()
+                return value
+            if self.finished:
+                raise StopIteration()
+            item = self.buffers[-1].get()
+            if item is _END:
+                self.finished = True
+            elif self.ordered:
+                heapq.heappush(self.pending, item)
+            else:
+                return item[1]
+
+    __next__ = next
+
+    def close(self):
+        """ Stop the run, discarding anything still in flight """
+        if self.started and not self.finished:
+            self._cancel()
+        self.finished = True
+
+    def _start(self):
+        self.started = True
+        for i, stage in enumerate(self.stages):
+            self.pools.append(ThreadPool(stage.num_threads, label=stage.name))
+        for i, stage in enumerate(self.stages):
+            remaining = AtomicInt(stage.num_threads)
+            for _ in range(stage.num_threads):
+                increment(self.active)
+                self.pools[i].enqueue(self._work, i, remaining)
+        increment(self.active)
+        feeder = threading.Thread(target=self._feed, name="Pipeline-Feeder")
+        feeder.daemon = True
+        feeder.start()
+
+    def _feed(self):
+        try:
+            for seq, value in enumerate(self.iterable):
+                if self.in_flight is not None:
+                    self.in_flight.acquire()
+                if self.cancelled.is_set():
+                    return
+                self.buffers[0].put((seq, value))
+            self.buffers[0].put(_END)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            decrement(self.active)
+
+    def _work(self, index, remaining):
+        inbox, outbox = self.buffers[index], self.buffers[index + 1]
+        func, metrics = self.stages[index].func, self.stage_metrics[index]
+        try:
+            while not self.cancelled.is_set():
+                item = inbox.get()
+                if item is _END:
+                    # Put the marker back so the other workers of this stage see the end of the stream too
+                    inbox.put(_END)
+                    break
+                if self.cancelled.is_set():
+                    break
+                seq, value = item
+                started = time.time()
+                try:
+                    result = func(value)
+                except Exception as e:
+                    metrics.record(started, time.time(), failed=True)
+                    self._fail(e)
+                    break
+                metrics.record(started, time.time())
+                outbox.put((seq, result))
+        finally:
+            # The last worker out of a stage passes the end of the stream on to the next one and retires the pool
+            if decrement(remaining) == 0:
+                if not self.cancelled.is_set():
+                    outbox.put(_END)
+                self.pools[index].shutdown(wait=False)
+            decrement(self.active)
+
+    def _fail(self, error):
+        if self.error is None:
+            self.error = error
+        self._cancel()
+
+    def _cancel(self):
+        if self.cancelled.is_set():
+            return
+        self.cancelled.set()
+        reaper = threading.Thread(target=self._reap, name="Pipeline-Reaper")
+        reaper.daemon = True
+        reaper.start()
+
+    def _reap(self):
+        """
+        Unblock every thread of a cancelled run, emptying the buffers frees anyone stuck on a put and the end markers
+        wake anyone stuck on a get, they then see the cancellation and exit.
+        """
+        while True:
+            for buffer in self.buffers:
+                with suppress(Empty):
+                    while True:
+                        buffer.get_nowait()
+                with suppress(Full):
+                    buffer.put_nowait(_END)
+            if self.in_flight is not None:
+                self.in_flight.release()
+            if self.active == 0:
+                break
+            time.sleep(0.01)
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+
+"""
+Provide an AtomicInt that lives in shared memory, so it can be used by every process on the host that attaches to it
+by name
+
+    # Process A
+    quota = SharedAtomicInt("quota", value=1000, width=32, overflow="raise")
+
+    # Process B
+    quota = SharedAtomicInt("quota")
+    if quota.add_and_get(-1) < 0:
+        ...
+
+The first process to attach creates the counter with the given value, width and overflow behaviour, later ones pick
+those up from the shared segment, passing a different width or overflow to them is an error. The counter is a fixed
+width signed integer, results that don't fit are handled according to overflow:
+
+    wrap      Two's complement wrap around, like a C integer
+    raise     Raise an OverflowError, leaving the value unchanged
+    saturate  Clamp to the minimum or maximum value
+
+Every operation of AtomicInt is supported, updates are atomic across processes as well as threads. Operators that
+return a new value, a + 1 for example, return a regular process local AtomicInt.
+
+The segment stays in place until unlink() is called, even after every process has closed it. POSIX only, the segment is
+a file under /dev/shm, or the temporary directory where that doesn't exist, locked with fcntl record locks.
+"""
+
+import os
+import mmap
+import struct
+import tempfile
+import threading
+
+from atomic import AtomicInt
+from suppress import suppress
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+SEGMENT_PREFIX = "py_toolkit.atomic."
+
+WIDTH_FORMATS = {8: "<b", 16: "<h", 32: "<i", 64: "<q"}
+OVERFLOW_MODES = ("wrap", "raise", "saturate")
+
+_MAGIC = b"PTAI"
+# Magic, width in bits, overflow mode, then the value at offset 8
+_HEADER = struct.Struct("<4sBB2x")
+_SEGMENT_SIZE = 16
+
+WIDTH_ERROR = "Width must be one of {0}, found {1}."
+OVERFLOW_MODE_ERROR = "Overflow must be one of {0}, found {1}."
+MISMATCH_ERROR = "Shared counter {0} has {1} {2}, not {3}."
+CORRUPT_SEGMENT_ERROR = "{0} is not a shared counter segment."
+OVERFLOW_ERROR = "{0} does not fit in a signed {1} bit integer."
+
+# Segments mapped by this process, keyed by path, so every SharedAtomicInt attached to a name shares one mapping and lock
+_segments = {}
+_segments_lock = threading.Lock()
+
+def segment_path(name):
+    if not name or os.sep in name:
+        raise ValueError("Invalid shared counter name: {0!r}".format(name))
+    return os.path.join(SHM_DIR, SEGMENT_PREFIX + name)
+
+class _Segment(object):
+    """
+    A mapped counter segment. Used as the lock of a SharedAtomicInt, it is reentrant within a process and exclusive
+    between processes. fcntl record locks belong to the process rather than the descriptor, so a segment mapped before
+    a fork is still locked correctly by the parent and the children.
+    """
+    def __init__(self, path, value, width, overflow):
+        self.path = path
+        self.references = 0
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            with self:
+                if os.fstat(self.fd).st_size == 0:
+                    self._create(value, width or 64, overflow or "wrap")
+                else:
+                    self._attach(width, overflow)
+        except Exception:
+            os.close(self.fd)
+            raise
+
+    def _create(self, value, width, overflow):
+        os.ftruncate(self.fd, _SEGMENT_SIZE)
+        self.map = mmap.mmap(self.fd, _SEGMENT_SIZE)
+        self._configure(width, overflow)
+        self.write(value)
+        _HEADER.pack_into(self.map, 0, _MAGIC, width, OVERFLOW_MODES.index(overflow))
+
+    def _attach(self, width, overflow):
+        self.map = mmap.mmap(self.fd, _SEGMENT_SIZE)
+        magic, found_width, found_overflow = _HEADER.unpack_from(self.map, 0)
+        if magic != _MAGIC or found_width not in WIDTH_FORMATS or found_overflow >= len(OVERFLOW_MODES):
+            self.map.close()
+            raise ValueError(CORRUPT_SEGMENT_ERROR.format(self.path))
+        found_overflow = OVERFLOW_MODES[found_overflow]
+        for requested, found, label in ((width, found_width, "width"), (overflow, found_overflow, "overflow")):
+            if requested is not None and requested != found:
+                self.map.close()
+                raise ValueError(MISMATCH_ERROR.format(self.path, label, found, requested))
+        self._configure(found_width, found_overflow)
+
+    def _configure(self, width, overflow):
+        self.width = width
+        self.overflow = overflow
+        self.format = WIDTH_FORMATS[width]
+        self.min_value = -(1 << (width - 1))
+        self.max_value = (1 << (width - 1)) - 1
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                fcntl.lockf(self.fd, fcntl.LOCK_EX)
+            except Exception:
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._depth -= 1
+        if self._depth == 0:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    def read(self):
+        return struct.unpack_from(self.format, self.map, 8)[0]
+
+    def write(self, value):
+        if not isinstance(value, (int, long)):
+            raise TypeError("{0} is not an integer value".format(type(value)))
+        if not self.min_value <= value <= self.max_value:
+            if self.overflow == "raise":
+                raise OverflowError(OVERFLOW_ERROR.format(value, self.width))
+            elif self.overflow == "saturate":
+                value = max(self.min_value, min(self.max_value, value))
+            else:
+                value = ((value - self.min_value) & ((1 << self.width) - 1)) + self.min_value
+        struct.pack_into(self.format, self.map, 8, value)
+
+    def is_current(self):
+        """ Whether the path still refers to this segment, rather than having been unlinked or replaced """
+        try:
+            return os.stat(self.path).st_ino == os.fstat(self.fd).st_ino
+        except OSError:
+            return False
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+class SharedAtomicInt(AtomicInt):
+    def __init__(self, name, value=0, width=None, overflow=None):
+        """
+        Attach to the shared counter called name, creating it if it doesn't exist yet
+        :param name: Name of the counter, shared by every process on the host
+        :param value: Initial value, only used when the counter is created
+        :param width: Width in bits, 8, 16, 32 or 64, defaults to 64 when creating or to the existing width
+        :param overflow: wrap, raise or saturate, defaults to wrap when creating or to the existing behaviour
+        """
+        if fcntl is None:
+            raise ImportError("SharedAtomicInt requires fcntl, which isn't available on this platform")
+        if width is not None and width not in WIDTH_FORMATS:
+            raise ValueError(WIDTH_ERROR.format(sorted(WIDTH_FORMATS), width))
+        if overflow is not None and overflow not in OVERFLOW_MODES:
+            raise ValueError(OVERFLOW_MODE_ERROR.format(OVERFLOW_MODES, overflow))
+        self.name = name
+        path = segment_path(name)
+        with _segments_lock:
+            segment = _segments.get(path)
+            if segment is not None and not segment.is_current():
+                # The name has been unlinked since this process mapped it, leave the old one to its existing users
+                segment = None
+            if segment is None:
+                segment = _segments[path] = _Segment(path, value, width, overflow)
+            else:
+                segment_mismatch = [(label, found, requested) for requested, found, label in
+                                    ((width, segment.width, "width"), (overflow, segment.overflow, "overflow"))
+                                    if requested is not None and requested != found]
+                if segment_mismatch:
+                    raise ValueError(MISMATCH_ERROR.format(path, *segment_mismatch[0]))
+            segment.references += 1
+        self._lock = segment
+
+    @property
+    def _value(self):
+        return self._lock.read()
+
+    @_value.setter
+    def _value(self, new_value):
+        self._lock.write(new_value)
+
+    @property
+    def width(self):
+        return self._lock.width
+
+    @property
+    def overflow(self):
+        return self._lock.overflow
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Detach from the counter, the mapping is released once every SharedAtomicInt in this process attached to the
+        same name has been closed. The counter itself remains until it is unlinked.
+        """
+        segment = self.__dict__.pop("_lock", None)
+        if segment is None:
+            return
+        with _segments_lock:
+            segment.references -= 1
+            if segment.references == 0:
+                if _segments.get(segment.path) is segment:
+                    del _segments[segment.path]
+                segment.close()
+
+    def unlink(self):
+        """ Remove the counter's name, processes already attached keep working on it until they close it """
+        unlink(self.name)
+
+def unlink(name):
+    """ Remove the named counter, if it exists """
+    with suppress(OSError):
+        os.unlink(segment_path(name))
@@ -6,6 +6,7 @@ AtomicInt unit tests
 
 import sys
 import math
+import threading
 import unittest
 
 # Append the current and parent directories to path so we can always find the module we want to test
@@ -258,5 +259,246 @@ class AtomicIntTest(unittest.TestCase):
         with self.assertRaises(TypeError):
             print(divmod(a, 2.5))
 
+    def test_23_fetch_and_add_should_return_plain_ints(self):
+        """ fetch_add and add_and_get should return the previous and new values as ints """
+        a = atomic.AtomicInt(5)
+        self.assertEquals(a.fetch_add(2), 5)
+        self.assertEquals(a.add_and_get(2), 9)
+        self.assertNotIsInstance(a.add_and_get(0), atomic.AtomicInt)
+        self.assertEquals(a.add_and_get(atomic.AtomicInt(1)), 10)
+        with self.assertRaises(TypeError):
+            a.fetch_add(1.5)
+
+    def test_24_get_and_set_should_return_the_previous_value(self):
+        """ get_and_set should replace the value and return the old one """
+        a = atomic.AtomicInt(5)
+        self.assertEquals(a.get_and_set(7), 5)
+        self.assertEquals(a.value, 7)
+
+    def test_25_compare_and_set_should_only_set_on_a_match(self):
+        """ compare_and_set should only update when the current value is the expected one """
+        a = atomic.AtomicInt(5)
+        self.assertFalse(a.compare_and_set(4, 10))
+        self.assertEquals(a.value, 5)
+        self.assertTrue(a.compare_and_set(5, 10))
+        self.assertEquals(a.value, 10)
+
+    def test_26_update_and_accumulate_should_apply_the_function(self):
+        """ update_and_get and accumulate_and_get should apply their function and return the result """
+        a = atomic.AtomicInt(5)
+        self.assertEquals(a.update_and_get(lambda v: v * 3), 15)
+        self.assertEquals(a.accumulate_and_get(4, max), 15)
+        self.assertEquals(a.accumulate_and_get(20, max), 20)
+        with self.assertRaises(TypeError):
+            a.update_and_get(lambda v: v / 2.0)
+
+    def test_27_non_reentrant_atomic_int_should_support_every_operation(self):
+        """ An AtomicInt with a plain lock should work with itself as the other operand """
+        a = atomic.AtomicInt(3, reentrant=False)
+        self.assertEquals(a + a, 6)
+        self.assertTrue(a == a)
+        self.assertEquals(divmod(a, a), (1, 0))
+        a += a
+        self.assertEquals(a.value, 6)
+        self.assertEquals(atomic.increment(a), 7)
+        self.assertEquals(atomic.decrement(a), 6)
+
+    def test_28_concurrent_fetch_add_should_not_lose_updates(self):
+        """ fetch_add from many threads should hand out every value exactly once """
+        a = atomic.AtomicInt(reentrant=False)
+        seen = []
+        def work():
+            seen.extend(a.fetch_add(1) for _ in range(1000))
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEquals(sorted(seen), range(8000))
+
+class StripedAdderTest(unittest.TestCase):
+    def test_01_adder_should_start_at_its_initial_value(self):
+        """ An adder should start at the value it was created with """
+        self.assertEquals(atomic.StripedAdder().sum(), 0)
+        self.assertEquals(atomic.StripedAdder(5).sum(), 5)
+
+    def test_02_adding_should_change_the_sum(self):
+        """ add, increment and decrement should all be reflected in the sum """
+        a = atomic.StripedAdder()
+        a.add(10)
+        a.increment()
+        a.decrement()
+        a.decrement()
+        self.assertEquals(a.sum(), 9)
+        self.assertEquals(a.value, 9)
+        self.assertEquals(int(a), 9)
+
+    def test_03_and_sum_methods_should_return_the_new_sum(self):
+        """ The _and_sum methods should return the new sum, the module helpers should only accept AtomicInts """
+        a = atomic.StripedAdder()
+        self.assertEquals(a.increment_and_sum(), 1)
+        self.assertEquals(a.increment_and_sum(), 2)
+        self.assertEquals(a.decrement_and_sum(), 1)
+        with self.assertRaises(AssertionError):
+            atomic.increment(a)
+        with self.assertRaises(AssertionError):
+            atomic.decrement(a)
+
+    def test_04_reset_should_zero_the_adder(self):
+        """ Resetting should zero the sum """
+        a = atomic.StripedAdder(7)
+        a.reset()
+        self.assertEquals(a.sum(), 0)
+        a.add(3)
+        self.assertEquals(a.sum_then_reset(), 3)
+        self.assertEquals(a.sum(), 0)
+
+    def test_05_concurrent_updates_should_not_be_lost(self):
+        """ Updates from many threads should all be counted """
+        a = atomic.StripedAdder(cells=4)
+        def work():
+            for _ in range(1000):
+                a.increment()
+        threads = [threading.Thread(target=work) for _ in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEquals(a.sum(), 16000)
+class AtomicCounterArrayTest(unittest.TestCase):
+    def test_01_counters_should_start_at_zero(self):
+        """ Every counter should start at zero """
+        a = atomic.AtomicCounterArray(100)
+        self.assertEquals(len(a), 100)
+        self.assertEquals(a.snapshot().tolist(), [0] * 100)
+
+    def test_02_adding_should_update_a_single_counter(self):
+        """ add should only change the counter it is given and return its new value """
+        a = atomic.AtomicCounterArray(10)
+        self.assertEquals(a.add(3), 1)
+        self.assertEquals(a.add(3, 5), 6)
+        self.assertEquals(a.add(-1, 2), 2)
+        self.assertEquals(a[3], 6)
+        self.assertEquals(a[9], 2)
+        self.assertEquals(sum(a.snapshot()), 8)
+        with self.assertRaises(IndexError):
+            a.add(10)
+
+    def test_03_add_many_should_apply_every_update(self):
+        """ add_many should apply each update, with a single delta or one per index """
+        a = atomic.AtomicCounterArray(40, stripes=4)
+        a.add_many([1, 2, 2, 35])
+        self.assertEquals([a[1], a[2], a[35]], [1, 2, 1])
+        a.add_many([1, 2, 35], [10, 20, 30])
+        self.assertEquals([a[1], a[2], a[35]], [11, 22, 31])
+
+    def test_04_snapshot_should_be_a_copy(self):
+        """ A snapshot should not change as the counters are updated """
+        a = atomic.AtomicCounterArray(5)
+        a.add(0)
+        snapshot = a.snapshot()
+        a.add(0)
+        self.assertEquals(snapshot[0], 1)
+        self.assertEquals(a[0], 2)
+
+    def test_05_reset_should_zero_every_counter(self):
+        """ Resetting should zero every counter """
+        a = atomic.AtomicCounterArray(5)
+        a.add_many(range(5), 3)
+        a.reset()
+        self.assertEquals(a.snapshot().tolist(), [0] * 5)
+
+    def test_06_concurrent_updates_should_not_be_lost(self):
+        """ Updates from many threads should all be counted """
+        a = atomic.AtomicCounterArray(64, stripes=4)
+        def work():
+            for i in range(1000):
+                a.add(i % 64)
+            a.add_many(range(64))
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEquals(sum(a.snapshot()), 8 * 1064)
+class TransactionTest(unittest.TestCase):
+    def test_01_transaction_should_update_several_atomic_ints(self):
+        """ Values read and written in a transaction should be applied to each AtomicInt """
+        a, b = atomic.AtomicInt(10), atomic.AtomicInt(0, reentrant=False)
+        with atomic.transaction(a, b) as tx:
+            self.assertEquals(tx.get(a), 10)
+            self.assertEquals(tx.add(a, -4), 6)
+            tx.add(b, 4)
+            tx.set(a, tx.get(a) + tx.get(b))
+        self.assertEquals(a.value, 10)
+        self.assertEquals(b.value, 4)
+
+    def test_02_transaction_should_reject_other_atomic_ints(self):
+        """ Using an AtomicInt that isn't part of the transaction should raise """
+        a, b = atomic.AtomicInt(), atomic.AtomicInt()
+        with atomic.transaction(a) as tx:
+            with self.assertRaises(ValueError):
+                tx.get(b)
+            with self.assertRaises(TypeError):
+                tx.set(a, 1.5)
+        with self.assertRaises(TypeError):
+            atomic.transaction(a, 1)
+
+    def test_03_transfers_in_opposite_orders_should_not_deadlock(self):
+        """ Transactions naming the same AtomicInts in different orders should not deadlock or lose updates """
+        a, b = atomic.AtomicInt(10000, reentrant=False), atomic.AtomicInt(10000, reentrant=False)
+        def transfer(source, dest):
+            for _ in range(1000):
+                with atomic.transaction(source, dest) as tx:
+                    tx.add(source, -1)
+                    tx.add(dest, 1)
+        threads = [threading.Thread(target=transfer, args=(a, b) if i % 2 else (b, a)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEquals(a.value + b.value, 20000)
+        self.assertEquals(a.value, 10000)
+
+    def test_04_atomically_should_apply_the_function(self):
+        """ atomically should replace every value with the function result """
+        a, b = atomic.AtomicInt(10), atomic.AtomicInt(5)
+        self.assertEquals(atomic.atomically([a, b], lambda x, y: (x - 3, y + 3)), [7, 8])
+        self.assertEquals((a.value, b.value), (7, 8))
+
+    def test_05_atomically_should_retry_when_values_change(self):
+        """ atomically should recompute if a value changes while the function runs """
+        a = atomic.AtomicInt(1)
+        calls = []
+        def fn(x):
+            calls.append(x)
+            if len(calls) == 1:
+                a.value = 100
+            return (x * 2,)
+        self.assertEquals(atomic.atomically([a], fn), [200])
+        self.assertEquals(calls, [1, 100])
+
+    def test_06_raising_from_atomically_should_abort(self):
+        """ An exception from the function should leave the values unchanged """
+        a, b = atomic.AtomicInt(1), atomic.AtomicInt(2)
+        def fn(x, y):
+            raise ValueError("Insufficient funds")
+        with self.assertRaises(ValueError):
+            atomic.atomically([a, b], fn)
+        self.assertEquals((a.value, b.value), (1, 2))
+
+    def test_07_concurrent_atomically_should_not_lose_updates(self):
+        """ Concurrent optimistic updates should all be applied """
+        a, b = atomic.AtomicInt(0), atomic.AtomicInt(0)
+        def work():
+            for _ in range(500):
+                atomic.atomically([a, b], lambda x, y: (x + 1, y - 1), retries=1)
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEquals((a.value, b.value), (4000, -4000))
+
 if __name__ == "__main__":
     unittest.main(verbosity=5)
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+BitSet unit tests
+"""
+import sys
+import pickle
+import unittest
+
+# Append the current and parent directories to path so we can always find the module we want to test
+map(lambda p : sys.path.append(p), [".", ".."])
+
+# noinspection PyUnresolvedReferences,PyUnresolvedReferences
+import bitset
+
+FIELDS = ['dsps', 'sip', 'users', 'full_manipulation', 'vm']
+
+class BitSetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.factory = bitset.BitSetTypeFactory()
+        self.Features = self.factory.createType('Features', FIELDS)
+
+    def test_01_loading_a_value_should_set_the_matching_fields(self):
+        """Loading a mask should enable exactly the fields of its set bits"""
+        f = self.Features(5)
+        self.assertEqual([f.dsps, f.sip, f.users, f.full_manipulation, f.vm], [True, False, True, False, False])
+        f.load(18)
+        self.assertEqual([f.dsps, f.sip, f.users, f.full_manipulation, f.vm], [False, True, False, False, True])
+        self.assertEqual(f.value(), 18)
+        self.assertEqual(f.bits(), '10010')
+
+    def test_02_setting_fields_should_update_the_value(self):
+        """Setting field attributes should update the mask"""
+        f = bitset.BitSet(FIELDS)
+        f.vm = True
+        f.sip = 1
+        self.assertEqual(f.value(), 18)
+        f.vm = False
+        self.assertEqual(f.value(), 2)
+
+    def test_03_invalid_values_should_raise(self):
+        """Out of range and non int values should raise"""
+        with self.assertRaises(bitset.InvalidBitMaskValueError):
+            self.Features(32)
+        with self.assertRaises(bitset.InvalidBitMaskValueError):
+            self.Features(-1)
+        with self.assertRaises(bitset.InvalidBitMaskValueTypeError):
+            self.Features('3')
+
+    def test_04_invalid_fields_should_raise(self):
+        """Empty and duplicate field lists should raise"""
+        with self.assertRaises(bitset.EmptyAttributeListError):
+            bitset.BitSet([])
+        with self.assertRaises(bitset.DuplicateAttributeError):
+            bitset.BitSet(['a', 'b', 'a'])
+        with self.assertRaises(bitset.DuplicateAttributeError):
+            self.factory.createType('Bad', ['a', 'a'])
+
+    def test_05_set_operators_should_combine_masks(self):
+        """&, |, ^ and ~ should combine masks and return the same type"""
+        a, b = self.Features(3), self.Features(6)
+        self.assertIsInstance(a & b, self.Features)
+        self.assertEqual((a & b).value(), 2)
+        self.assertEqual((a | b).value(), 7)
+        self.assertEqual((a ^ b).value(), 5)
+        self.assertEqual((~a).value(), 28)
+        self.assertEqual((a | 16).value(), 19)
+        self.assertEqual((16 | a).value(), 19)
+        a |= b
+        self.assertEqual(a.value(), 7)
+        a &= 4
+        self.assertEqual(a.value(), 4)
+        with self.assertRaises(bitset.InvalidBitMaskValueError):
+            a | 64
+        with self.assertRaises(TypeError):
+            a | bitset.BitSet(['a', 'b'])
+        with self.assertRaises(TypeError):
+            a | 'sip'
+
+    def test_06_membership_should_test_fields(self):
+        """in should test field names and sub masks"""
+        f = self.Features(5)
+        self.assertTrue('dsps' in f)
+        self.assertFalse('sip' in f)
+        self.assertFalse('unknown' in f)
+        self.assertTrue(4 in f)
+        self.assertFalse(6 in f)
+        self.assertTrue(self.Features(1) in f)
+        self.assertFalse(100 in f)
+        self.assertFalse(-1 in f)
+        with self.assertRaises(TypeError):
+            1.5 in f
+
+    def test_07_iteration_should_yield_the_set_fields(self):
+        """Iterating should yield the names of the enabled fields in order"""
+        self.assertEqual(list(self.Features(21)), ['dsps', 'users', 'vm'])
+        self.assertEqual(list(self.Features(0)), [])
+
+    def test_08_equal_bitsets_should_hash_equally(self):
+        """BitSets with the same fields and mask should be equal and hash equally"""
+        a, b = self.Features(5), bitset.BitSet(FIELDS, 5)
+        self.assertEqual(a, b)
+        self.assertEqual(hash(a), hash(b))
+        self.assertEqual(a, 5)
+        self.assertNotEqual(a, self.Features(4))
+        self.assertEqual(len(set([a, b, self.Features(4)])), 2)
+
+    def test_09_bitsets_should_keep_their_own_fields(self):
+        """BitSets with different fields should not share attributes"""
+        a, b = bitset.BitSet(['x', 'y']), bitset.BitSet(['y', 'z'], 1)
+        self.assertTrue(b.y)
+        self.assertFalse(hasattr(a, 'z'))
+        self.assertEqual(a.BIT_Y, 2)
+        self.assertEqual(b.BIT_Y, 1)
+        self.assertIsInstance(a, bitset.BitSet)
+
+    def test_10_bitset_should_pickle(self):
+        """A BitSet should survive pickling"""
+        f = bitset.BitSet(FIELDS, 9)
+        self.assertEqual(pickle.loads(pickle.dumps(f)), f)
+
+    def test_11_consts_should_map_constant_names_to_bits(self):
+        """consts should return the BIT_ constant of each field"""
+        self.assertEqual(self.Features().consts()['BIT_USERS'], 4)
+        self.assertEqual(self.Features.BIT_VM, 16)
+
+    def test_12_declared_types_should_be_created_by_name(self):
+        """Declared types should be created through the factory"""
+        self.factory.declareType('Declared', ['a', 'b'])
+        self.assertEqual(self.factory.create('Declared', 3).value(), 3)
+        with self.assertRaises(bitset.DuplicateTypeError):
+            self.factory.declareType('Declared', ['a'])
+        with self.assertRaises(bitset.TypeNotDeclaredError):
+            self.factory.create('Unknown')
+
+    def test_13_instances_should_only_hold_their_mask(self):
+        """Generated types should use slots, with the constants shared through the class"""
+        for f in (self.Features(3), bitset.BitSet(FIELDS, 3), self.Features.from_mask(3)):
+            self.assertFalse(hasattr(f, '__dict__'))
+            with self.assertRaises(AttributeError):
+                f.unknown = True
+        consts = self.Features().consts()
+        consts['BIT_VM'] = 0
+        self.assertEqual(self.Features().consts()['BIT_VM'], 16)
+
+    def test_14_interned_types_should_share_one_instance_per_mask(self):
+        """Interned types should return the same instance for a mask however it is created"""
+        Interned = self.factory.createType('Interned', FIELDS, interned=True)
+        a = Interned(5)
+        self.assertIs(Interned(5), a)
+        self.assertIs(Interned.from_mask(5), a)
+        self.assertIs(Interned(1) | 4, a)
+        self.assertIs(~Interned(26), a)
+        self.assertIsNot(Interned(4), a)
+        with self.assertRaises(bitset.InvalidBitMaskValueError):
+            Interned(32)
+        with self.assertRaises(bitset.InvalidBitMaskValueTypeError):
+            Interned('5')
+        self.factory.declareType('DeclaredInterned', FIELDS, interned=True)
+        self.assertIs(self.factory.create('DeclaredInterned', 3), self.factory.create('DeclaredInterned', 3))
+
+    def test_15_interned_instances_should_be_immutable(self):
+        """Interned instances should reject updates, in place operators should rebind instead"""
+        Interned = self.factory.createType('Interned', FIELDS, interned=True)
+        a = Interned(5)
+        with self.assertRaises(bitset.ImmutableBitSetError):
+            a.sip = True
+        with self.assertRaises(AttributeError):
+            a.load(2)
+        b = a
+        b |= 2
+        self.assertEqual(a.value(), 5)
+        self.assertIs(b, Interned(7))
+        self.assertEqual(Interned(7), self.Features(7))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=5)
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+BitSetArray unit tests
+"""
+import sys
+import unittest
+
+# Append the current and parent directories to path so we can always find the module we want to test
+map(lambda p : sys.path.append(p), [".", ".."])
+
+# noinspection PyUnresolvedReferences,PyUnresolvedReferences
+import bitset
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FIELDS = ['dsps', 'sip', 'users', 'full_manipulation', 'vm']
+
+@unittest.skipIf(np is None, "BitSetArray requires numpy")
+class BitSetArrayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.factory = bitset.BitSetTypeFactory()
+        self.factory.declareType('Features', FIELDS)
+        self.Features = self.factory.types['Features']
+
+    def test_01_masks_should_use_the_smallest_dtype(self):
+        """Masks should be stored in the smallest unsigned dtype that fits the type"""
+        self.assertEqual(bitset.BitSetArray(self.Features, size=3).masks.dtype, np.uint8)
+        wide = self.factory.createType('Wide', ['f{0}'.format(i) for i in range(20)])
+        self.assertEqual(bitset.BitSetArray(wide, [1, 2]).masks.dtype, np.uint32)
+        too_wide = self.factory.createType('TooWide', ['f{0}'.format(i) for i in range(65)])
+        with self.assertRaises(ValueError):
+            bitset.BitSetArray(too_wide, size=1)
+
+    def test_02_int_arrays_should_not_be_copied(self):
+        """Loading from and exporting to an int array should share the data"""
+        ints = np.array([1, 2, 3], dtype=np.int64)
+        array = bitset.BitSetArray.from_ints(self.Features, ints)
+        self.assertIs(array.to_ints(), ints)
+        array.set('vm')
+        self.assertEqual(ints.tolist(), [17, 18, 19])
+
+    def test_03_invalid_masks_should_raise(self):
+        """Out of range masks and non integer arrays should raise"""
+        with self.assertRaises(bitset.InvalidBitMaskValueError):
+            bitset.BitSetArray(self.Features, np.array([1, 32]))
+        with self.assertRaises(bitset.InvalidBitMaskValueError):
+            bitset.BitSetArray(self.Features, np.array([-1, 2]))
+        with self.assertRaises(bitset.InvalidBitMaskValueTypeError):
+            bitset.BitSetArray(self.Features, np.array([1.0]))
+
+    def test_04_field_tests_should_be_vectorized(self):
+        """Field tests should return a boolean per record"""
+        array = self.factory.createArray('Features', [0, 1, 3, 6, 31])
+        self.assertEqual(array.test('sip').tolist(), [False, False, True, True, True])
+        self.assertEqual(array.test_all('dsps', 'sip').tolist(), [False, False, True, False, True])
+        self.assertEqual(array.test_any('dsps', 'users').tolist(), [False, True, True, True, True])
+        self.assertEqual(array.where(sip=True, dsps=False).tolist(), [False, False, False, True, False])
+        self.assertEqual(array.filter(dsps=True).to_ints().tolist(), [1, 3, 31])
+        with self.assertRaises(bitset.UnknownFieldError):
+            array.test('unknown')
+
+    def test_05_masked_updates_should_only_change_selected_records(self):
+        """set should only change the records selected by where"""
+        array = bitset.BitSetArray(self.Features, [0, 1, 2, 3])
+        array.set('vm', where=array.test('dsps'))
+        self.assertEqual(array.to_ints().tolist(), [0, 17, 2, 19])
+        array.set('dsps', False)
+        self.assertEqual(array.to_ints().tolist(), [0, 16, 2, 18])
+
+    def test_06_set_operations_should_combine_arrays(self):
+        """&, |, ^ and ~ should combine arrays element wise"""
+        a = bitset.BitSetArray(self.Features, [1, 3, 7])
+        b = bitset.BitSetArray(self.Features, [2, 2, 2])
+        self.assertEqual((a & b).to_ints().tolist(), [0, 2, 2])
+        self.assertEqual((a | b).to_ints().tolist(), [3, 3, 7])
+        self.assertEqual((a ^ b).to_ints().tolist(), [3, 1, 5])
+        self.assertEqual((~a).to_ints().tolist(), [30, 28, 24])
+        self.assertEqual((a | 16).to_ints().tolist(), [17, 19, 23])
+        self.assertEqual((a & self.Features(1)).to_ints().tolist(), [1, 1, 1])
+        a |= b
+        self.assertEqual(a.to_ints().tolist(), [3, 3, 7])
+        with self.assertRaises(TypeError):
+            a | bitset.BitSetArray(self.factory.createType('Other', ['x']), [1, 0, 1])
+
+    def test_07_counts_should_be_per_field(self):
+        """counts, popcount and value_counts should summarise the records"""
+        array = bitset.BitSetArray(self.Features, [1, 3, 3, 16])
+        self.assertEqual(array.counts(), {'dsps': 3, 'sip': 2, 'users': 0, 'full_manipulation': 0, 'vm': 1})
+        self.assertEqual(array.counts(where=array.test('sip'))['dsps'], 2)
+        self.assertEqual(array.popcount().tolist(), [1, 2, 2, 1])
+        self.assertEqual(array.value_counts(), {1: 1, 3: 2, 16: 1})
+
+    def test_08_indexing_should_return_bitsets(self):
+        """Indexing should return BitSets, slicing should return BitSetArrays"""
+        array = bitset.BitSetArray(self.Features, [1, 3, 5])
+        self.assertIsInstance(array[1], self.Features)
+        self.assertEqual(array[1], 3)
+        self.assertEqual(array[1:].to_ints().tolist(), [3, 5])
+        self.assertEqual([f.value() for f in array], [1, 3, 5])
+        array[0] = self.Features(8)
+        self.assertEqual(array[0], 8)
+
+    def test_09_assigned_masks_should_be_checked(self):
+        """Assigning masks out of range for the type, or of the wrong type, should raise and leave the array as it was"""
+        array = bitset.BitSetArray(self.Features, [1, 3, 5])
+        array[0] = 31
+        array[1:] = [2, 4]
+        array[:2] = np.array([6, 7], dtype=np.int64)
+        self.assertEqual(array.to_ints().tolist(), [6, 7, 4])
+        with self.assertRaises(bitset.InvalidBitMaskValueError):
+            array[0] = 32
+        with self.assertRaises(bitset.InvalidBitMaskValueError):
+            array[1] = -1
+        with self.assertRaises(bitset.InvalidBitMaskValueError):
+            array[:2] = [1, 999]
+        with self.assertRaises(bitset.InvalidBitMaskValueError):
+            array[:] = np.array([-1, 0, 1], dtype=np.int8)
+        with self.assertRaises(bitset.InvalidBitMaskValueTypeError):
+            array[0] = 1.5
+        with self.assertRaises(TypeError):
+            array[0] = bitset.BitSet(['a', 'b'], 1)
+        self.assertEqual(array.to_ints().tolist(), [6, 7, 4])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=5)
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+BloomFilter unit tests
+"""
+import sys
+import threading
+import unittest
+
+# Append the current and parent directories to path so we can always find the module we want to test
+map(lambda p : sys.path.append(p), [".", ".."])
+
+# noinspection PyUnresolvedReferences,PyUnresolvedReferences
+import bitset
+from bitset import bloom
+
+class BloomFilterTest(unittest.TestCase):
+
+    def _filter_of(self, keys):
+        f = bitset.BloomFilter(100)
+        f.add_many(keys)
+        return f
+
+    def test_01_size_should_follow_capacity_and_error_rate(self):
+        """The standard formulas should give about 9.6 bits and 7 hashes per key at 1%"""
+        self.assertEqual(bloom.optimal_size(1000, 0.01), (9586, 7))
+        f = bitset.BloomFilter(1000, 0.01)
+        self.assertEqual(len(f.bits), 1199)
+        with self.assertRaises(ValueError):
+            bitset.BloomFilter(0)
+        with self.assertRaises(ValueError):
+            bitset.BloomFilter(10, 1.5)
+        with self.assertRaises(ValueError):
+            bitset.BloomFilter(10, 1e-90)
+        with self.assertRaises(ValueError):
+            bitset.BloomFilter(num_bits=64, num_hashes=256)
+        self.assertEqual(bitset.BloomFilter.deserialize(bitset.BloomFilter(10, 1e-75).serialize()).num_hashes, 249)
+
+    def test_02_added_keys_should_always_be_found(self):
+        """There should be no false negatives, and false positives near the requested rate"""
+        f = bitset.BloomFilter(10000, 0.01)
+        keys = ['key-{0}'.format(i) for i in range(10000)]
+        f.add_many(keys)
+        self.assertTrue(all(f.contains_many(keys)))
+        false_positives = sum(f.contains_many('other-{0}'.format(i) for i in range(10000)))
+        self.assertLess(false_positives, 200)
+        self.assertAlmostEqual(f.false_positive_rate(), 0.01, places=3)
+        self.assertEqual(len(f), 10000)
+
+    def test_03_add_should_report_new_keys(self):
+        """add should return whether the key set any new bits, keys should be hashed consistently across types"""
+        f = bitset.BloomFilter(100)
+        self.assertTrue(f.add('a'))
+        self.assertFalse(f.add('a'))
+        self.assertIn(u'a', f)
+        f.add(12)
+        self.assertIn(12L, f)
+        self.assertIn(u'été', bitset.BloomFilter(100).union(self._filter_of([u'été'])))
+
+    def test_04_union_should_hold_the_keys_of_both(self):
+        """| should combine filters of the same size and reject others"""
+        a, b = self._filter_of(['a', 'b']), self._filter_of(['c'])
+        c = a | b
+        self.assertTrue(all(c.contains_many(['a', 'b', 'c'])))
+        self.assertNotIn('c', a)
+        a |= b
+        self.assertIn('c', a)
+        self.assertEqual(len(a), 3)
+        with self.assertRaises(ValueError):
+            a | bitset.BloomFilter(1000)
+        with self.assertRaises(TypeError):
+            a | set(['d'])
+
+    def test_05_serialization_should_round_trip(self):
+        """Serialized filters should load back with the same keys and size"""
+        f = self._filter_of(['x{0}'.format(i) for i in range(50)])
+        g = bitset.BloomFilter.deserialize(f.serialize())
+        self.assertEqual((g.num_bits, g.num_hashes, len(g), g.bits), (f.num_bits, f.num_hashes, len(f), f.bits))
+        with self.assertRaises(ValueError):
+            bitset.BloomFilter.deserialize(b'junk')
+        with self.assertRaises(ValueError):
+            bitset.CountingBloomFilter.deserialize(f.serialize())
+
+    def test_06_counting_filters_should_support_removal(self):
+        """Removing a key from a counting filter should make it test as missing, leaving the other keys"""
+        f = bitset.CountingBloomFilter(1000, 0.01)
+        keys = ['key-{0}'.format(i) for i in range(500)]
+        f.add_many(keys)
+        for key in keys[:250]:
+            f.remove(key)
+        self.assertTrue(all(f.contains_many(keys[250:])))
+        self.assertLess(sum(f.contains_many(keys[:250])), 10)
+        self.assertEqual(len(f), 250)
+        with self.assertRaises(KeyError):
+            f.remove('never added')
+        g = bitset.CountingBloomFilter.deserialize(f.serialize())
+        self.assertEqual(g.counters, f.counters)
+        g |= f
+        g.discard(keys[300])
+        self.assertIn(keys[300], g)
+
+    def test_07_saturated_counters_should_stick(self):
+        """A counter that reaches its maximum should never be decremented"""
+        f = bitset.CountingBloomFilter(num_bits=8, num_hashes=1)
+        for _ in range(300):
+            f.add('a')
+        for _ in range(300):
+            f.discard('a')
+        self.assertIn('a', f)
+
+    def test_08_concurrent_adds_should_not_lose_keys(self):
+        """Keys added from several threads at once should all be found"""
+        f = bitset.BloomFilter(20000, 0.01)
+        def add(prefix):
+            for i in range(2000):
+                f.add('{0}-{1}'.format(prefix, i))
+        threads = [threading.Thread(target=add, args=(t,)) for t in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertTrue(all(f.contains_many('{0}-{1}'.format(t, i) for t in range(8) for i in range(2000))))
+
+    def test_09_positions_should_never_collapse_onto_one_bit(self):
+        """A second hash that is a multiple of the filter size should still spread the positions"""
+        keys = ['key-{0}'.format(i) for i in range(2000)]
+        for num_bits in (8, 9, 7919):
+            f = bitset.BloomFilter(num_bits=num_bits, num_hashes=4)
+            self.assertTrue(all(len(set(f._positions(key))) > 1 for key in keys))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=5)
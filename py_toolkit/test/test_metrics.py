@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Metrics unit tests
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import urllib2
+import tempfile
+import threading
+import unittest
+
+# Append the current and parent directories to path so we can always find the module we want to test
+map(lambda p : sys.path.append(p), [".", ".."])
+
+# noinspection PyUnresolvedReferences,PyUnresolvedReferences
+import atomic
+import cache
+import metrics
+import threadpool
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def tearDown(self):
+        metrics.disable()
+
+    def test_01_counters_should_count_across_threads(self):
+        """Increments from several threads should all be counted"""
+        counter = self.registry.counter("requests_total", "Requests")
+        def work():
+            for _ in range(1000):
+                counter.inc()
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        counter.inc(5)
+        self.assertEqual(counter.value, 8005)
+        self.assertIs(self.registry.counter("requests_total"), counter)
+        self.assertIsNot(self.registry.counter("requests_total", labels={"a": "b"}), counter)
+        with self.assertRaises(ValueError):
+            self.registry.gauge("requests_total")
+
+    def test_02_gauges_should_report_set_and_computed_values(self):
+        """Gauges should hold a set value, plus any tracked objects while they are alive"""
+        gauge = self.registry.gauge("depth")
+        gauge.set(3)
+        gauge.inc(2)
+        gauge.dec()
+        self.assertEqual(gauge.value, 4)
+        items = [1, 2, 3]
+        class Holder(object):
+            pass
+        holder = Holder()
+        gauge.track(holder, lambda h: len(items))
+        self.assertEqual(gauge.value, 7)
+        del holder
+        self.assertEqual(gauge.value, 4)
+        gauge.set_function(lambda: 42)
+        self.assertEqual(gauge.value, 42)
+
+    def test_03_histograms_should_count_values_into_buckets(self):
+        """Each observation should land in the first bucket whose bound is not below it"""
+        histogram = self.registry.histogram("latency", buckets=(1, 5, 10))
+        for value in (0.5, 1, 3, 7, 100):
+            histogram.observe(value)
+        cumulative, total_sum, count = histogram.snapshot()
+        self.assertEqual(cumulative, [(1, 2), (5, 3), (10, 4), (float("inf"), 5)])
+        self.assertEqual((total_sum, count), (111.5, 5))
+        with histogram.time():
+            pass
+        self.assertEqual(histogram.snapshot()[2], 6)
+
+    def test_04_disabled_metrics_should_not_record(self):
+        """Updates to a disabled registry's metrics should be ignored until it is enabled"""
+        registry = metrics.Registry(enabled=False)
+        counter, histogram = registry.counter("c"), registry.histogram("h")
+        counter.inc()
+        histogram.observe(1)
+        with histogram.time():
+            pass
+        self.assertEqual((counter.value, histogram.snapshot()[2]), (0, 0))
+        registry.enable()
+        counter.inc()
+        self.assertEqual(counter.value, 1)
+        registry.disable()
+        self.assertFalse(registry.counter("new").enabled)
+
+    def test_05_prometheus_export_should_follow_the_text_format(self):
+        """The text export should describe each metric once, with escaped labels and cumulative buckets"""
+        self.registry.counter("hits_total", "Cache hits", {"cache": "a\"b"}).inc(3)
+        self.registry.counter("hits_total", "Cache hits", {"cache": "c"}).inc()
+        self.registry.histogram("load_seconds", "Loads", buckets=(0.5,)).observe(0.25)
+        self.assertEqual(self.registry.to_prometheus(), "\n".join([
+            '# HELP hits_total Cache hits',
+            '# TYPE hits_total counter',
+            'hits_total{cache="a\\"b"} 3',
+            'hits_total{cache="c"} 1',
+            '# HELP load_seconds Loads',
+            '# TYPE load_seconds histogram',
+            'load_seconds_bucket{le="0.5"} 1',
+            'load_seconds_bucket{le="+Inf"} 1',
+            'load_seconds_sum 0.25',
+            'load_seconds_count 1']) + "\n")
+
+    def test_06_snapshots_should_be_written_to_files_and_served(self):
+        """Snapshots should be written as Prometheus text or JSON, and served over HTTP"""
+        self.registry.gauge("queue_depth", "Depth", {"pool": "p"}).set(2)
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "metrics.json")
+            self.registry.write(path, format="json")
+            with open(path) as f:
+                self.assertEqual(json.load(f), [{"name": "queue_depth", "type": "gauge", "help": "Depth",
+                                                 "labels": {"pool": "p"}, "value": 2}])
+            self.assertEqual(os.listdir(directory), ["metrics.json"])
+            with self.assertRaises(ValueError):
+                self.registry.write(path, format="xml")
+        finally:
+            shutil.rmtree(directory)
+        server = self.registry.serve()
+        try:
+            url = "http://{0}:{1}".format(*server.server_address)
+            self.assertIn('queue_depth{pool="p"} 2', urllib2.urlopen(url + "/metrics").read())
+            self.assertEqual(json.loads(urllib2.urlopen(url + "/metrics.json").read())[0]["value"], 2)
+            with self.assertRaises(urllib2.HTTPError):
+                urllib2.urlopen(url + "/other")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_07_caches_should_report_hits_and_misses(self):
+        """Cache lookups should be counted by the default registry once enabled"""
+        class SquareCache(cache.Cache):
+            def on_miss(self, key):
+                return key * key
+        metrics.enable()
+        squares = SquareCache(name="squares")
+        for key in (1, 2, 1, 1):
+            squares.lookup(key)
+        labels = {"cache": "squares"}
+        self.assertEqual(metrics.registry.counter("py_toolkit_cache_hits_total", labels=labels).value, 2)
+        self.assertEqual(metrics.registry.counter("py_toolkit_cache_misses_total", labels=labels).value, 2)
+        self.assertEqual(metrics.registry.gauge("py_toolkit_cache_hit_ratio", labels=labels).value, 0.5)
+        self.assertEqual(metrics.registry.gauge("py_toolkit_cache_entries", labels=labels).value, 2)
+        self.assertEqual(metrics.registry.histogram("py_toolkit_cache_load_seconds", labels=labels).snapshot()[2], 2)
+
+    def test_08_pools_should_report_queue_depth_and_tasks(self):
+        """ThreadPool should expose its queue depth and count completed tasks"""
+        metrics.enable()
+        started, release = threading.Event(), threading.Event()
+        def block():
+            started.set()
+            release.wait(5)
+        labels = {"pool": "metrics-test"}
+        with threadpool.ThreadPool(1, label="metrics-test") as pool:
+            depth = metrics.registry.gauge("py_toolkit_threadpool_queue_depth", labels=labels)
+            pool.enqueue(block)
+            started.wait(5)
+            pool.enqueue(lambda: None)
+            self.assertEqual(depth.value, 1)
+            release.set()
+            pool.join()
+            self.assertEqual(depth.value, 0)
+            tasks = metrics.registry.counter("py_toolkit_threadpool_tasks_total", labels=labels)
+            self.assertEqual(tasks.value, 2)
+            started.clear()
+            release.clear()
+            pool.enqueue(block)
+            started.wait(5)
+            pool.enqueue(lambda: None).cancel()
+            release.set()
+            keyed = [pool.enqueue_keyed("k", lambda: None) for _ in range(3)]
+            pool.join()
+            self.assertEqual(tasks.value, 6)
+            self.assertTrue(all(task.done and not task.cancelled for task in keyed))
+
+    def test_09_atomic_int_lock_waits_should_be_timed_when_enabled(self):
+        """AtomicInts created while enabled should count contended acquires, others should use their lock directly"""
+        self.assertNotIsInstance(atomic.AtomicInt()._lock, metrics.ContentionTimedLock)
+        metrics.enable()
+        a = atomic.AtomicInt()
+        self.assertIsInstance(a._lock, metrics.ContentionTimedLock)
+        contended = metrics.registry.counter("py_toolkit_lock_contended_total", labels={"lock": "AtomicInt"})
+        before = contended.value
+        held, release = threading.Event(), threading.Event()
+        def hold():
+            with a._lock:
+                held.set()
+                release.wait(5)
+        holder = threading.Thread(target=hold)
+        holder.start()
+        held.wait(5)
+        threading.Timer(0.05, release.set).start()
+        a += 1
+        holder.join()
+        self.assertEqual(a.value, 1)
+        self.assertEqual(contended.value, before + 1)
+        with atomic.transaction(a, atomic.AtomicInt()) as t:
+            t.add(a, 1)
+        self.assertEqual(a.value, 2)
+        metrics.disable()
+        self.assertNotIsInstance(atomic.AtomicInt()._lock, metrics.ContentionTimedLock)
+
+    def test_10_instance_metrics_should_be_unregistered_with_their_last_owner(self):
+        """Pools and caches should leave no series behind once shut down or collected, unless another shares them"""
+        def series(label):
+            return [m for m in metrics.registry.collect() if label in m.labels.values()]
+        for i in range(20):
+            with threadpool.ThreadPool(1, label="job-{0}".format(i)) as pool:
+                pool.enqueue(lambda: None)
+        self.assertEqual(series("job-0") + series("job-19"), [])
+        shared = threadpool.ThreadPool(1, label="shared")
+        with threadpool.ThreadPool(1, label="shared"):
+            pass
+        self.assertEqual(len(series("shared")), 2)
+        shared.shutdown()
+        self.assertEqual(series("shared"), [])
+        class SquareCache(cache.Cache):
+            def on_miss(self, key):
+                return key * key
+        first, second = SquareCache(name="short-lived"), SquareCache(name="short-lived")
+        self.assertEqual(len(series("short-lived")), 5)
+        del first
+        self.assertEqual(len(series("short-lived")), 5)
+        del second
+        # A cache's prune thread holds it while scanning, so it may take a moment to be collected
+        for _ in range(100):
+            if not series("short-lived"):
+                break
+            time.sleep(0.01)
+        self.assertEqual(series("short-lived"), [])
+        owner = set()
+        self.registry.counter("owned", owner=owner)
+        self.registry.counter("unowned")
+        self.registry.release(object())
+        self.registry.release(owner)
+        self.assertEqual([m.name for m in self.registry.collect()], ["unowned"])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=5)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline unit tests
+"""
+import sys
+import time
+import random
+import threading
+import unittest
+
+# Append the current and parent directories to path so we can always find the module we want to test
+map(lambda p : sys.path.append(p), [".", ".."])
+
+# noinspection PyUnresolvedReferences,PyUnresolvedReferences
+import pipeline
+
+def jitter(value):
+    time.sleep(random.random() / 1000.0)
+    return value
+
+class PipelineTest(unittest.TestCase):
+
+    def test_01_items_should_pass_through_every_stage(self):
+        """Every item should be transformed by every stage"""
+        p = pipeline.Pipeline().add_stage(lambda x: x + 1, num_threads=2).add_stage(lambda x: x * 2, num_threads=3)
+        self.assertEqual(sorted(p.run(range(100))), [(x + 1) * 2 for x in range(100)])
+
+    def test_02_ordered_pipeline_should_preserve_input_order(self):
+        """An ordered pipeline should yield results in input order"""
+        p = pipeline.Pipeline(buffer_size=4, ordered=True).add_stage(jitter, num_threads=4).add_stage(jitter, 3)
+        self.assertEqual(list(p.run(iter(range(200)))), range(200))
+
+    def test_03_pipeline_should_accept_a_generator_lazily(self):
+        """The input generator should only be consumed as the pipeline drains it"""
+        consumed = []
+        def source():
+            for i in range(1000):
+                consumed.append(i)
+                yield i
+        p = pipeline.Pipeline(buffer_size=2).add_stage(lambda x: x)
+        run = p.run(source())
+        self.assertEqual(consumed, [])
+        next(run)
+        time.sleep(0.1)
+        self.assertLess(len(consumed), 20)
+        run.close()
+
+    def test_04_a_failing_stage_should_raise_to_the_consumer(self):
+        """An exception in a stage should be raised by the result iterator"""
+        def fail(x):
+            if x == 50:
+                raise ValueError("Expected failure")
+            return x
+        p = pipeline.Pipeline(buffer_size=2).add_stage(fail, num_threads=2).add_stage(lambda x: x)
+        with self.assertRaises(ValueError):
+            list(p.run(range(1000)))
+
+    def test_05_closing_a_run_early_should_release_its_threads(self):
+        """Closing a run before it is exhausted should stop all of its threads"""
+        p = pipeline.Pipeline(buffer_size=2).add_stage(lambda x: x, num_threads=2).add_stage(lambda x: x)
+        with p.run(iter(range(10000))) as run:
+            next(run)
+        deadline = time.time() + 5
+        while run.active > 0 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(run.active, 0)
+
+    def test_06_metrics_should_be_reported_per_stage(self):
+        """Each stage should report the items it processed"""
+        p = pipeline.Pipeline().add_stage(lambda x: x, name="first").add_stage(lambda x: x, name="second")
+        run = p.run(range(10))
+        list(run)
+        metrics = run.metrics()
+        self.assertEqual([m["name"] for m in metrics], ["first", "second"])
+        self.assertEqual([m["items"] for m in metrics], [10, 10])
+        self.assertTrue(all(m["throughput"] > 0 for m in metrics))
+
+    def test_07_running_a_pipeline_without_stages_should_raise(self):
+        """A pipeline needs at least one stage to run"""
+        with self.assertRaises(ValueError):
+            pipeline.Pipeline().run(range(10))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=5)
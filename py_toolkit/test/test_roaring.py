@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+RoaringBitmap unit tests
+"""
+import os
+import sys
+import random
+import shutil
+import tempfile
+import unittest
+
+# Append the current and parent directories to path so we can always find the module we want to test
+map(lambda p : sys.path.append(p), [".", ".."])
+
+# noinspection PyUnresolvedReferences,PyUnresolvedReferences
+import bitset
+from bitset import roaring
+
+class RoaringBitmapTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(42)
+        # Sparse, dense and contiguous chunks, so every container representation is exercised
+        self.values = set(rng.sample(range(0, 1 << 32, 7919), 3000))
+        self.values.update(rng.sample(range(5 << 16, 6 << 16), 20000))
+        self.values.update(range(9 << 16, (9 << 16) + 30000))
+        self.bitmap = bitset.RoaringBitmap(self.values)
+
+    def test_01_membership_should_match_a_set(self):
+        """Adding, discarding and testing values should behave like a set"""
+        bitmap = bitset.RoaringBitmap()
+        bitmap.add(3)
+        bitmap.add(1 << 31)
+        bitmap.add(3)
+        self.assertEqual(len(bitmap), 2)
+        self.assertIn(3, bitmap)
+        self.assertNotIn(4, bitmap)
+        self.assertNotIn(-1, bitmap)
+        self.assertNotIn("3", bitmap)
+        self.assertTrue(bitmap.discard(3))
+        self.assertFalse(bitmap.discard(3))
+        with self.assertRaises(KeyError):
+            bitmap.remove(3)
+        with self.assertRaises(ValueError):
+            bitmap.add(1 << 32)
+        with self.assertRaises(TypeError):
+            bitmap.add(1.0)
+        self.assertEqual(list(bitmap), [1 << 31])
+
+    def test_02_iteration_should_be_sorted(self):
+        """Iterating should give every value once in ascending order"""
+        self.assertEqual(len(self.bitmap), len(self.values))
+        self.assertEqual(list(self.bitmap), sorted(self.values))
+
+    def test_03_containers_should_switch_representation(self):
+        """Chunks should be held as arrays when sparse and bitmaps when dense, switching as values come and go"""
+        bitmap = bitset.RoaringBitmap(range(roaring.ARRAY_MAX_SIZE))
+        self.assertIsInstance(bitmap._get(0), roaring.ArrayContainer)
+        bitmap.add(roaring.ARRAY_MAX_SIZE)
+        self.assertIsInstance(bitmap._get(0), roaring.BitmapContainer)
+        bitmap.discard(0)
+        self.assertIsInstance(bitmap._get(0), roaring.ArrayContainer)
+        self.assertEqual(list(bitmap), range(1, roaring.ARRAY_MAX_SIZE + 1))
+
+    def test_04_set_operations_should_match_sets(self):
+        """Union, intersection, difference and symmetric difference should agree with the set equivalents"""
+        rng = random.Random(7)
+        other_values = set(rng.sample(self.values, 10000))
+        other_values.update(rng.sample(range(5 << 16, 7 << 16), 15000))
+        other = bitset.RoaringBitmap(other_values)
+        other.add_range((9 << 16) + 20000, (9 << 16) + 40000)
+        other_values.update(range((9 << 16) + 20000, (9 << 16) + 40000))
+        self.assertEqual(list(self.bitmap | other), sorted(self.values | other_values))
+        self.assertEqual(list(self.bitmap & other), sorted(self.values & other_values))
+        self.assertEqual(list(self.bitmap - other), sorted(self.values - other_values))
+        self.assertEqual(list(self.bitmap ^ other), sorted(self.values ^ other_values))
+        self.assertEqual(self.bitmap.union(other, bitset.RoaringBitmap([1])), bitset.RoaringBitmap(
+            self.values | other_values | set([1])))
+        self.assertEqual(len(self.bitmap), len(self.values))
+
+    def test_05_in_place_operations_should_not_share_containers(self):
+        """Results should be independent of the bitmaps they were computed from"""
+        original = self.bitmap.copy()
+        result = self.bitmap | bitset.RoaringBitmap([1])
+        result.add(2)
+        result.discard(max(self.values))
+        self.assertEqual(self.bitmap, original)
+        original &= bitset.RoaringBitmap([2, max(self.values)])
+        self.assertEqual(list(original), [max(self.values)])
+
+    def test_06_rank_and_select_should_be_consistent(self):
+        """select should return the value at a position and rank the number of values up to and including it"""
+        ordered = sorted(self.values)
+        for i in (0, 1, 2999, 3000, 15000, len(ordered) - 1):
+            self.assertEqual(self.bitmap.select(i), ordered[i])
+            self.assertEqual(self.bitmap.rank(ordered[i]), i + 1)
+        self.assertEqual(self.bitmap.select(-1), ordered[-1])
+        self.assertEqual(self.bitmap.rank(ordered[0] - 1), 0)
+        self.assertEqual(self.bitmap.min(), ordered[0])
+        self.assertEqual(self.bitmap.max(), ordered[-1])
+        with self.assertRaises(IndexError):
+            self.bitmap.select(len(ordered))
+
+    def test_07_ranges_should_use_run_containers(self):
+        """Large ranges should be stored as runs and run_optimize should pick the smallest representation"""
+        bitmap = bitset.RoaringBitmap()
+        bitmap.add_range(10, 300000)
+        self.assertEqual(len(bitmap), 299990)
+        self.assertTrue(all(isinstance(c, roaring.RunContainer) for c in bitmap._containers))
+        self.assertEqual(bitmap.rank(70000), 69991)
+        self.assertEqual(bitmap.select(69990), 70000)
+        self.bitmap.run_optimize()
+        kinds = set(type(c) for c in self.bitmap._containers)
+        self.assertEqual(kinds, set([roaring.ArrayContainer, roaring.BitmapContainer, roaring.RunContainer]))
+        self.assertEqual(list(self.bitmap), sorted(self.values))
+
+    def test_08_serialization_should_round_trip(self):
+        """Serialized bitmaps, with and without run containers, should load back unchanged"""
+        for bitmap in (bitset.RoaringBitmap(), bitset.RoaringBitmap([1, 2, 70000]), self.bitmap):
+            data = bitmap.serialize()
+            self.assertEqual(bitset.RoaringBitmap.deserialize(data), bitmap)
+            bitmap.run_optimize()
+            self.assertEqual(bitset.RoaringBitmap.deserialize(bytearray(bitmap.serialize())), bitmap)
+        with self.assertRaises(ValueError):
+            bitset.RoaringBitmap.deserialize(b"\x00" * 8)
+
+    def test_09_serialized_form_should_follow_the_portable_format(self):
+        """The layout should match the Roaring format specification"""
+        data = bitset.RoaringBitmap([1, 2, 70000]).serialize()
+        # Cookie and container count, key and cardinality - 1 pairs, offsets then the sorted 16 bit values
+        self.assertEqual(data, b"\x3a\x30\x00\x00\x02\x00\x00\x00" b"\x00\x00\x01\x00\x01\x00\x00\x00"
+                               b"\x18\x00\x00\x00\x1c\x00\x00\x00" b"\x01\x00\x02\x00\x70\x11")
+        bitmap = bitset.RoaringBitmap()
+        bitmap.add_range(0, 10)
+        # Run cookie with the container count, run flags, header then the number of runs and start, length - 1 pairs
+        self.assertEqual(bitmap.serialize(), b"\x3b\x30\x00\x00\x01" b"\x00\x00\x09\x00" b"\x01\x00\x00\x00\x09\x00")
+
+    def test_10_memory_mapped_bitmaps_should_load_lazily(self):
+        """Opening a file should only decode the containers that are used"""
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "ids.roaring")
+            self.bitmap.write(path)
+            with bitset.RoaringBitmap.open(path) as mapped:
+                self.assertEqual(len(mapped), len(self.values))
+                self.assertIn(max(self.values), mapped)
+                decoded = [c for c in mapped._containers if not isinstance(c, roaring._LazyContainer)]
+                self.assertEqual(len(decoded), 1)
+                self.assertEqual(mapped.rank(max(self.values)), len(self.values))
+            self.assertEqual(mapped, self.bitmap)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=5)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+BitSet serialization unit tests
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+# Append the current and parent directories to path so we can always find the module we want to test
+map(lambda p : sys.path.append(p), [".", ".."])
+
+# noinspection PyUnresolvedReferences,PyUnresolvedReferences
+import bitset
+from bitset import serialization
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FIELDS = ['dsps', 'sip', 'users', 'full_manipulation', 'vm']
+
+class BitSetSerializationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.factory = bitset.BitSetTypeFactory()
+        self.Features = self.factory.createType('Features', FIELDS)
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'features.bst')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_01_width_should_be_the_smallest_that_fits(self):
+        """Masks should be written with the fewest bytes that hold max_val"""
+        for (count, width) in ((1, 1), (8, 1), (9, 2), (16, 2), (17, 4), (33, 8), (64, 8)):
+            bitset_type = self.factory.createType('T', ['f{0}'.format(i) for i in range(count)])
+            self.assertEqual(bitset.BitSetCodec(bitset_type).width, width)
+        with self.assertRaises(ValueError):
+            bitset.BitSetCodec(self.factory.createType('T', ['f{0}'.format(i) for i in range(65)]))
+
+    def test_02_pack_many_should_round_trip(self):
+        """BitSets and ints should unpack to the same masks"""
+        codec = bitset.BitSetCodec(self.Features)
+        values = [self.Features(5), 0, 31, self.Features(18)]
+        data = codec.pack_many(values)
+        self.assertEqual(len(data), codec.header_size + 4)
+        self.assertEqual(codec.unpack_many(data), [5, 0, 31, 18])
+        self.assertEqual(codec.unpack_many(data, as_ints=True), [5, 0, 31, 18])
+        self.assertTrue(all(type(f) is self.Features for f in codec.unpack_many(data)))
+        self.assertEqual(codec.unpack(codec.pack(self.Features(7))), self.Features(7))
+        self.assertEqual(codec.unpack_many(codec.pack_many([])), [])
+
+    def test_03_invalid_values_should_raise(self):
+        """Out of range values and BitSets of other types should not be packed"""
+        codec = bitset.BitSetCodec(self.Features)
+        with self.assertRaises(bitset.InvalidBitMaskValueError):
+            codec.pack_many([32])
+        with self.assertRaises(bitset.InvalidBitMaskValueTypeError):
+            codec.pack_many(['3'])
+        with self.assertRaises(bitset.SchemaMismatchError):
+            codec.pack(bitset.BitSet(['a', 'b']))
+
+    def test_04_the_schema_should_be_checked_on_unpack(self):
+        """Data written for other fields should be rejected, the header should describe the type"""
+        data = bitset.BitSetCodec(self.Features).pack_many([1, 2])
+        other = bitset.BitSetCodec(self.factory.createType('Other', FIELDS[::-1]))
+        with self.assertRaises(bitset.SchemaMismatchError):
+            other.unpack_many(data)
+        with self.assertRaises(ValueError):
+            other.unpack_many(b'not a bitset')
+        with self.assertRaises(ValueError):
+            bitset.BitSetCodec(self.Features).unpack_many(data[:-1])
+        with self.assertRaises(ValueError):
+            bitset.BitSetCodec(self.Features).unpack_masks(data, len(data) - 1, 2)
+        self.assertEqual(serialization.read_header(data)[:4], ('Features', FIELDS, 1, 2))
+        codec = bitset.BitSetCodec.from_header(data)
+        self.assertEqual(codec.bitset_type.keys, FIELDS)
+        self.assertEqual([f.value() for f in codec.unpack_many(data)], [1, 2])
+
+    def test_05_tables_should_be_read_from_the_mapping(self):
+        """A table file should be readable by index, slice and iteration"""
+        values = [i % 32 for i in range(10000)]
+        bitset.BitSetTable.create(self.path, self.Features, values).close()
+        with bitset.BitSetTable.open(self.path) as table:
+            self.assertEqual(len(table), 10000)
+            self.assertEqual(table[33].value(), 1)
+            self.assertEqual(table[-1].value(), 15)
+            self.assertEqual([f.value() for f in table[30:34]], [30, 31, 0, 1])
+            self.assertEqual([f.value() for f in table[0:10:3]], [0, 3, 6, 9])
+            self.assertEqual([f.value() for f in table], values)
+            self.assertEqual(table.bitset_type.keys, FIELDS)
+            with self.assertRaises(IndexError):
+                table[10000]
+            with self.assertRaises(TypeError):
+                table[0] = 1
+
+    def test_06_tables_should_be_queryable(self):
+        """where and count should match records on field states"""
+        with bitset.BitSetTable.create(self.path, self.Features, [i % 32 for i in range(10000)]) as table:
+            self.assertEqual(table.count(dsps=True), 5000)
+            self.assertEqual(table.count(sip=True, users=False), 2500)
+            self.assertEqual(list(table.where(dsps=True, sip=True, users=True, full_manipulation=True, vm=True))[:2],
+                             [31, 63])
+            with self.assertRaises(bitset.UnknownFieldError):
+                table.count(unknown=True)
+
+    def test_07_writable_tables_should_update_the_file(self):
+        """Records set through a writable table should be visible when the file is reopened"""
+        with bitset.BitSetTable.create(self.path, self.Features, size=100) as table:
+            table[10] = self.Features(9)
+            table[-1] = 4
+        with open(self.path, 'rb') as f:
+            self.assertEqual(bitset.BitSetCodec(self.Features).unpack_many(f.read(), as_ints=True)[10], 9)
+        with bitset.BitSetTable.open(self.path, self.Features, writable=True) as table:
+            self.assertEqual(table.masks(9, 11), [0, 9])
+            self.assertEqual(table[99].value(), 4)
+            with self.assertRaises(bitset.SchemaMismatchError):
+                bitset.BitSetTable.open(self.path, self.factory.createType('Other', ['a']))
+
+    @unittest.skipIf(np is None, "to_array requires numpy")
+    def test_08_tables_should_convert_to_arrays_without_copying(self):
+        """to_array should give a BitSetArray over the mapped masks"""
+        with bitset.BitSetTable.create(self.path, self.Features, [i % 32 for i in range(1000)]) as table:
+            array = table.to_array()
+            self.assertEqual(array.counts()['vm'], 496)
+            table[0] = 31
+            self.assertEqual(array[0].value(), 31)
+
+    @unittest.skipIf(np is None, "to_array requires numpy")
+    def test_09_array_views_should_outlive_their_table(self):
+        """Arrays from to_array should stay readable, and writable tables' arrays writable, once the table is closed"""
+        bitset.BitSetTable.create(self.path, self.Features, [1, 2, 3]).close()
+        table = bitset.BitSetTable.open(self.path)
+        array = table.to_array()
+        tail = array[1:]
+        table.close()
+        self.assertEqual(array.masks.tolist(), [1, 2, 3])
+        del array
+        self.assertEqual(tail.masks.tolist(), [2, 3])
+        with bitset.BitSetTable.open(self.path, writable=True) as table:
+            array = table.to_array()
+        array[0] = 31
+        del array
+        with bitset.BitSetTable.open(self.path) as table:
+            self.assertEqual(table[0].value(), 31)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=5)
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+"""
+SharedAtomicInt unit tests
+"""
+
+import os
+import sys
+import uuid
+import unittest
+import multiprocessing
+
+# Append the current and parent directories to path so we can always find the module we want to test
+map(lambda p: sys.path.append(p), [".", ".."])
+
+# noinspection PyUnresolvedReferences,PyUnresolvedReferences
+import atomic
+import shared_atomic
+
+def increment_shared(name, count):
+    counter = shared_atomic.SharedAtomicInt(name)
+    for _ in range(count):
+        atomic.increment(counter)
+    counter.close()
+
+class SharedAtomicIntTest(unittest.TestCase):
+    def setUp(self):
+        self.name = "test-{0}".format(uuid.uuid4().hex)
+
+    def tearDown(self):
+        shared_atomic.unlink(self.name)
+
+    def test_01_creating_a_shared_int_should_have_the_correct_value(self):
+        """ A new shared counter should start at the value it was created with """
+        a = shared_atomic.SharedAtomicInt(self.name, 5)
+        self.assertEquals(a.value, 5)
+        self.assertEquals(a.width, 64)
+        self.assertEquals(a.overflow, "wrap")
+
+    def test_02_attaching_by_name_should_share_the_value(self):
+        """ Counters attached to the same name should see each others updates """
+        a = shared_atomic.SharedAtomicInt(self.name, 5)
+        b = shared_atomic.SharedAtomicInt(self.name, 100)
+        self.assertEquals(b.value, 5)
+        a += 5
+        self.assertEquals(b.value, 10)
+        self.assertEquals(b.add_and_get(1), 11)
+        self.assertEquals(a.value, 11)
+        self.assertTrue(a == b)
+        self.assertEquals(a + b, 22)
+
+    def test_03_shared_int_should_support_atomic_int_operations(self):
+        """ Arithmetic, comparison and fetch and op methods should all work on a shared counter """
+        a = shared_atomic.SharedAtomicInt(self.name, 10)
+        self.assertIsInstance(a * 2, atomic.AtomicInt)
+        self.assertEquals(a * 2, 20)
+        self.assertEquals(a - 3, 7)
+        self.assertTrue(a > 5)
+        self.assertEquals(divmod(a, 3), (3, 1))
+        a <<= 2
+        self.assertEquals(a.value, 40)
+        self.assertEquals(a.fetch_add(2), 40)
+        self.assertTrue(a.compare_and_set(42, 1))
+        self.assertEquals(atomic.decrement(a), 0)
+        with self.assertRaises(TypeError):
+            a += 2.0
+
+    def test_04_updates_from_other_processes_should_not_be_lost(self):
+        """ Increments from several processes should all be counted """
+        a = shared_atomic.SharedAtomicInt(self.name)
+        processes = [multiprocessing.Process(target=increment_shared, args=(self.name, 2000)) for _ in range(4)]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+        self.assertEquals(a.value, 8000)
+
+    def test_05_overflow_should_wrap_by_default(self):
+        """ Overflowing a wrapping counter should wrap around like a C integer """
+        a = shared_atomic.SharedAtomicInt(self.name, 127, width=8)
+        self.assertEquals(atomic.increment(a), -128)
+        self.assertEquals(atomic.decrement(a), 127)
+
+    def test_06_overflow_can_raise(self):
+        """ Overflowing a raising counter should raise and leave the value unchanged """
+        a = shared_atomic.SharedAtomicInt(self.name, 32767, width=16, overflow="raise")
+        with self.assertRaises(OverflowError):
+            atomic.increment(a)
+        self.assertEquals(a.value, 32767)
+
+    def test_07_overflow_can_saturate(self):
+        """ Overflowing a saturating counter should clamp the value """
+        a = shared_atomic.SharedAtomicInt(self.name, 0, width=32, overflow="saturate")
+        a -= 2 ** 40
+        self.assertEquals(a.value, -2 ** 31)
+
+    def test_08_attaching_with_a_different_width_should_raise(self):
+        """ Attaching with a width or overflow different to the existing counter should raise """
+        a = shared_atomic.SharedAtomicInt(self.name, width=32)
+        with self.assertRaises(ValueError):
+            shared_atomic.SharedAtomicInt(self.name, width=64)
+        with self.assertRaises(ValueError):
+            shared_atomic.SharedAtomicInt(self.name, overflow="raise")
+        a.close()
+        with self.assertRaises(ValueError):
+            shared_atomic.SharedAtomicInt(self.name, width=64)
+
+    def test_09_invalid_settings_should_raise(self):
+        """ Invalid names, widths and overflow modes should raise """
+        with self.assertRaises(ValueError):
+            shared_atomic.SharedAtomicInt("a/b")
+        with self.assertRaises(ValueError):
+            shared_atomic.SharedAtomicInt(self.name, width=24)
+        with self.assertRaises(ValueError):
+            shared_atomic.SharedAtomicInt(self.name, overflow="ignore")
+
+    def test_10_unlinking_should_remove_the_counter(self):
+        """ After unlinking the name refers to a new counter """
+        with shared_atomic.SharedAtomicInt(self.name, 5) as a:
+            a.unlink()
+        self.assertFalse(os.path.exists(shared_atomic.segment_path(self.name)))
+        self.assertEquals(shared_atomic.SharedAtomicInt(self.name).value, 0)
+
+    def test_11_unlinking_should_detach_new_counters_from_the_old_one(self):
+        """ Attaching after an unlink should create a new counter even while the old one is still open """
+        a = shared_atomic.SharedAtomicInt(self.name, 5)
+        a.unlink()
+        b = shared_atomic.SharedAtomicInt(self.name, 7)
+        self.assertEquals(a.value, 5)
+        self.assertEquals(b.value, 7)
+        a.close()
+        self.assertEquals(shared_atomic.SharedAtomicInt(self.name).value, 7)
+
+if __name__ == "__main__":
+    unittest.main(verbosity=5)
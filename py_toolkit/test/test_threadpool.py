@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+ThreadPool unit tests
+"""
+import sys
+import time
+import random
+import threading
+import unittest
+
+# Append the current and parent directories to path so we can always find the module we want to test
+map(lambda p : sys.path.append(p), [".", ".."])
+
+# noinspection PyUnresolvedReferences,PyUnresolvedReferences
+import threadpool
+
+class ThreadPoolTest(unittest.TestCase):
+
+    def test_01_enqueued_tasks_should_all_run(self):
+        """Every enqueued task should have run once join returns"""
+        pool = threadpool.ThreadPool(4)
+        results = []
+        lock = threading.Lock()
+        def task(i):
+            with lock:
+                results.append(i)
+        pool.map(task, range(100))
+        pool.join()
+        self.assertEqual(sorted(results), range(100))
+
+    def test_02_keyed_tasks_should_run_in_order_per_key(self):
+        """Tasks enqueued with the same key should run in the order they were enqueued"""
+        pool = threadpool.ThreadPool(4)
+        results = {}
+        def task(key, i):
+            time.sleep(random.random() / 1000.0)
+            results.setdefault(key, []).append(i)
+        for i in range(50):
+            for key in ("a", "b", "c", "d", "e"):
+                pool.enqueue_keyed(key, task, key, i)
+        pool.join()
+        for key in ("a", "b", "c", "d", "e"):
+            self.assertEqual(results[key], range(50))
+
+    def test_03_keyed_tasks_should_not_overlap_per_key(self):
+        """Only one task for a given key should be running at any time"""
+        pool = threadpool.ThreadPool(4)
+        running = {}
+        overlaps = []
+        def task(key):
+            if running.get(key):
+                overlaps.append(key)
+            running[key] = True
+            time.sleep(0.001)
+            running[key] = False
+        for i in range(20):
+            for key in ("a", "b"):
+                pool.enqueue_keyed(key, task, key)
+        pool.join()
+        self.assertEqual(overlaps, [])
+
+    def test_04_different_keys_should_run_in_parallel(self):
+        """Tasks with different keys should be spread across the workers"""
+        pool = threadpool.ThreadPool(2)
+        barrier = threading.Event()
+        seen = []
+        def first():
+            barrier.wait(5)
+            seen.append("first")
+        def second():
+            seen.append("second")
+            barrier.set()
+        pool.enqueue_keyed("a", first)
+        pool.enqueue_keyed("b", second)
+        pool.join()
+        self.assertEqual(seen, ["second", "first"])
+
+    def test_05_key_backlog_should_be_removed_when_empty(self):
+        """Per key queues should be discarded once they have drained"""
+        pool = threadpool.ThreadPool(2)
+        for i in range(10):
+            pool.enqueue_keyed(i % 3, lambda: None)
+        pool.join()
+        self.assertEqual(pool.keyed_tasks, {})
+
+    def test_06_a_failing_keyed_task_should_not_block_the_key(self):
+        """An exception in a keyed task should not stop later tasks for the same key"""
+        pool = threadpool.ThreadPool(2)
+        results = []
+        def fail():
+            raise ValueError("Expected failure")
+        pool.enqueue_keyed("a", fail)
+        pool.enqueue_keyed("a", results.append, 1)
+        pool.join()
+        self.assertEqual(results, [1])
+
+    def test_07_shutdown_should_stop_the_workers(self):
+        """Shutting down should run the queued tasks and then stop every worker"""
+        pool = threadpool.ThreadPool(4)
+        results = []
+        pool.map(results.append, range(10))
+        pool.shutdown(wait=True)
+        self.assertEqual(sorted(results), range(10))
+        self.assertFalse(any(worker.is_alive() for worker in pool.workers))
+
+    def test_08_enqueueing_after_shutdown_should_raise(self):
+        """A pool that has been shut down should reject new tasks"""
+        pool = threadpool.ThreadPool(1)
+        pool.shutdown()
+        with self.assertRaises(RuntimeError):
+            pool.enqueue(lambda: None)
+        with self.assertRaises(RuntimeError):
+            pool.enqueue_keyed("a", lambda: None)
+
+    def test_09_shutdown_can_cancel_pending_tasks(self):
+        """Shutting down with cancel_pending should drop the tasks that haven't started"""
+        pool = threadpool.ThreadPool(2)
+        started, release = threading.Semaphore(0), threading.Event()
+        def block():
+            started.release()
+            release.wait(5)
+        results = []
+        pool.enqueue(block)
+        pool.enqueue(block)
+        started.acquire()
+        started.acquire()
+        queued = pool.enqueue(results.append, 1)
+        keyed = [pool.enqueue_keyed("a", results.append, i) for i in range(3)]
+        threading.Timer(0.1, release.set).start()
+        pool.shutdown(wait=True, cancel_pending=True)
+        self.assertEqual(results, [])
+        self.assertTrue(queued.cancelled)
+        self.assertTrue(all(task.cancelled for task in keyed))
+
+    def test_10_a_cancelled_task_should_not_run(self):
+        """Cancelling a queued task should stop it running"""
+        pool = threadpool.ThreadPool(1)
+        started, release = threading.Event(), threading.Event()
+        def block():
+            started.set()
+            release.wait(5)
+        results = []
+        running = pool.enqueue(block)
+        started.wait(5)
+        task = pool.enqueue(results.append, 1)
+        self.assertTrue(task.cancel())
+        self.assertFalse(running.cancel())
+        release.set()
+        pool.join()
+        self.assertEqual(results, [])
+        self.assertTrue(task.done)
+        pool.shutdown()
+
+    def test_11_context_manager_should_shutdown_the_pool(self):
+        """Leaving a with block should wait for the tasks and stop the workers"""
+        results = []
+        with threadpool.ThreadPool(2) as pool:
+            for i in range(5):
+                pool.enqueue_keyed("a", results.append, i)
+        self.assertEqual(results, range(5))
+        self.assertFalse(any(worker.is_alive() for worker in pool.workers))
+
+    def test_12_repeatedly_creating_pools_should_not_leak_threads(self):
+        """Short lived pools should not increase the number of running threads"""
+        before = threading.active_count()
+        for _ in range(20):
+            with threadpool.ThreadPool(4) as pool:
+                pool.map(lambda x: x, range(4))
+        self.assertEqual(threading.active_count(), before)
+
+    def test_13_a_keyed_backlog_should_run_when_shutdown_races_its_requeue(self):
+        """A graceful shutdown starting while a key is handed back to the pool should still run its backlog"""
+        pool = threadpool.ThreadPool(2)
+        results = []
+        put_nowait = pool.tasks.put_nowait
+        shutdowns, puts = [], []
+        def racing_put_nowait(item):
+            puts.append(item)
+            # The first put queues the key, the second hands it back to the pool after its first task
+            if len(puts) == 2:
+                # Start a shutdown just as the key is requeued, give it time to post its sentinels if it can
+                shutdowns.append(threading.Thread(target=pool.shutdown, kwargs={"wait": True}))
+                shutdowns[0].start()
+                time.sleep(0.1)
+            put_nowait(item)
+        pool.tasks.put_nowait = racing_put_nowait
+        release = threading.Event()
+        pool.enqueue_keyed("a", release.wait, 5)
+        tasks = [pool.enqueue_keyed("a", results.append, i) for i in range(3)]
+        release.set()
+        for _ in range(500):
+            if shutdowns:
+                break
+            time.sleep(0.01)
+        shutdowns[0].join(5)
+        self.assertEqual(results, [0, 1, 2])
+        self.assertFalse(any(task.cancelled for task in tasks))
+
+    def test_14_draining_regular_threads_on_exit_should_be_rejected(self):
+        """drain_on_exit should require daemon workers, regular threads are waited for before exit hooks run"""
+        with self.assertRaises(ValueError):
+            threadpool.ThreadPool(1, daemon=False, drain_on_exit=True)
+
+    def test_15_enqueue_blocked_during_shutdown_should_raise(self):
+        """An enqueue waiting for room when the pool shuts down should raise, rather than queue behind the sentinels"""
+        pool = threadpool.ThreadPool(1)
+        started, release = threading.Event(), threading.Event()
+        def block():
+            started.set()
+            release.wait(5)
+        pool.enqueue(block)
+        started.wait(5)
+        queued = pool.enqueue(lambda: None)
+        errors = []
+        def enqueue():
+            try:
+                pool.enqueue(lambda: None)
+            except RuntimeError as e:
+                errors.append(e)
+        blocked = threading.Thread(target=enqueue)
+        blocked.start()
+        time.sleep(0.05)
+        pool.shutdown(wait=False)
+        release.set()
+        blocked.join(5)
+        self.assertFalse(blocked.is_alive())
+        self.assertEqual(len(errors), 1)
+        pool.shutdown(wait=True)
+        self.assertEqual(queued.state, threadpool.Task.DONE)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=5)
@@ -1,28 +1,122 @@
 # -*- coding: utf-8 -*-
 
+"""
+Provide a simple pool of worker threads consuming tasks from a bounded queue.
+
+    pool = ThreadPool(4, label="Downloads")
+    task = pool.enqueue(fetch, url)
+    task.cancel()
+    pool.join()
+    pool.shutdown()
+
+Tasks can be cancelled up until a worker picks them up. Pools should be shut down once they are no longer needed, which
+stops their workers, or used as a context manager which shuts them down on exit after the remaining tasks have run.
+
+Workers are daemon threads by default, so anything still queued when the interpreter exits is dropped. Pass
+drain_on_exit=True to have the pool finish its queued work at exit instead, or daemon=False to use regular threads,
+in which case the interpreter will wait for the pool to be shut down before exiting. The two can't be combined, the
+interpreter waits for regular threads before running the exit hook that would drain the pool, so it would never exit.
+"""
+
 import sys
+import atexit
 import logging
+import weakref
 import threading
+import collections
+
+import metrics
+from suppress import suppress
 
 if sys.version_info.major < 3:
-    from Queue import Queue
+    from Queue import Queue, Empty, Full
 else:
-    from queue import Queue
+    from queue import Queue, Empty, Full
+
+# Guards the state transitions of every Task, it's only held for an attribute check and assignment
+_task_lock = threading.Lock()
+
+# Pools that should have their queued work finished before the interpreter exits
+_exit_pools = weakref.WeakSet()
+
+class Task(object):
+    """ A queued call, which can be cancelled up until a worker starts running it """
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    CANCELLED = "CANCELLED"
+
+    __slots__ = ("func", "args", "kwargs", "state")
+
+    # Whether the workers count the task in py_toolkit_threadpool_tasks_total
+    counted = True
+
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.state = Task.PENDING
+
+    def cancel(self):
+        """
+        Prevent the task from running, returns False if it is already running or has finished
+        """
+        with _task_lock:
+            if self.state == Task.PENDING:
+                self.state = Task.CANCELLED
+            return self.state == Task.CANCELLED
+
+    @property
+    def cancelled(self):
+        return self.state == Task.CANCELLED
+
+    @property
+    def done(self):
+        return self.state in (Task.DONE, Task.CANCELLED)
+
+    def run(self):
+        """ Run the task unless it has been cancelled or already run, returning whether it ran """
+        with _task_lock:
+            if self.state != Task.PENDING:
+                return False
+            self.state = Task.RUNNING
+        try:
+            self.func(*self.args, **self.kwargs)
+        finally:
+            self.state = Task.DONE
+        return True
+
+class _KeyedDispatch(Task):
+    """ Internal task running a key's backlog, the tasks of the backlog are counted as they run instead """
+    __slots__ = ()
+    counted = False
+
+class TaskQueue(Queue):
+    """ Bounded task queue that lets shutdown sentinels past the size limit, so posting them never blocks """
+    def put_sentinel(self):
+        with self.mutex:
+            self._put(None)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
 
 class Worker(threading.Thread):
-    """ Thread executing tasks from a given tasks queue """
-    def __init__(self, tasks, _id, label=None):
+    """ Thread executing tasks from a given tasks queue until it receives a None sentinel """
+    def __init__(self, tasks, _id, label=None, daemon=True, completed=None):
         threading.Thread.__init__(self)
         self.name = "{1}Worker-{0}".format(_id, "{0}-".format(label) if label else "")
         self.tasks = tasks
-        self.daemon = True
+        self.daemon = daemon
+        self.completed = completed
         self.start()
 
     def run(self):
         while True:
-            func, args, kwargs = self.tasks.get()
+            task = self.tasks.get()
             try:
-                func(*args, **kwargs)
+                if task is None:
+                    break
+                if task.run() and task.counted and self.completed is not None:
+                    self.completed.inc()
             except Exception as e:
                 # An exception happened in this thread
                 logging.exception(e)
@@ -30,23 +124,184 @@ class Worker(threading.Thread):
                 # Mark this task as done, whether an exception happened or not
                 self.tasks.task_done()
 
-class ThreadPool:
+class ThreadPool(object):
     """ Pool of threads consuming tasks from a queue """
 
-    def __init__(self, num_threads, label=None):
-        self.tasks = Queue(num_threads)
-        for i in range(num_threads):
-            Worker(self.tasks, i, label=label)
+    def __init__(self, num_threads, label=None, daemon=True, drain_on_exit=False):
+        """
+        Create a pool and start its workers
+        :param num_threads: Number of workers, also the number of tasks that can be queued before enqueue blocks
+        :param label: Prefix for the worker thread names
+        :param daemon: Run the workers as daemon threads, if False the pool must be shut down for the interpreter to exit
+        :param drain_on_exit: Run anything still queued when the interpreter exits, rather than dropping it, requires
+        daemon workers
+        """
+        if drain_on_exit and not daemon:
+            raise ValueError("drain_on_exit requires daemon workers, a pool of regular threads must be shut down "
+                             "before the interpreter can exit")
+        self.tasks = TaskQueue(num_threads)
+        self.keyed_tasks = {}
+        self.keyed_lock = threading.Lock()
+        self.shutdown_lock = threading.Lock()
+        self.is_shutdown = False
+        labels = {"pool": label or "ThreadPool"}
+        metrics.registry.gauge("py_toolkit_threadpool_queue_depth", "Tasks waiting for a worker", labels,
+                               owner=self).track(self, lambda pool: pool.tasks.qsize())
+        self.completed = metrics.registry.counter("py_toolkit_threadpool_tasks_total", "Tasks run by the workers",
+                                                  labels, owner=self)
+        self.workers = [Worker(self.tasks, i, label=label, daemon=daemon, completed=self.completed)
+                        for i in range(num_threads)]
+        if drain_on_exit:
+            _exit_pools.add(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown(wait=True)
 
     def enqueue(self, func, *args, **kwargs):
-        """ Add a task to the queue """
-        self.tasks.put((func, args, kwargs))
+        """ Add a task to the queue, returning the Task so it can be cancelled """
+        task = Task(func, args, kwargs)
+        self._put(task)
+        return task
+
+    def _put(self, task):
+        """
+        Queue task, blocking while the queue is full. The shutdown check and the put happen under shutdown_lock, so a
+        concurrent shutdown can't post its sentinels in between and leave the task behind them, never to run
+        """
+        tasks = self.tasks
+        while True:
+            with self.shutdown_lock:
+                if self.is_shutdown:
+                    raise RuntimeError("Cannot enqueue tasks on a ThreadPool that has been shut down")
+                try:
+                    tasks.put_nowait(task)
+                    return
+                except Full:
+                    pass
+            # Wait for room without holding shutdown_lock, shutdown wakes every waiter so they can give up
+            with tasks.not_full:
+                while tasks._qsize() >= tasks.maxsize and not self.is_shutdown:
+                    tasks.not_full.wait()
+
+    def enqueue_keyed(self, key, func, *args, **kwargs):
+        """
+        Add a task to the queue that will run after every task previously enqueued with the same key has completed.
+        Tasks for different keys still run in parallel across the workers, a key only ever occupies one worker at a
+        time and its backlog is dropped as soon as it is empty.
+        :param key: Any hashable value identifying the sequence the task belongs to
+        :param func: Callable to execute
+        :return: The Task, so it can be cancelled
+        """
+        if self.is_shutdown:
+            raise RuntimeError("Cannot enqueue tasks on a ThreadPool that has been shut down")
+        task = Task(func, args, kwargs)
+        with self.keyed_lock:
+            pending = self.keyed_tasks.get(key)
+            if pending is not None:
+                # Something is already running for this key, it will pick this task up when it's done
+                pending.append(task)
+                return task
+            self.keyed_tasks[key] = collections.deque([task])
+        try:
+            self._put(_KeyedDispatch(self._run_keyed, (key,), {}))
+        except RuntimeError:
+            # Shut down meanwhile, nothing will run the backlog, including tasks other threads have added to it
+            with self.keyed_lock:
+                for pending_task in self.keyed_tasks.pop(key, ()):
+                    pending_task.cancel()
+            raise
+        return task
+
+    def _run_keyed(self, key):
+        while True:
+            with self.keyed_lock:
+                pending = self.keyed_tasks.get(key)
+                if not pending:
+                    self.keyed_tasks.pop(key, None)
+                    return
+                task = pending.popleft()
+            try:
+                if task.run():
+                    self.completed.inc()
+            except Exception as e:
+                logging.exception(e)
+            with self.keyed_lock:
+                if not pending:
+                    self.keyed_tasks.pop(key, None)
+                    return
+            # Hand the key back to the pool so other keys get a fair share of the workers, if the queue is full we
+            # can't block here without risking every worker waiting on its own put, so just run the next one inline.
+            # The check and the put happen under shutdown_lock so a concurrent shutdown can't post its sentinels in
+            # between, once it has started the workers are stopping, so finish the backlog here rather than queueing
+            # behind the sentinels
+            with self.shutdown_lock:
+                if self.is_shutdown:
+                    continue
+                try:
+                    self.tasks.put_nowait(_KeyedDispatch(self._run_keyed, (key,), {}))
+                    return
+                except Full:
+                    pass
 
     def map(self, func, args_list):
-        """ Add a list of tasks to the queue """
-        for args in args_list:
-            self.enqueue(func, args)
+        """ Add a list of tasks to the queue, returning the Tasks """
+        return [self.enqueue(func, args) for args in args_list]
 
     def join(self):
         """ Wait for completion of all the tasks in the queue """
         self.tasks.join()
+
+    def shutdown(self, wait=True, cancel_pending=False):
+        """
+        Stop the pool, no new tasks can be enqueued once this has been called. Workers finish the tasks already queued
+        unless cancel_pending is set, and then exit. Calling it more than once is harmless.
+        :param wait: Block until every worker has exited
+        :param cancel_pending: Cancel every task that hasn't started yet
+        """
+        with self.shutdown_lock:
+            first_call = not self.is_shutdown
+            self.is_shutdown = True
+        # Wake any enqueue waiting for room, so it raises rather than waiting on workers that are stopping
+        with self.tasks.not_full:
+            self.tasks.not_full.notify_all()
+        if cancel_pending:
+            self._cancel_pending()
+        if first_call:
+            for _ in self.workers:
+                self.tasks.put_sentinel()
+            # Drop the pool's metrics unless another live pool shares its label
+            metrics.registry.release(self)
+        if wait:
+            current = threading.current_thread()
+            for worker in self.workers:
+                if worker is not current:
+                    worker.join()
+            # Cancel anything still left once the workers have gone, so no Task returned by enqueue stays pending
+            self._cancel_pending()
+
+    def _cancel_pending(self):
+        with self.keyed_lock:
+            for pending in self.keyed_tasks.values():
+                for task in pending:
+                    task.cancel()
+                pending.clear()
+        sentinels = 0
+        with suppress(Empty):
+            while True:
+                task = self.tasks.get_nowait()
+                if task is None:
+                    sentinels += 1
+                else:
+                    task.cancel()
+                self.tasks.task_done()
+        for _ in range(sentinels):
+            self.tasks.put_sentinel()
+
+def _drain_pools_on_exit():
+    for pool in list(_exit_pools):
+        pool.shutdown(wait=True)
+
+atexit.register(_drain_pools_on_exit)